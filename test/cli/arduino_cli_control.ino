@@ -12,6 +12,14 @@
  *   ir - Read IR sensors
  *   ultra - Read ultrasonic sensor
  *   status - Show all sensor readings
+ *   binary <on/off> - Send sensor readings as binary packets instead of text
+ *   sub <color/ir/ultra> <hz> - Stream a sensor continuously (hz: 0-100, 0 = off)
+ *   unsub - Stop all streams
+ *
+ * Binary packets (10 bytes, little endian):
+ *   0xA5 | sensor id | seq | value a (u16) | value b (u16) | value c (u16) | checksum
+ *   sensor id 1 = color (R, G, B), 2 = IR (IR1, IR2), 3 = ultrasonic (cm * 100, out of range)
+ *   checksum = XOR of the 8 bytes between sync and checksum
  */
 
 #include <Servo.h>
@@ -48,9 +56,28 @@
 Servo servo1;
 Servo servo2;
 
+// Binary telemetry
+#define PACKET_SYNC 0xA5
+#define PACKET_SIZE 10
+#define SENSOR_COLOR 1
+#define SENSOR_IR 2
+#define SENSOR_ULTRASONIC 3
+
+// Streaming subscriptions
+#define STREAM_COLOR 0
+#define STREAM_IR 1
+#define STREAM_ULTRA 2
+#define STREAM_COUNT 3
+#define MAX_STREAM_HZ 100
+#define ECHO_TIMEOUT_US 30000
+
 // Variables
 String inputString = "";
 boolean stringComplete = false;
+boolean binaryMode = false;
+byte packetSeq = 0;
+unsigned long streamPeriod[STREAM_COUNT] = {0, 0, 0};  // ms between samples, 0 = off
+unsigned long streamLast[STREAM_COUNT] = {0, 0, 0};
 
 void setup() {
   Serial.begin(9600);
@@ -114,13 +141,20 @@ void loop() {
     stringComplete = false;
     Serial.print("> ");
   }
+  
+  serviceStreams();
 }
 
 void serialEvent() {
-  while (Serial.available()) {
+  // Stop at the end of a line so pipelined commands stay in the RX buffer
+  // until the current one has been processed
+  while (Serial.available() && !stringComplete) {
     char inChar = (char)Serial.read();
     if (inChar == '\n' || inChar == '\r') {
-      stringComplete = true;
+      // Skip the '\n' of a "\r\n" pair instead of treating it as an empty command
+      if (inputString.length() > 0) {
+        stringComplete = true;
+      }
     } else {
       inputString += inChar;
     }
@@ -157,6 +191,18 @@ void processCommand(String cmd) {
   else if (cmd == "status") {
     showAllStatus();
   }
+  else if (cmd.startsWith("binary")) {
+    setBinaryMode(cmd);
+  }
+  else if (cmd.startsWith("sub ")) {
+    subscribe(cmd);
+  }
+  else if (cmd == "unsub") {
+    for (int i = 0; i < STREAM_COUNT; i++) {
+      streamPeriod[i] = 0;
+    }
+    Serial.println("All subscriptions stopped");
+  }
   else {
     Serial.println("Unknown command. Type 'help' for available commands.");
   }
@@ -177,28 +223,137 @@ void printHelp() {
   Serial.println("  ir                        - Read IR sensors");
   Serial.println("  ultra                     - Read ultrasonic distance");
   Serial.println("  status                    - Show all sensor readings");
+  Serial.println("  binary <on/off>           - Binary sensor packets instead of text");
+  Serial.println("  sub <color/ir/ultra> <hz> - Stream a sensor (hz: 0-100, 0 = off)");
+  Serial.println("  unsub                     - Stop all streams");
 }
 
-void readColorSensor() {
-  Serial.println("Reading Color Sensor...");
+void subscribe(String cmd) {
+  // Parse: sub <color/ir/ultra> <hz>
+  int firstSpace = cmd.indexOf(' ');
+  int secondSpace = cmd.indexOf(' ', firstSpace + 1);
+  
+  if (secondSpace == -1) {
+    Serial.println("Error: Format is 'sub <color/ir/ultra> <hz>'");
+    return;
+  }
+  
+  String sensor = cmd.substring(firstSpace + 1, secondSpace);
+  int hz = cmd.substring(secondSpace + 1).toInt();
+  
+  if (hz < 0 || hz > MAX_STREAM_HZ) {
+    Serial.println("Error: Rate must be 0-100 Hz");
+    return;
+  }
+  
+  int stream;
+  if (sensor == "color") {
+    stream = STREAM_COLOR;
+  } else if (sensor == "ir") {
+    stream = STREAM_IR;
+  } else if (sensor == "ultra") {
+    stream = STREAM_ULTRA;
+  } else {
+    Serial.println("Error: Sensor must be color, ir or ultra");
+    return;
+  }
   
+  streamPeriod[stream] = hz > 0 ? 1000 / hz : 0;
+  streamLast[stream] = millis();
+  if (hz > 0) {
+    Serial.print("Subscribed ");
+    Serial.print(sensor);
+    Serial.print(" at ");
+    Serial.print(hz);
+    Serial.println(" Hz");
+  } else {
+    Serial.print("Unsubscribed ");
+    Serial.println(sensor);
+  }
+}
+
+void serviceStreams() {
+  // Send each subscribed sensor when its period has elapsed; no banners,
+  // settle delays or prompts, so the link carries only readings
+  unsigned long now = millis();
+  for (int i = 0; i < STREAM_COUNT; i++) {
+    if (streamPeriod[i] > 0 && now - streamLast[i] >= streamPeriod[i]) {
+      streamLast[i] = now;
+      if (i == STREAM_COLOR) {
+        sendColor(0);
+      } else if (i == STREAM_IR) {
+        sendIR();
+      } else {
+        sendDistance(ECHO_TIMEOUT_US);
+      }
+    }
+  }
+}
+
+void setBinaryMode(String cmd) {
+  if (cmd == "binary on") {
+    binaryMode = true;
+    Serial.println("Binary mode ON");
+  }
+  else if (cmd == "binary off") {
+    binaryMode = false;
+    Serial.println("Binary mode OFF");
+  }
+  else {
+    Serial.println("Error: Format is 'binary <on/off>'");
+  }
+}
+
+void sendPacket(byte sensorId, unsigned int a, unsigned int b, unsigned int c) {
+  byte packet[PACKET_SIZE];
+  packet[0] = PACKET_SYNC;
+  packet[1] = sensorId;
+  packet[2] = packetSeq++;
+  packet[3] = a & 0xFF;
+  packet[4] = a >> 8;
+  packet[5] = b & 0xFF;
+  packet[6] = b >> 8;
+  packet[7] = c & 0xFF;
+  packet[8] = c >> 8;
+  
+  byte checksum = 0;
+  for (int i = 1; i < PACKET_SIZE - 1; i++) {
+    checksum ^= packet[i];
+  }
+  packet[PACKET_SIZE - 1] = checksum;
+  Serial.write(packet, PACKET_SIZE);
+}
+
+void readColorSensor() {
+  if (!binaryMode) {
+    Serial.println("Reading Color Sensor...");
+  }
+  sendColor(50);
+}
+
+void sendColor(int settleMs) {
   // Read RED
   digitalWrite(S2, LOW);
   digitalWrite(S3, LOW);
   int red = pulseIn(SENSOR_OUT, LOW);
-  delay(50);
+  delay(settleMs);
   
   // Read GREEN
   digitalWrite(S2, HIGH);
   digitalWrite(S3, HIGH);
   int green = pulseIn(SENSOR_OUT, LOW);
-  delay(50);
+  delay(settleMs);
   
   // Read BLUE
   digitalWrite(S2, LOW);
   digitalWrite(S3, HIGH);
   int blue = pulseIn(SENSOR_OUT, LOW);
   
+  if (binaryMode) {
+    sendPacket(SENSOR_COLOR, red, green, blue);
+    return;
+  }
+  
   Serial.print("  R: ");
   Serial.print(red);
   Serial.print("  G: ");
@@ -349,10 +504,21 @@ void controlServo(String cmd) {
 }
 
 void readIRSensors() {
-  Serial.println("IR Sensor Readings:");
+  if (!binaryMode) {
+    Serial.println("IR Sensor Readings:");
+  }
+  sendIR();
+}
+
+void sendIR() {
   int ir1 = digitalRead(IR1_PIN);
   int ir2 = digitalRead(IR2_PIN);
   
+  if (binaryMode) {
+    sendPacket(SENSOR_IR, ir1, ir2, 0);
+    return;
+  }
+  
   Serial.print("  IR1: ");
   Serial.print(ir1);
   Serial.println(ir1 == LOW ? " [DETECTED]" : " [CLEAR]");
@@ -363,16 +529,27 @@ void readIRSensors() {
 }
 
 void readUltrasonic() {
+  sendDistance(0);
+}
+
+void sendDistance(unsigned long timeoutUs) {
   digitalWrite(TRIG_PIN, LOW);
   delayMicroseconds(2);
   digitalWrite(TRIG_PIN, HIGH);
   delayMicroseconds(10);
   digitalWrite(TRIG_PIN, LOW);
   
-  long duration = pulseIn(ECHO_PIN, HIGH);
+  // timeoutUs = 0 keeps pulseIn's default one-second timeout
+  long duration = timeoutUs > 0 ? pulseIn(ECHO_PIN, HIGH, timeoutUs) : pulseIn(ECHO_PIN, HIGH);
   float distanceCm = duration * 0.0343 / 2;
   float distanceInch = distanceCm / 2.54;
   
+  if (binaryMode) {
+    boolean outOfRange = distanceCm > 400 || distanceCm < 2;
+    sendPacket(SENSOR_ULTRASONIC, (unsigned int)min(distanceCm * 100, 65535.0), outOfRange, 0);
+    return;
+  }
+  
   Serial.print("Distance: ");
   Serial.print(distanceCm);
   Serial.print(" cm  (");
@@ -385,6 +562,13 @@ void readUltrasonic() {
 }
 
 void showAllStatus() {
+  if (binaryMode) {
+    readColorSensor();
+    readIRSensors();
+    readUltrasonic();
+    return;
+  }
+  
   Serial.println("========== SYSTEM STATUS ==========");
   Serial.println();
   
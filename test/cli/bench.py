@@ -0,0 +1,494 @@
+"""
+Benchmark suite for the CLI controller
+Runs against local fake devices on ptys (transport.py) and reports, as JSON:
+    parse    - TextParser, decode+parse and full controller ingest
+               (process_serial_data) throughput over captured logs
+    reader   - reader-thread lines/sec and CPU while a device streams at full speed
+    latency  - command round trip from send_command() to the acknowledgement line
+    frames   - dashboard frame time at several terminal sizes, and the fleet
+               grid with many boards
+    fleet    - asyncio fleet controller: event-loop CPU, loop lag and command
+               round trip as the number of streaming boards grows
+
+Usage:
+    python bench.py [capture.log ...] [--only parse,latency] [--json results.json]
+
+Without log files a synthetic capture in the sketch's exact output format is
+used. JSON goes to stdout (or --json FILE), a readable summary to stderr.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from cli import ArduinoTerminalController, Dashboard
+from fleet import Fleet
+from streaming import DEFAULT_RATES
+from telemetry import StreamDecoder, TextParser, Reply
+
+CHUNK_SIZE = 4096
+
+
+def synthetic_capture(bursts=2000, seed=1):
+    """Build a byte log of `status` bursts, command replies and prompts"""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(bursts):
+        r, g, b = rng.randint(20, 300), rng.randint(20, 300), rng.randint(20, 300)
+        ir1, ir2 = rng.randint(0, 1), rng.randint(0, 1)
+        cm = rng.uniform(1.0, 450.0)
+        out.append("> ========== SYSTEM STATUS ==========\r\n\r\n")
+        out.append("COLOR SENSOR:\r\nReading Color Sensor...\r\n")
+        out.append(f"  R: {r}  G: {g}  B: {b}\r\n\r\n")
+        out.append("IR SENSORS:\r\nIR Sensor Readings:\r\n")
+        out.append(f"  IR1: {ir1}{' [DETECTED]' if ir1 == 0 else ' [CLEAR]'}\r\n")
+        out.append(f"  IR2: {ir2}{' [DETECTED]' if ir2 == 0 else ' [CLEAR]'}\r\n\r\n")
+        out.append("ULTRASONIC SENSOR:\r\n")
+        out.append(f"Distance: {cm:.2f} cm  ({cm / 2.54:.2f} inches)\r\n")
+        if cm > 400 or cm < 2:
+            out.append("  Warning: Out of range (2-400 cm)\r\n")
+        out.append("\r\n===================================\r\n")
+        out.append(f"> Servo 1 set to {rng.randint(0, 180)} degrees\r\n")
+    return "".join(out).encode()
+
+
+def bench_parser(data, repeat=3):
+    """Time TextParser alone, decode+parse, and decode+process_serial_data over `data`
+
+    The last one is what the reader thread runs per chunk: parsing plus
+    apply_reading() (histories, filters, color classifier, snapshots).
+    """
+    lines = [line.strip() for line in StreamDecoder().feed(data) if isinstance(line, str)]
+    lines = [line for line in lines if line]
+
+    parse_best = float('inf')
+    for _ in range(repeat):
+        parser = TextParser()
+        parse = parser.parse
+        start = time.perf_counter()
+        for line in lines:
+            parse(line)
+        parse_best = min(parse_best, time.perf_counter() - start)
+
+    ingest_best = float('inf')
+    for _ in range(repeat):
+        decoder = StreamDecoder()
+        ingest_parser = TextParser()
+        start = time.perf_counter()
+        for offset in range(0, len(data), CHUNK_SIZE):
+            for event in decoder.feed(data[offset:offset + CHUNK_SIZE]):
+                if isinstance(event, str):
+                    ingest_parser.parse(event)
+        ingest_best = min(ingest_best, time.perf_counter() - start)
+
+    controller_best = float('inf')
+    for _ in range(repeat):
+        # Never connected, so nothing is recorded, published or sent
+        controller = ArduinoTerminalController()
+        decoder = StreamDecoder()
+        process, apply = controller.process_serial_data, controller.apply_reading
+        start = time.perf_counter()
+        for offset in range(0, len(data), CHUNK_SIZE):
+            for event in decoder.feed(data[offset:offset + CHUNK_SIZE]):
+                if isinstance(event, str):
+                    line = event.strip()
+                    if line:
+                        process(line)
+                else:
+                    apply(event)
+        controller_best = min(controller_best, time.perf_counter() - start)
+
+    return {
+        'lines': len(lines),
+        'bytes': len(data),
+        'parse_lines_per_sec': len(lines) / parse_best if parse_best else 0.0,
+        'ingest_lines_per_sec': len(lines) / ingest_best if ingest_best else 0.0,
+        'ingest_mb_per_sec': len(data) / ingest_best / 1e6 if ingest_best else 0.0,
+        'controller_lines_per_sec': len(lines) / controller_best if controller_best else 0.0,
+        'records': dict(parser.counts),
+        'failures': dict(parser.failures),
+    }
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """Summarize a list of seconds as milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {f"p{p}_ms": ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))] * 1000
+              for p in points}
+    result['max_ms'] = ordered[-1] * 1000
+    result['mean_ms'] = sum(ordered) / len(ordered) * 1000
+    return result
+
+
+def thread_cpu_seconds(thread):
+    """CPU time used by a thread (Linux only; None elsewhere)"""
+    try:
+        with open(f"/proc/self/task/{thread.native_id}/stat") as fh:
+            fields = fh.read().rsplit(')', 1)[1].split()
+    except (OSError, AttributeError):
+        return None
+    # utime and stime are fields 14 and 15 of the full stat line
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class BenchController(ArduinoTerminalController):
+    """Controller with hooks for counting lines and catching replies"""
+    def __init__(self):
+        super().__init__()
+        self.lines = 0
+        self.first_line_at = None
+        self.last_line_at = None
+        self.reply_event = threading.Event()
+        self.reply_at = None
+
+    def process_serial_data(self, line):
+        now = time.perf_counter()
+        if self.first_line_at is None:
+            self.first_line_at = now
+        self.last_line_at = now
+        self.lines += 1
+        super().process_serial_data(line)
+
+    def apply_reading(self, reading):
+        super().apply_reading(reading)
+        if isinstance(reading, Reply):
+            self.reply_at = time.perf_counter()
+            self.reply_event.set()
+
+
+def bench_reader(data):
+    """Stream `data` through a max-speed replay device into a live controller"""
+    with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as fh:
+        fh.write(data)
+        path = fh.name
+    expected = sum(1 for line in StreamDecoder().feed(data) if isinstance(line, str) and line.strip())
+    controller = BenchController()
+    try:
+        if not controller.connect(f"replay://{path}?speed=max"):
+            raise RuntimeError(controller.status_msg)
+        cpu_start = thread_cpu_seconds(controller.read_thread)
+        wall_start = time.perf_counter()
+        deadline = time.monotonic() + 60
+        while controller.lines < expected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        cpu_end = thread_cpu_seconds(controller.read_thread)
+        # CPU is compared with the wall time of the same window, not the line span
+        cpu_window = time.perf_counter() - wall_start
+        elapsed = (controller.last_line_at or 0) - (controller.first_line_at or 0)
+    finally:
+        controller.disconnect()
+        os.unlink(path)
+    result = {
+        'lines': controller.lines,
+        'expected_lines': expected,
+        'seconds': elapsed,
+        'lines_per_sec': controller.lines / elapsed if elapsed > 0 else 0.0,
+    }
+    if cpu_start is not None and cpu_window > 0:
+        result['reader_cpu_seconds'] = cpu_end - cpu_start
+        result['reader_cpu_percent'] = (cpu_end - cpu_start) / cpu_window * 100
+    return result
+
+
+def bench_latency(port, count=100, timeout=2.0):
+    """Round trip from send_command() to the matching acknowledgement line"""
+    controller = BenchController()
+    if not controller.connect(port):
+        raise RuntimeError(controller.status_msg)
+    samples = []
+    timeouts = 0
+    try:
+        # Connect returns at the banner; let the help text after it drain so
+        # the first sample isn't queued behind it
+        controller.reply_event.clear()
+        controller.send_command("servo 2 90")
+        controller.reply_event.wait(2 * timeout)
+        for i in range(count):
+            # Alternate actuators so the writer never coalesces two benchmark commands
+            command = f"motor A {i % 256} F" if i % 2 else f"servo 1 {i % 181}"
+            controller.reply_event.clear()
+            start = time.perf_counter()
+            controller.send_command(command)
+            if controller.reply_event.wait(timeout):
+                samples.append(controller.reply_at - start)
+            else:
+                timeouts += 1
+    finally:
+        controller.disconnect()
+    result = {'port': port, 'commands': count, 'timeouts': timeouts}
+    result.update(percentiles(samples))
+    return result
+
+
+def bench_frames(sizes=((24, 80, 0), (40, 120, 0), (60, 200, 0), (40, 120, 16), (60, 200, 64)),
+                 frames=200):
+    """Run the dashboard in a real curses session on a pty at each size
+
+    Sizes with a board count render the fleet grid instead of one board.
+    """
+    results = []
+    for rows, cols, boards in sizes:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as fh:
+            out_path = fh.name
+        try:
+            _run_on_pty([sys.executable, os.path.abspath(__file__), '--frame-child',
+                         str(rows), str(cols), str(frames), out_path, str(boards)], rows, cols)
+            with open(out_path) as fh:
+                results.append(json.load(fh))
+        finally:
+            os.unlink(out_path)
+    return results
+
+
+def _run_on_pty(argv, rows, cols):
+    import fcntl
+    import pty
+    import struct
+    import termios
+
+    pid, fd = pty.fork()
+    if pid == 0:
+        fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack('HHHH', rows, cols, 0, 0))
+        os.environ.setdefault('TERM', 'xterm')
+        os.execv(argv[0], argv)
+    # Drain the child's screen output until it exits
+    while True:
+        try:
+            if not os.read(fd, 65536):
+                break
+        except OSError:
+            break
+    os.waitpid(pid, 0)
+    os.close(fd)
+
+
+def frame_child(rows, cols, frames, out_path, boards=0):
+    """Body of the --frame-child process: render frames and write timings"""
+    import curses
+    from cli import FleetDashboard
+    from telemetry import ColorReading, IRReading, DistanceReading
+
+    def run(stdscr):
+        curses.start_color()
+        for pair, color in enumerate((curses.COLOR_GREEN, curses.COLOR_RED, curses.COLOR_YELLOW,
+                                      curses.COLOR_CYAN, curses.COLOR_MAGENTA), 1):
+            curses.init_pair(pair, color, curses.COLOR_BLACK)
+        rng = random.Random(1)
+        if boards:
+            # Unconnected controllers fed directly; the grid only reads their state
+            fleet = Fleet([f"sim://?seed={i}" for i in range(boards)])
+            controllers = fleet.controllers
+            dashboard = FleetDashboard(stdscr, fleet)
+        else:
+            controllers = [ArduinoTerminalController()]
+            dashboard = Dashboard(stdscr, controllers[0])
+        dashboard.layout()
+
+        def feed():
+            for controller in controllers:
+                controller.apply_reading(ColorReading(rng.randint(20, 300), rng.randint(20, 300),
+                                                      rng.randint(20, 300)))
+                controller.apply_reading(IRReading('IR1', rng.randint(0, 1)))
+                controller.apply_reading(DistanceReading(rng.uniform(2, 100), False))
+
+        # Long history so decimation cost is included
+        for _ in range(20000 // len(controllers)):
+            feed()
+
+        changed, idle = [], []
+        for _ in range(frames):
+            feed()
+            start = time.perf_counter()
+            dashboard.render()
+            changed.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            dashboard.render()
+            idle.append(time.perf_counter() - start)
+        return {'rows': rows, 'cols': cols, 'boards': boards, 'frames': frames,
+                'changed': percentiles(changed), 'idle': percentiles(idle)}
+
+    result = curses.wrapper(run)
+    with open(out_path, 'w') as fh:
+        json.dump(result, fh)
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux only; None elsewhere)"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def bench_fleet(counts=(1, 8, 32, 64), seconds=3.0):
+    """Stream from N simulated boards on one event loop and measure its cost
+
+    The simulators run on their own threads in this process, so CPU is taken
+    from the event-loop thread alone; RSS per board includes the simulator.
+    """
+    return [asyncio.run(_fleet_run(count, seconds)) for count in counts]
+
+
+async def _fleet_run(count, seconds):
+    loop_thread = threading.current_thread()
+    rss_start = rss_bytes()
+    fleet = Fleet([f"sim://?seed={i}" for i in range(count)])
+    await fleet.connect()
+    rss_end = rss_bytes()
+    # Let the startup banners finish so they don't count against the link budget
+    await asyncio.sleep(1.5)
+    fleet.subscribe(DEFAULT_RATES)
+    await asyncio.sleep(0.5)
+
+    readings = 0
+    round_trips = []
+    sent_at = {}
+
+    async def consume():
+        nonlocal readings
+        async for controller, reading in fleet.stream():
+            if isinstance(reading, Reply):
+                start = sent_at.pop(controller, None)
+                if start is not None:
+                    round_trips.append(time.perf_counter() - start)
+            else:
+                readings += 1
+
+    consumer = asyncio.get_running_loop().create_task(consume())
+    fleet.monitor.reset()
+    cpu_start = thread_cpu_seconds(loop_thread)
+    start = time.perf_counter()
+    i = 0
+    while time.perf_counter() - start < seconds:
+        # A command to every board twice a second, replies timed per board
+        now = time.perf_counter()
+        for controller in fleet.connected:
+            sent_at[controller] = now
+            controller.send_nowait(f"servo 1 {i % 181}")
+        i += 1
+        await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - start
+    cpu_end = thread_cpu_seconds(loop_thread)
+    lag = list(fleet.monitor.lag.samples)
+    connected = len(fleet.connected)
+    await fleet.close()
+    await consumer
+
+    result = {
+        'boards': count,
+        'connected': connected,
+        'readings_per_sec': readings / elapsed,
+        'loop_lag': percentiles(lag),
+        'round_trip': percentiles(round_trips),
+    }
+    if cpu_start is not None:
+        cpu = cpu_end - cpu_start
+        result['loop_cpu_percent'] = cpu / elapsed * 100
+        result['cpu_us_per_reading'] = cpu / readings * 1e6 if readings else None
+        result['cpu_percent_per_board'] = cpu / elapsed * 100 / count
+    if rss_start is not None:
+        result['rss_kb_per_board'] = (rss_end - rss_start) / count / 1024
+    return result
+
+
+def environment():
+    """Where the numbers came from, for comparing runs across commits"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def summarize(results, out):
+    for name, data in results.get('parse', {}).items():
+        print(f"parse {name}: {data['parse_lines_per_sec']:,.0f} lines/s parse, "
+              f"{data['ingest_lines_per_sec']:,.0f} lines/s decode+parse, "
+              f"{data['controller_lines_per_sec']:,.0f} lines/s through the controller", file=out)
+        if data['failures']:
+            print(f"  parse failures: {data['failures']}", file=out)
+    if 'reader' in results:
+        r = results['reader']
+        cpu = f", reader CPU {r['reader_cpu_percent']:.0f}%" if 'reader_cpu_percent' in r else ""
+        print(f"reader: {r['lines_per_sec']:,.0f} lines/s ({r['lines']}/{r['expected_lines']} lines){cpu}",
+              file=out)
+    for r in results.get('latency', []):
+        if 'p50_ms' in r:
+            print(f"latency {r['port']}: p50 {r['p50_ms']:.1f} ms, p99 {r['p99_ms']:.1f} ms, "
+                  f"max {r['max_ms']:.1f} ms, {r['timeouts']} timeouts", file=out)
+    for r in results.get('frames', []):
+        fleet = f", {r['boards']} boards" if r.get('boards') else ""
+        print(f"frames {r['rows']}x{r['cols']}{fleet}: changed p50 {r['changed']['p50_ms']:.2f} ms, "
+              f"idle p50 {r['idle']['p50_ms']:.3f} ms", file=out)
+    for r in results.get('fleet', []):
+        cpu = f", loop CPU {r['loop_cpu_percent']:.1f}%" if 'loop_cpu_percent' in r else ""
+        rtt = r['round_trip'].get('p50_ms')
+        print(f"fleet {r['boards']} boards: {r['readings_per_sec']:,.0f} readings/s{cpu}, "
+              f"loop lag p99 {r['loop_lag'].get('p99_ms', 0):.2f} ms, "
+              f"round trip p50 {rtt if rtt is not None else float('nan'):.1f} ms", file=out)
+
+
+SUITES = ('parse', 'reader', 'latency', 'frames', 'fleet')
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--frame-child':
+        rows, cols, frames, out_path, boards = sys.argv[2:7]
+        frame_child(int(rows), int(cols), int(frames), out_path, int(boards))
+        return
+
+    ap = argparse.ArgumentParser(description="Benchmark suite for the CLI controller")
+    ap.add_argument('logs', nargs='*', help="raw serial captures for the parse benchmark")
+    ap.add_argument('--repeat', type=int, default=3, help="parse runs per input (best is reported)")
+    ap.add_argument('--only', default=','.join(SUITES), help="comma-separated suites to run")
+    ap.add_argument('--commands', type=int, default=100, help="commands per latency run")
+    ap.add_argument('--boards', default='1,8,32,64', help="comma-separated fleet sizes")
+    ap.add_argument('--json', metavar='FILE', help="write results to FILE instead of stdout")
+    args = ap.parse_args()
+    suites = set(args.only.split(','))
+
+    sources = [(path, open(path, 'rb').read()) for path in args.logs]
+    if not sources:
+        sources = [("<synthetic>", synthetic_capture())]
+
+    results = {'environment': environment()}
+    if 'parse' in suites:
+        results['parse'] = {name: bench_parser(data, args.repeat) for name, data in sources}
+    if 'reader' in suites:
+        results['reader'] = bench_reader(sources[0][1])
+    if 'latency' in suites:
+        results['latency'] = [bench_latency("sim://?baud=9600", args.commands),
+                              bench_latency("sim://?baud=0", args.commands)]
+    if 'frames' in suites:
+        results['frames'] = bench_frames()
+    if 'fleet' in suites:
+        results['fleet'] = bench_fleet([int(n) for n in args.boards.split(',')])
+
+    summarize(results, sys.stderr)
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,24 +5,62 @@ Terminal-based control and monitoring using curses
 
 import serial
 import serial.tools.list_ports
+import asyncio
 import curses
+import fnmatch
+import json
+import sys
 import threading
 import time
-import queue
-from collections import deque
 
-class ArduinoTerminalController:
+from commands import CommandWriter, expects_reply
+from discovery import (READY_TIMEOUT, wait_ready, probe_ports, load_last_port, save_last_port)
+from fleet import Fleet
+from colors import ColorClassifier, UNKNOWN
+from filters import FilterBank, parse_filter_args
+from metrics import PipelineMetrics, SamplingProfiler, controller_snapshot, dump_json
+from snapshot import format_age
+from recorder import TelemetryRecorder
+from sensors import SensorState
+from server import TelemetryServer, format_address
+from script import ScriptRunner, ScriptError, parse_script, summarize, format_result
+from streaming import SubscriptionManager, DEFAULT_RATES, link_budget
+from transport import open_transport, is_virtual
+from telemetry import StreamDecoder, TextParser
+
+# Port spec of the built-in simulated board
+SIM_PORT = "sim://"
+
+# Longest time the reader thread blocks on the port waiting for the first byte
+READ_TIMEOUT = 0.1
+
+# Delay between attempts to reopen a port after the link dropped
+RECONNECT_INTERVAL = 0.5
+
+# Dashboard frame-rate cap and keyboard poll interval
+DEFAULT_FPS = 15
+DEFAULT_POLL_MS = 20
+
+class ArduinoTerminalController(SensorState):
     def __init__(self):
         self.serial_port = None
+        self.port_spec = None
+        self.baudrate = 9600
+        self.ready = False  # the sketch answered with its banner or prompt
+        self.reconnects = 0
+        # Bytes read while waiting for the banner, decoded before reading on
+        self._pending = b''
+        self.read_thread = None
+        self.decoder = None
+        self.parser = TextParser()
+        self.writer = CommandWriter(lambda: self.serial_port,
+                                    on_sent=self._on_command_sent,
+                                    on_error=self._on_command_error)
         self.connected = False
         self.running = False
-        self.data_queue = queue.Queue()
         
-        # Sensor data storage
-        self.color_data = {'R': 0, 'G': 0, 'B': 0}
-        self.ir_data = {'IR1': 0, 'IR2': 0}  # Analog values (0-4095)
-        self.ir_threshold = 2000  # Detection threshold
-        self.distance = 0.0
+        # Snapshot, filters, classifier and histories (see sensors.py)
+        self.init_sensors()
         
         # Motor states
         self.motor_a_speed = 150
@@ -33,39 +71,75 @@ class ArduinoTerminalController:
         self.servo1_angle = 90
         self.servo2_angle = 90
         
-        # History for graphs (last 50 readings)
-        self.color_history = {'R': deque(maxlen=50), 'G': deque(maxlen=50), 'B': deque(maxlen=50)}
-        self.distance_history = deque(maxlen=50)
-        self.ir1_history = deque(maxlen=50)
-        self.ir2_history = deque(maxlen=50)
+        # Link, parser and queue counters (see metrics.py)
+        self.metrics = PipelineMetrics()
         
-        # Auto-refresh
+        # Auto-refresh (continuous sensor streaming, see set_auto_refresh)
         self.auto_refresh = False
+        self.subscriptions = SubscriptionManager(9600)
+        
+        # On-disk log of readings and sent commands (see start_recording)
+        self.recorder = None
+        
+        # Matches replies and readings to commands while a script runs (see script.py)
+        self.correlator = None
+        
+        # Local pub/sub endpoint for other programs (see start_server)
+        self.server = None
+        
+        # Compact binary sensor packets instead of text (negotiated with "binary on")
+        self.binary_mode = False
         
         # Status messages
         self.status_msg = "Disconnected"
         self.last_command = ""
+        self.last_latency = None
     
     def get_available_ports(self):
         """Get list of available serial ports"""
         ports = serial.tools.list_ports.comports()
         return [port.device for port in ports]
     
-    def connect(self, port):
-        """Connect to Arduino"""
+    def connect(self, port, baudrate=9600, opened=None, pending=b''):
+        """Connect to Arduino
+
+        `opened` is a port already opened (and found ready) by probe_ports(),
+        `pending` what the probe read after the banner. Returns True once the
+        port is open; `ready` tells whether the sketch also showed its banner.
+        """
+        start = time.monotonic()
+        if opened is not None and not opened.is_open:
+            # The probe's port was closed since; open it again and re-check
+            opened = None
         try:
-            self.serial_port = serial.Serial(port, 9600, timeout=1)
-            time.sleep(2)  # Wait for Arduino reset
+            if opened is None:
+                opened = open_transport(port, baudrate, timeout=READ_TIMEOUT)
+                # Done as soon as the sketch is up; the old fixed 2 s wait for
+                # the reset is only the timeout now
+                self.ready, pending = wait_ready(opened, READY_TIMEOUT)
+            else:
+                self.ready = True
+            self._pending = pending
+            self.serial_port = opened
+            self.port_spec = port
+            self.baudrate = baudrate
+            self.subscriptions.budget = link_budget(baudrate)
             self.connected = True
             self.running = True
-            self.status_msg = f"Connected to {port}"
+            self.status_msg = f"Connected to {port} ({time.monotonic() - start:.1f} s)"
+            if not self.ready:
+                self.status_msg += ", no banner from sketch"
             
             # Start reading thread
-            self.read_thread = threading.Thread(target=self.read_serial, daemon=True)
+            self.read_thread = threading.Thread(target=self.read_serial, name="serial-reader",
+                                                daemon=True)
             self.read_thread.start()
+            self.writer.start()
             
             return True
         except Exception as e:
+            if opened is not None:
+                opened.close()
             self.status_msg = f"Connection error: {str(e)}"
             return False
     
@@ -73,80 +147,190 @@ class ArduinoTerminalController:
         """Disconnect from Arduino"""
         self.running = False
         self.connected = False
+        self.writer.stop()
+        # The reader wakes up at least every READ_TIMEOUT, so this join is short
+        if self.read_thread and self.read_thread.is_alive():
+            self.read_thread.join(timeout=2 * READ_TIMEOUT)
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
+        self.stop_recording()
+        self.stop_server()
         self.status_msg = "Disconnected"
     
     def send_command(self, command):
-        """Send command to Arduino"""
+        """Queue command for the writer thread (returns immediately)"""
         if self.connected and self.serial_port:
-            try:
-                self.serial_port.write(f"{command}\n".encode())
-                self.last_command = command
-                time.sleep(0.05)
-            except Exception as e:
-                self.status_msg = f"Send error: {str(e)}"
+            self.writer.submit(command)
+            self.metrics.queue_depth(len(self.writer.queue))
         else:
             self.status_msg = "Not connected!"
     
+    def _on_command_sent(self, command, latency):
+        """Called from the writer thread once a command is on the wire"""
+        self.last_command = command
+        self.last_latency = latency
+        if expects_reply(command):
+            self.metrics.command_sent(time.monotonic() - latency)
+        recorder = self.recorder
+        if recorder:
+            recorder.record_command(command)
+        correlator = self.correlator
+        if correlator:
+            correlator.sent(command)
+        server = self.server
+        if server:
+            server.publish_command(command)
+    
+    def _on_command_error(self, command, error):
+        self.status_msg = f"Send error ({command}): {str(error)}"
+    
     def read_serial(self):
         """Read serial data from Arduino"""
+        decoder = self.decoder = StreamDecoder()
+        metrics = self.metrics
         while self.running:
-            if self.serial_port and self.serial_port.in_waiting:
+            # Whatever arrived with the banner goes first
+            data, self._pending = self._pending, b''
+            try:
+                if not data:
+                    # Block until at least one byte arrives (or READ_TIMEOUT expires),
+                    # then take everything already buffered in a single read
+                    data = self.serial_port.read(self.serial_port.in_waiting or 1)
+            except Exception as e:
+                if self.running:
+                    # USB unplugged or board gone: keep retrying until it is back
+                    self.reconnect(e)
+                    decoder = self.decoder = StreamDecoder()
+                continue
+            
+            metrics.read(len(data), time.monotonic())
+            
+            # Keep streams within the link budget
+            for command in self.subscriptions.observe(len(data)):
+                self.send_command(command)
+            
+            if not data:
+                continue
+            
+            start = time.perf_counter()
+            packets = decoder.packets
+            for event in decoder.feed(data):
                 try:
-                    line = self.serial_port.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        self.process_serial_data(line)
-                except Exception as e:
-                    pass
-            time.sleep(0.05)
+                    if isinstance(event, str):
+                        line = event.strip()
+                        if line:
+                            self.process_serial_data(line)
+                            metrics.line(self.parser.last_type or 'other', len(event) + 1)
+                    else:
+                        self.apply_reading(event)
+                except Exception:
+                    metrics.reader_errors += 1
+            if decoder.packets != packets:
+                metrics.packets(decoder.packets - packets)
+            metrics.ingest_time.add(time.perf_counter() - start)
     
-    def process_serial_data(self, line):
-        """Process incoming serial data"""
-        # Parse color sensor data
-        if line.startswith("  R:"):
-            try:
-                parts = line.split()
-                self.color_data['R'] = int(parts[1])
-                self.color_data['G'] = int(parts[3])
-                self.color_data['B'] = int(parts[5])
-                
-                # Update history
-                self.color_history['R'].append(self.color_data['R'])
-                self.color_history['G'].append(self.color_data['G'])
-                self.color_history['B'].append(self.color_data['B'])
-            except (ValueError, IndexError):
-                pass
-        
-        # Parse IR sensor data (analog values)
-        elif "IR1:" in line and "IR2:" in line:
+    def reconnect(self, error):
+        """Reopen the port after the link dropped; runs on the reader thread
+
+        Returns once reconnected or disconnect() was called. The board resets
+        when the port reopens, so binary mode and streams are restored.
+        """
+        self.connected = False
+        self.status_msg = f"Link lost ({error}), reconnecting..."
+        port, self.serial_port = self.serial_port, None
+        try:
+            port.close()
+        except Exception:
+            pass
+        while self.running:
+            time.sleep(RECONNECT_INTERVAL)
             try:
-                # Parse format: "IR1: 1234 (30%) [DETECTED]  |  IR2: 3456 (84%) [CLEAR]"
-                parts = line.split("IR1:")[1].split("IR2:")
-                ir1_part = parts[0].strip()
-                ir2_part = parts[1].strip() if len(parts) > 1 else ""
-                
-                # Extract numeric value (first number after IR1:)
-                ir1_val = int(ir1_part.split()[0])
-                ir2_val = int(ir2_part.split()[0]) if ir2_part else 0
-                
-                self.ir_data['IR1'] = ir1_val
-                self.ir_data['IR2'] = ir2_val
-                
-                # Store normalized values (0-1) for history/graphs
-                self.ir1_history.append(ir1_val / 4095.0)
-                self.ir2_history.append(ir2_val / 4095.0)
-            except (ValueError, IndexError):
-                pass
-        
-        # Parse ultrasonic data
-        elif line.startswith("Distance:"):
+                port = open_transport(self.port_spec, self.baudrate, timeout=READ_TIMEOUT)
+            except Exception:
+                continue
             try:
-                distance_str = line.split("cm")[0].split(":")[-1].strip()
-                self.distance = float(distance_str)
-                self.distance_history.append(self.distance)
-            except (ValueError, IndexError):
-                pass
+                self.ready, self._pending = wait_ready(port, READY_TIMEOUT)
+            except Exception:
+                port.close()
+                continue
+            if not self.running:
+                port.close()
+                return
+            self.serial_port = port
+            self._reconnected(self.port_spec)
+            return
+    
+    def start_recording(self, path):
+        """Log every reading and sent command to `path` (see recorder.py)"""
+        self.stop_recording()
+        self.recorder = TelemetryRecorder(path)
+    
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+    
+    def start_server(self, address, metrics_address=None):
+        """Publish readings to local subscribers at `address` (see server.py)
+
+        Raises OSError if the address can't be bound.
+        """
+        self.stop_server()
+        server = TelemetryServer(self, address, metrics_address)
+        server.start()
+        self.server = server
+    
+    def stop_server(self):
+        server, self.server = self.server, None
+        if server:
+            server.stop()
+    
+    def set_binary_mode(self, enabled):
+        """Ask the firmware to switch sensor output to binary packets (or back to text)"""
+        self.binary_mode = enabled
+        self.send_command("binary on" if enabled else "binary off")
+        # Samples change size, so streams need re-planning
+        for command in self.subscriptions.set_binary(enabled):
+            self.send_command(command)
+    
+    def subscribe(self, rates):
+        """Stream sensors continuously at the given rates ({'color': Hz, 'ir': Hz, 'ultra': Hz})
+
+        Rates are scaled down to fit the link and adjusted while streaming.
+        """
+        for command in self.subscriptions.request(rates, self.binary_mode):
+            self.send_command(command)
+    
+    def unsubscribe(self):
+        for command in self.subscriptions.stop():
+            self.send_command(command)
+    
+    def set_auto_refresh(self, enabled):
+        """Stream all sensors (instead of polling 'status') while enabled"""
+        self.auto_refresh = enabled
+        if enabled:
+            self.subscribe(DEFAULT_RATES)
+        else:
+            self.unsubscribe()
+    
+    def apply_reading(self, reading):
+        """Store a decoded reading record"""
+        now = time.monotonic()
+        recorder = self.recorder
+        if recorder:
+            recorder.record(reading)
+        snapshot = self.ingest(reading, now)
+        correlator = self.correlator
+        if correlator:
+            correlator.received(reading, now)
+        server = self.server
+        if server:
+            server.publish(reading, now, snapshot)
+    
+    def process_serial_data(self, line):
+        """Process incoming serial data"""
+        for record in self.parser.parse(line):
+            self.apply_reading(record)
 
 def safe_addstr(stdscr, y, x, text, attr=0):
     """Safely add string to screen, checking bounds"""
@@ -222,7 +406,7 @@ def draw_bar_graph(stdscr, y, x, width, value, max_value, label=""):
         safe_addstr(stdscr, y, x + width - 4, f"{int(value):>3}")
 
 def draw_line_graph(stdscr, y, x, width, height, data, label="", max_val=None):
-    """Draw a simple line graph using characters"""
+    """Draw a graph of a HistoryView, one min/max span per column"""
     if len(data) == 0:
         return
     
@@ -232,50 +416,671 @@ def draw_line_graph(stdscr, y, x, width, height, data, label="", max_val=None):
     
     # Determine max value for scaling
     if max_val is None:
-        max_val = max(data) if max(data) > 0 else 1
+        max_val = data.max() if data.max() > 0 else 1
     
     # Draw label
     safe_addstr(stdscr, y, x, label)
     
-    # Draw graph
-    for i, val in enumerate(list(data)):
-        if i >= width or x + i >= max_x:
-            break
+    # Draw graph; each column covers a slice of the window, drawn from its
+    # minimum to its maximum so spikes survive the decimation
+    width = min(width, max_x - x)
+    for i, (low, high) in enumerate(data.minmax(width)):
+        # Scale values to height
+        top = min(height - 1, max(0, int((high / max_val) * (height - 1))))
+        bottom = min(height - 1, max(0, int((low / max_val) * (height - 1))))
         
-        # Scale value to height
-        scaled = int((val / max_val) * (height - 1))
-        char_y = y + height - scaled - 1
+        for scaled in range(bottom, top + 1):
+            char_y = y + height - scaled - 1
+            if 0 <= char_y < max_y:
+                try:
+                    stdscr.addch(char_y, x + i, '█')
+                except (curses.error, ValueError):
+                    pass
+
+MENU_OPTIONS = [
+    "Motor A Forward", "Motor A Backward", "Motor B Forward", "Motor B Backward",
+    "Both Forward", "Both Backward", "STOP ALL",
+    "Servo 1 -10°", "Servo 1 +10°", "Servo 2 -10°", "Servo 2 +10°",
+    "Read Color", "Read IR", "Read Distance", "Toggle Auto-refresh",
+    "Toggle Binary Mode", "Quit"
+]
+
+# Selectable history graph windows, in seconds
+GRAPH_WINDOWS = [60, 300, 900, 3600]
+
+def format_window(seconds):
+    return f"{seconds // 3600} h" if seconds >= 3600 else f"{seconds // 60} min"
+
+class Widget:
+    """A dashboard region with its own curses window
+
+    render() redraws the window only when state() differs from the state it
+    was last drawn with (or after a layout change), and queues the update
+    with noutrefresh(); the dashboard flushes all windows with one doupdate().
+    """
+    def __init__(self, dashboard):
+        self.dashboard = dashboard
+        self.controller = dashboard.controller
+        self.win = None
+        self._drawn_state = None
+    
+    def place(self, win):
+        """Attach a (new) window; forces a redraw"""
+        self.win = win
+        self._drawn_state = None
+    
+    def state(self):
+        """Everything the widget displays; a change triggers a redraw"""
+        return None
+    
+    def draw(self, win):
+        pass
+    
+    def render(self):
+        if self.win is None:
+            return False
+        state = self.state()
+        if state == self._drawn_state:
+            return False
+        self.win.erase()
+        self.draw(self.win)
+        self.win.noutrefresh()
+        self._drawn_state = state
+        return True
+
+def draw_window_box(win, title=""):
+    """Border around a whole window with an optional title"""
+    try:
+        win.box()
+    except curses.error:
+        pass
+    if title:
+        safe_addstr(win, 0, 2, f" {title} ", curses.A_BOLD)
+
+class HeaderWidget(Widget):
+    def state(self):
+        c = self.controller
+        latency = round(c.last_latency * 1000) if c.last_latency is not None else None
+        return (c.status_msg, c.connected, c.last_command, latency,
+                len(c.writer.queue), c.last_reply)
+    
+    def draw(self, win):
+        c = self.controller
+        width = win.getmaxyx()[1]
+        safe_addstr(win, 0, 0, "=== Arduino Terminal Controller ===", curses.A_BOLD | curses.color_pair(4))
+        status_color = curses.color_pair(1) if c.connected else curses.color_pair(2)
+        safe_addstr(win, 0, max(0, width - len(c.status_msg) - 1), c.status_msg, status_color)
+        if c.last_command:
+            p95 = c.writer.latency.percentile(95)
+            safe_addstr(win, 1, 0, f"Last: {c.last_command} "
+                        f"({c.last_latency * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+                        f"queued {len(c.writer.queue)})  {c.last_reply}",
+                        curses.color_pair(3))
+
+class ControlsWidget(Widget):
+    def state(self):
+        c = self.controller
+        subs = c.subscriptions
+        return (self.dashboard.selected, c.motor_a_speed, c.motor_b_speed, c.motor_both_speed,
+                c.servo1_angle, c.servo2_angle, c.auto_refresh, c.binary_mode,
+                tuple(subs.rates.items()), round(subs.utilization * 100))
+    
+    def draw(self, win):
+        c = self.controller
+        height = win.getmaxyx()[0]
+        draw_window_box(win, "Controls")
         
-        if 0 <= char_y < max_y and y <= char_y < y + height:
-            try:
-                stdscr.addch(char_y, x + i, '█')
-            except (curses.error, ValueError):
-                pass
+        # Only draw lines that fit inside the box
+        def line(y, text, attr=0):
+            if y < height - 1:
+                safe_addstr(win, y, 2, text, attr)
+        
+        y_pos = 1
+        for i, option in enumerate(self.dashboard.menu_options):
+            if i == self.dashboard.selected:
+                line(y_pos, f"> {option}", curses.A_REVERSE)
+            else:
+                line(y_pos, f"  {option}")
+            y_pos += 1
+        
+        # Motor speeds
+        line(y_pos + 1, f"Motor A Speed: {c.motor_a_speed}")
+        line(y_pos + 2, f"Motor B Speed: {c.motor_b_speed}")
+        line(y_pos + 3, f"Both Motors: {c.motor_both_speed}")
+        
+        # Servo positions
+        line(y_pos + 5, f"Servo 1: {c.servo1_angle}°")
+        line(y_pos + 6, f"Servo 2: {c.servo2_angle}°")
+        
+        # Auto-refresh status
+        auto_status = "ON" if c.auto_refresh else "OFF"
+        auto_color = curses.color_pair(1) if c.auto_refresh else curses.color_pair(2)
+        line(y_pos + 8, f"Auto-refresh: {auto_status}", auto_color)
+        line(y_pos + 9, f"Telemetry: {'BINARY' if c.binary_mode else 'TEXT'}")
+        
+        # Stream rates and link utilization
+        subs = c.subscriptions
+        if subs.active:
+            rates = " ".join(f"{sensor} {hz}" for sensor, hz in subs.rates.items() if hz)
+            line(y_pos + 10, f"Stream Hz: {rates}")
+        line(y_pos + 11, f"Link: {subs.bytes_per_sec:.0f} B/s ({subs.utilization * 100:.0f}%)")
 
-def main(stdscr):
-    # Setup curses
-    curses.curs_set(0)  # Hide cursor
-    stdscr.nodelay(1)   # Non-blocking input
-    stdscr.timeout(100) # 100ms timeout
+class SensorWidget(Widget):
+    def state(self):
+        snap = self.dashboard.snapshot
+        now = time.monotonic()
+        # Ages are part of the state so they tick while no readings arrive
+        self._ages = tuple(format_age(t, now) for t in (snap.color_t, snap.ir1_t, snap.distance_t))
+        return (snap.seq, self._ages)
     
-    # Initialize colors
-    curses.start_color()
-    curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)
-    curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)
-    curses.init_pair(3, curses.COLOR_YELLOW, curses.COLOR_BLACK)
-    curses.init_pair(4, curses.COLOR_CYAN, curses.COLOR_BLACK)
-    curses.init_pair(5, curses.COLOR_MAGENTA, curses.COLOR_BLACK)
+    def draw(self, win):
+        snap = self.dashboard.snapshot
+        color_age, ir_age, distance_age = self._ages
+        draw_window_box(win, "Sensor Readings")
+        
+        # Color sensor
+        safe_addstr(win, 1, 2, f"Color Sensor (RGB):  {color_age}", curses.A_BOLD)
+        draw_bar_graph(win, 2, 2, 34, snap.color.r, 300, "R:")
+        draw_bar_graph(win, 3, 2, 34, snap.color.g, 300, "G:")
+        draw_bar_graph(win, 4, 2, 34, snap.color.b, 300, "B:")
+        color_class = snap.color_class
+        if color_class is not None:
+            known = color_class.color != UNKNOWN
+            label = (f"{color_class.color} ({color_class.confidence * 100:.0f}%)" if known
+                     else f"{color_class.color} ({color_class.distance:.1f} sd from calibration)")
+            drifted = self.controller.color_drift.drifted
+            if drifted:
+                label += f"  drift: {' '.join(drifted)}"
+            safe_addstr(win, 5, 2, f"Color: {label}",
+                        curses.color_pair(1) if known and not drifted else curses.color_pair(3))
+        
+        # IR sensors (digital: LOW over the line)
+        safe_addstr(win, 6, 2, f"IR Sensors:  {ir_age}", curses.A_BOLD)
+        for row, channel, value, detected in ((7, 'IR1', snap.ir1, snap.ir1_detected),
+                                              (8, 'IR2', snap.ir2, snap.ir2_detected)):
+            status = "DETECTED" if detected else "CLEAR"
+            color = curses.color_pair(2) if detected else curses.color_pair(1)
+            safe_addstr(win, row, 2, f"{channel}: {value} {status}", color)
+        
+        # Ultrasonic
+        safe_addstr(win, 10, 2, f"Ultrasonic Distance:  {distance_age}", curses.A_BOLD)
+        filtered = snap.distance_filtered
+        smoothed = f"  (filtered {filtered:.1f} cm)" if filtered is not None else ""
+        safe_addstr(win, 11, 2, f"{snap.distance.cm:.1f} cm{smoothed}", curses.color_pair(5))
+
+class GraphWidget(Widget):
+    def state(self):
+        # Time windows slide even without new samples, so also redraw every second
+        return (self.dashboard.snapshot.counts, self.dashboard.graph_window, int(time.monotonic()))
     
-    controller = ArduinoTerminalController()
+    def draw(self, win):
+        c = self.controller
+        height, width = win.getmaxyx()
+        window = self.dashboard.graph_window
+        draw_window_box(win, f"Real-time Data (last {format_window(window)}, w: change)")
+        
+        graph_width = min(50, width - 4)
+        graph_height = 5
+        
+        # Color history graph
+        color = c.color_history['R'].since(window)
+        if len(color) > 0:
+            safe_addstr(win, 1, 2, "Color (R/G/B):", curses.A_BOLD)
+            draw_line_graph(win, 2, 2, graph_width, graph_height, color, max_val=400)
+        
+        # Distance history graph
+        distance_y = 3 + graph_height
+        distance = c.distance_filtered_history.since(window)
+        if len(distance) > 0 and distance_y + graph_height < height:
+            safe_addstr(win, distance_y, 2, "Distance (filtered):", curses.A_BOLD)
+            draw_line_graph(win, distance_y + 1, 2, graph_width, graph_height, distance, max_val=100)
+
+def format_summary(summary, unit="ms"):
+    """One-line form of a Histogram.summary()"""
+    if not summary.get('count'):
+        return "-"
+    return (f"p50 {summary['p50']:.1f}  p99 {summary['p99']:.1f}  "
+            f"max {summary['max']:.1f} {unit}  (n={summary['count']})")
+
+class InstrumentsWidget(Widget):
+    """Link, parser, queue and render metrics; toggled with 'i'"""
+    def state(self):
+        # Counters move continuously; refresh the numbers once a second
+        profiler = self.dashboard.profiler
+        return (int(time.monotonic()), profiler is not None and profiler.active)
     
-    # Connection phase
-    ports = controller.get_available_ports()
+    def draw(self, win):
+        c = self.controller
+        height = win.getmaxyx()[0]
+        profiler = self.dashboard.profiler
+        snap = controller_snapshot(c, profiler if profiler and profiler.active else None)
+        draw_window_box(win, "Instruments (i: hide, d: dump JSON, p: profiler)")
+        lines = []
+        link = snap['link']
+        utilization = snap['streams']['utilization'] * 100
+        lines.append((f"Link in {link['bytes_per_sec']:.0f} B/s ({utilization:.0f}% of budget), "
+                      f"{link['reads_per_sec']:.0f} reads/s", curses.A_BOLD))
+        lines.append((f"  read size  {format_summary(link['read_size_bytes'], 'B')}", 0))
+        lines.append((f"  {'message':<12}{'lines/s':>9}{'bytes/s':>9}{'total':>9}", curses.A_BOLD))
+        for kind, row in snap['messages'].items():
+            lines.append((f"  {kind:<12}{row['lines_per_sec']:>9.1f}{row['bytes_per_sec']:>9.0f}"
+                          f"{row['lines']:>9}", 0))
+        errors = snap['errors']
+        failures = ", ".join(f"{k} {v}" for k, v in errors['parse_failures'].items()) or "none"
+        error_attr = curses.color_pair(2) if (errors['parse_failures'] or errors['bad_packets']
+                                              or errors['reader_errors']) else 0
+        lines.append((f"Errors  parse: {failures}  bad packets {errors['bad_packets']}  "
+                      f"lost {errors['lost_packets']}  reader {errors['reader_errors']}", error_attr))
+        queues = snap['queues']
+        lines.append((f"Queues  writer {queues['writer']} (max {queues['writer_max']})  "
+                      f"coalesced {queues['coalesced']}  dropped {queues['dropped']}  "
+                      f"unsent {queues['failed']}  recorder {queues['recorder_blocks']}",
+                      curses.color_pair(2) if queues['failed'] else 0))
+        server = snap.get('server')
+        if server:
+            drop_attr = curses.color_pair(3) if server['dropped'] else 0
+            lines.append((f"Server  {server['address']}  {server['subscribers']} subscribers  "
+                          f"published {server['published']}  dropped {server['dropped']}  "
+                          f"commands {server['commands']}", drop_attr))
+        lines.append((f"Ingest per read  {format_summary(snap['ingest_ms'])}", 0))
+        lines.append((f"Reading age      {format_summary(snap['reading_age_ms'])}", 0))
+        lines.append((f"Round trip       {format_summary(snap['round_trip_ms'])}", 0))
+        lines.append((f"Frame            {format_summary(snap['frame_ms'])}", 0))
+        if 'profile' in snap:
+            lines.append(("Profile (thread / function, self %, total %)", curses.A_BOLD))
+            for row in snap['profile']['top']:
+                lines.append((f"  {row['thread'][:14]:<14} {row['function'][:34]:<34}"
+                              f"{row['self_pct']:>5.0f}{row['total_pct']:>6.0f}", 0))
+        for y, (text, attr) in enumerate(lines[:height - 2], 1):
+            safe_addstr(win, y, 2, text, attr)
+
+class StatusBarWidget(Widget):
+    def state(self):
+        stats = self.dashboard.stats
+        return (round(stats.fps), round(stats.frame_ms, 1), round(stats.redraws_per_sec))
+    
+    def draw(self, win):
+        stats = self.dashboard.stats
+        safe_addstr(win, 0, 0, self.dashboard.help_text, curses.color_pair(3))
+        perf = f"{stats.fps:.0f} fps  {stats.frame_ms:.1f} ms/frame  {stats.redraws_per_sec:.0f} redraws/s"
+        safe_addstr(win, 0, max(0, win.getmaxyx()[1] - len(perf) - 1), perf)
+
+class FrameStats:
+    """Frame time and redraw rate of the dashboard, averaged over one-second windows"""
+    def __init__(self):
+        self.fps = 0.0
+        self.frame_ms = 0.0
+        self.redraws_per_sec = 0.0
+        self._window_start = time.monotonic()
+        self._frames = 0
+        self._redraws = 0
+        self._frame_time = 0.0
+    
+    def record(self, duration, redraws):
+        self._frames += 1
+        self._redraws += redraws
+        self._frame_time += duration
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self.fps = self._frames / elapsed
+            self.redraws_per_sec = self._redraws / elapsed
+            self.frame_ms = self._frame_time / self._frames * 1000
+            self._window_start = now
+            self._frames = self._redraws = 0
+            self._frame_time = 0.0
+
+class Dashboard:
+    """Single-device dashboard made of independently refreshed widgets"""
+    def __init__(self, stdscr, controller, make_window=None, update=None, profiler=None):
+        self.stdscr = stdscr
+        self.controller = controller
+        self.make_window = make_window or curses.newwin
+        self.update = update or curses.doupdate
+        self.menu_options = MENU_OPTIONS
+        self.help_text = "↑/↓: Navigate | Enter: Execute | +/-: Adjust Speed | i: Stats | q: Quit"
+        self.selected = 0
+        self.graph_window = GRAPH_WINDOWS[0]
+        self.show_instruments = False
+        self.profiler = profiler
+        self.stats = FrameStats()
+        self.header = HeaderWidget(self)
+        self.controls = ControlsWidget(self)
+        self.sensors = SensorWidget(self)
+        self.graphs = GraphWidget(self)
+        self.instruments = InstrumentsWidget(self)
+        self.status_bar = StatusBarWidget(self)
+        self.widgets = [self.header, self.controls, self.sensors, self.graphs, self.instruments,
+                        self.status_bar]
+        self.size = None
+        self.snapshot = controller.snapshot
+        self._drawn_seq = None
+    
+    def _window(self, y, x, height, width):
+        """Create a window clipped to the screen, or None if nothing fits"""
+        max_y, max_x = self.size
+        height = min(height, max_y - y)
+        width = min(width, max_x - x)
+        if height < 1 or width < 1:
+            return None
+        return self.make_window(height, width, y, x)
+    
+    def layout(self):
+        """Create widget windows for the current terminal size"""
+        self.size = self.stdscr.getmaxyx()
+        height, width = self.size
+        self.stdscr.erase()
+        self.stdscr.noutrefresh()
+        self.header.place(self._window(0, 0, 2, width))
+        self.controls.place(self._window(2, 0, height - 3, 40))
+        if self.show_instruments:
+            # The panel takes the whole area right of the controls
+            self.sensors.place(None)
+            self.graphs.place(None)
+            self.instruments.place(self._window(2, 42, height - 3, width - 42))
+        else:
+            self.instruments.place(None)
+            self.sensors.place(self._window(2, 42, 15, 38))
+            # History graphs sit under the sensor box, right of the controls
+            if height > 30 and width > 60:
+                self.graphs.place(self._window(17, 42, height - 18, width - 42))
+            else:
+                self.graphs.place(None)
+        self.status_bar.place(self._window(height - 1, 0, 1, width))
+    
+    def toggle_instruments(self):
+        self.show_instruments = not self.show_instruments
+        self.layout()
+    
+    def toggle_profiler(self):
+        """Start or stop sampling the controller's threads"""
+        if self.profiler is None:
+            self.profiler = SamplingProfiler()
+        if self.profiler.active:
+            self.profiler.stop()
+        else:
+            self.profiler.start()
+    
+    def dump_metrics(self, path=None):
+        """Write the instrument snapshot as JSON; returns the path"""
+        return dump_json(controller_snapshot(self.controller, self.profiler), path)
+    
+    def render(self):
+        """Redraw changed widgets and push them to the terminal; returns redraw count"""
+        start = time.perf_counter()
+        if self.stdscr.getmaxyx() != self.size:
+            self.layout()
+        # One snapshot per frame, so every widget shows the same readings
+        snapshot = self.snapshot = self.controller.snapshot
+        redraws = 0
+        for widget in self.widgets:
+            if widget.render():
+                redraws += 1
+        if redraws:
+            self.update()
+            duration = time.perf_counter() - start
+            metrics = self.controller.metrics
+            metrics.frame_time.add(duration)
+            # How old the newest reading was when it reached the screen
+            if snapshot.seq != self._drawn_seq and snapshot.t is not None:
+                metrics.reading_age.add(time.monotonic() - snapshot.t)
+                self._drawn_seq = snapshot.seq
+        else:
+            duration = time.perf_counter() - start
+        self.stats.record(duration, redraws)
+        return redraws
+
+# A board whose last reading is older than this (while streaming) is shown as stale
+STALE_SECONDS = 3.0
+
+def link_health(c, now):
+    """Short link status for the fleet grid and its color pair"""
+    if not c.connected:
+        return "LOST", 2
+    last = c.snapshot.t
+    if last is None:
+        return "IDLE", 3
+    age = now - last
+    if c.subscriptions.active and age > STALE_SECONDS:
+        return f"STALE {age:.0f}s", 3
+    return f"OK {c.subscriptions.utilization * 100:3.0f}%", 1
+
+class FleetHeaderWidget(Widget):
+    def state(self):
+        d = self.dashboard
+        lag = d.fleet.monitor.lag.percentile(99)
+        return (len(d.fleet.connected), len(d.fleet), round(d.total_rate),
+                round(lag * 1000, 1) if lag is not None else None, d.last_broadcast)
+    
+    def draw(self, win):
+        d = self.dashboard
+        connected, total, rate, lag, broadcast = self.state()
+        safe_addstr(win, 0, 0, f"=== Fleet: {connected}/{total} boards connected ===",
+                    curses.A_BOLD | curses.color_pair(4))
+        loop = f"  loop lag p99 {lag:.1f} ms" if lag is not None else ""
+        info = f"{rate} readings/s{loop}"
+        safe_addstr(win, 0, max(0, win.getmaxyx()[1] - len(info) - 1), info)
+        if broadcast:
+            safe_addstr(win, 1, 0, f"Broadcast: {broadcast}", curses.color_pair(3))
+
+class FleetGridWidget(Widget):
+    """One summary row per board; the selected row can be opened full screen"""
+    def __init__(self, dashboard):
+        super().__init__(dashboard)
+        self._readings = {}
+    
+    COLUMNS = f"{'#':>3}  {'Port':<22} {'R':>4} {'G':>4} {'B':>4}  {'IR1':>4} {'IR2':>4}  {'Dist cm':>8}  {'Rate/s':>6}  Link"
+    
+    def rows(self):
+        """(text, link health, health color) for every board"""
+        now = time.monotonic()
+        rows = []
+        cache = self._readings
+        for i, c in enumerate(self.dashboard.fleet.controllers):
+            health, color = link_health(c, now)
+            snap = c.snapshot
+            # Reformat a board's readings only when its snapshot changed
+            cached = cache.get(c)
+            if cached is None or cached[0] != snap.seq:
+                cached = cache[c] = (snap.seq, f"{snap.color.r:>4} {snap.color.g:>4} {snap.color.b:>4}  "
+                                               f"{snap.ir1:>4} {snap.ir2:>4}  {snap.distance.cm:>8.1f}")
+            text = (f"{i + 1:>3}  {c.name[-22:]:<22} {cached[1]}  "
+                    f"{self.dashboard.rates.get(c, 0.0):>6.1f}  ")
+            rows.append((text, health, color))
+        return rows
+    
+    def state(self):
+        d = self.dashboard
+        visible = max(1, self.win.getmaxyx()[0] - 3)
+        # Scroll just enough to keep the selection on screen
+        if d.selected < d.top:
+            d.top = d.selected
+        elif d.selected >= d.top + visible:
+            d.top = d.selected - visible + 1
+        self._rows = tuple(self.rows()[d.top:d.top + visible])
+        return (d.selected, d.top, self._rows)
+    
+    def draw(self, win):
+        d = self.dashboard
+        draw_window_box(win, "Boards (Enter: open)")
+        safe_addstr(win, 1, 2, self.COLUMNS, curses.A_BOLD)
+        for row, (text, health, color) in enumerate(self._rows):
+            attr = curses.A_REVERSE if d.top + row == d.selected else 0
+            safe_addstr(win, 2 + row, 2, text, attr)
+            safe_addstr(win, 2 + row, 2 + len(text), health, attr | curses.color_pair(color))
+
+class FleetDashboard:
+    """Summary grid for a Fleet; Enter opens a board in the single-device Dashboard"""
+    def __init__(self, stdscr, fleet, make_window=None, update=None):
+        self.stdscr = stdscr
+        self.fleet = fleet
+        self.controller = None
+        self.make_window = make_window or curses.newwin
+        self.update = update or curses.doupdate
+        self.help_text = ("↑/↓: Select | Enter: Open | s/Space: Stop all | "
+                          "a: Auto-refresh all | q: Quit")
+        self.selected = 0
+        self.top = 0
+        self.last_broadcast = ""
+        self.stats = FrameStats()
+        self.rates = {}
+        self.total_rate = 0.0
+        self._rate_counts = {}
+        self._rate_start = time.monotonic()
+        self.header = FleetHeaderWidget(self)
+        self.grid = FleetGridWidget(self)
+        self.status_bar = StatusBarWidget(self)
+        self.widgets = [self.header, self.grid, self.status_bar]
+        self.size = None
+    
+    def layout(self):
+        self.size = self.stdscr.getmaxyx()
+        height, width = self.size
+        self.stdscr.erase()
+        self.stdscr.noutrefresh()
+        self.header.place(self.make_window(2, width, 0, 0))
+        if height > 3:
+            self.grid.place(self.make_window(height - 3, width, 2, 0))
+        else:
+            self.grid.place(None)
+        self.status_bar.place(self.make_window(1, width, height - 1, 0))
+    
+    def _update_rates(self):
+        """Readings per second per board, over one-second windows"""
+        now = time.monotonic()
+        elapsed = now - self._rate_start
+        if elapsed < 1.0:
+            return
+        for c in self.fleet.controllers:
+            count = c.snapshot.readings
+            self.rates[c] = (count - self._rate_counts.get(c, count)) / elapsed
+            self._rate_counts[c] = count
+        self.total_rate = sum(self.rates.values())
+        self._rate_start = now
+    
+    def render(self):
+        start = time.perf_counter()
+        if self.stdscr.getmaxyx() != self.size:
+            self.layout()
+        self._update_rates()
+        redraws = 0
+        for widget in self.widgets:
+            if widget.render():
+                redraws += 1
+        if redraws:
+            self.update()
+        self.stats.record(time.perf_counter() - start, redraws)
+        return redraws
+    
+    def broadcast(self, command):
+        """Queue a command on every connected board"""
+        boards = self.fleet.connected
+        for c in boards:
+            c.send_command(command)
+        self.last_broadcast = f"{command} -> {len(boards)} boards"
+    
+    def handle_key(self, key):
+        """Apply a grid key press; returns the board to open, False on quit, else None"""
+        boards = self.fleet.controllers
+        if key == curses.KEY_RESIZE:
+            self.layout()
+        elif key == curses.KEY_UP:
+            self.selected = max(0, self.selected - 1)
+        elif key == curses.KEY_DOWN:
+            self.selected = min(len(boards) - 1, self.selected + 1)
+        elif key in (ord('s'), ord(' ')):
+            self.broadcast("stop")
+        elif key == ord('a'):
+            # Turn streaming on everywhere unless every board already streams
+            enable = not all(c.auto_refresh for c in self.fleet.connected)
+            for c in self.fleet.connected:
+                c.set_auto_refresh(enable)
+            self.last_broadcast = f"auto-refresh {'ON' if enable else 'OFF'}"
+        elif key == ord('\n') and boards:
+            return boards[self.selected]
+        elif key == ord('q'):
+            return False
+        return None
+
+async def run_fleet(stdscr, ports, fps=DEFAULT_FPS, poll_ms=DEFAULT_POLL_MS):
+    """Fleet view: every board on one event loop, keyboard polled between frames"""
+    stdscr.timeout(0)
+    safe_addstr(stdscr, 0, 0, f"Connecting to {len(ports)} boards...")
+    stdscr.refresh()
+    fleet = Fleet(ports)
+    await fleet.connect()
+    
+    grid = FleetDashboard(stdscr, fleet)
+    grid.layout()
+    view = grid
+    frame_interval = 1.0 / fps
+    next_frame = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_frame:
+                view.render()
+                next_frame = now + frame_interval
+            
+            key = stdscr.getch()
+            if key == -1:
+                # Idle: give the loop to the boards until the next poll
+                await asyncio.sleep(poll_ms / 1000.0)
+                continue
+            
+            if view is grid:
+                board = grid.handle_key(key)
+                if board is False:
+                    break
+                if board:
+                    view = Dashboard(stdscr, board)
+                    view.help_text = "↑/↓: Navigate | Enter: Execute | +/-: Adjust Speed | q/Esc: Back"
+                    view.layout()
+            elif key == 27 or not handle_dashboard_key(view, key):
+                # Quit from a board view returns to the grid
+                if view.profiler:
+                    view.profiler.stop()
+                view = grid
+                grid.layout()
+    finally:
+        await fleet.close()
+
+def fleet_ports(pattern):
+    """Serial ports whose device name matches a glob pattern"""
+    return [port.device for port in serial.tools.list_ports.comports()
+            if fnmatch.fnmatch(port.device, pattern)]
+
+def fleet_main(stdscr, ports, fps=DEFAULT_FPS, poll_ms=DEFAULT_POLL_MS):
+    setup_screen(stdscr)
+    # Escape is used to leave a board view; don't wait a second for an escape sequence
+    curses.set_escdelay(25)
     if not ports:
-        safe_addstr(stdscr, 0, 0, "No serial ports found! Press any key to exit.")
+        safe_addstr(stdscr, 0, 0, "No matching ports found.", curses.color_pair(2))
+        safe_addstr(stdscr, 1, 0, "Press any key to exit.")
+        stdscr.nodelay(0)
         stdscr.getch()
         return
+    asyncio.run(run_fleet(stdscr, ports, fps, poll_ms))
+
+def select_port(stdscr, controller, probes=(), baudrate=9600):
+    """Port selection menu; returns True once connected, False if the user quit
+
+    `probes` are ProbeResults for the listed ports; ports where the sketch
+    answered are listed first and connected to without reopening.
+    """
+    found = {probe.spec: probe for probe in probes}
+    ports = sorted(controller.get_available_ports(),
+                   key=lambda port: not (port in found and found[port].ready))
+    # The simulated board is always offered, so the tool works without hardware
+    ports.append(SIM_PORT)
+    
+    def close_probes(keep=None):
+        for spec, probe in found.items():
+            if probe.port is not None and probe.port is not keep:
+                probe.port.close()
+                # Connecting here later opens the port again
+                found[spec] = probe._replace(port=None)
     
-    # Port selection
     selected_port = 0
     while True:
         stdscr.clear()
@@ -285,11 +1090,17 @@ def main(stdscr):
         
         for i, port in enumerate(ports):
             y_pos = 4 + i
+            if port == SIM_PORT:
+                label = f"{port}  (simulated board)"
+            elif port in found:
+                label = f"{port}  ({'sketch detected' if found[port].ready else 'no response'})"
+            else:
+                label = port
             if y_pos < max_y - 1:
                 if i == selected_port:
-                    safe_addstr(stdscr, y_pos, 2, f"> {port}", curses.A_REVERSE)
+                    safe_addstr(stdscr, y_pos, 2, f"> {label}", curses.A_REVERSE)
                 else:
-                    safe_addstr(stdscr, y_pos, 2, f"  {port}")
+                    safe_addstr(stdscr, y_pos, 2, f"  {label}")
         
         quit_y = 6 + len(ports)
         if quit_y < max_y - 1:
@@ -302,197 +1113,358 @@ def main(stdscr):
         elif key == curses.KEY_DOWN:
             selected_port = min(len(ports) - 1, selected_port + 1)
         elif key == ord('\n'):
-            if controller.connect(ports[selected_port]):
-                break
+            port = ports[selected_port]
+            probe = found.get(port)
+            opened = probe.port if probe else None
+            close_probes(keep=opened)
+            if controller.connect(port, baudrate, opened=opened,
+                                  pending=probe.pending if opened else b''):
+                return True
             else:
-                stdscr.addstr(8 + len(ports), 0, controller.status_msg, curses.color_pair(2))
+                safe_addstr(stdscr, 8 + len(ports), 0, controller.status_msg, curses.color_pair(2))
                 stdscr.refresh()
                 time.sleep(2)
         elif key == ord('q'):
+            close_probes()
+            return False
+
+def auto_connect(stdscr, controller, baudrate=None):
+    """Connect without the menu when possible; returns True once connected
+
+    Tries the last port that worked, then probes every port at once and
+    takes the only one running the sketch. Otherwise falls back to the menu.
+    """
+    ports = controller.get_available_ports()
+    last = load_last_port()
+    if last:
+        port, last_baudrate = last
+        if port in ports:
+            stdscr.clear()
+            safe_addstr(stdscr, 0, 0, f"Reconnecting to {port}...")
+            stdscr.refresh()
+            if controller.connect(port, baudrate or last_baudrate):
+                if controller.ready:
+                    return True
+                # Something else is on that port now; probe like a first launch
+                controller.disconnect()
+    baudrate = baudrate or 9600
+    
+    stdscr.clear()
+    safe_addstr(stdscr, 0, 0, f"Probing {len(ports)} ports...")
+    stdscr.refresh()
+    probes = probe_ports(ports, baudrate, read_timeout=READ_TIMEOUT)
+    ready = [probe for probe in probes if probe.ready]
+    if len(ready) == 1:
+        return controller.connect(ready[0].spec, baudrate, opened=ready[0].port,
+                                  pending=ready[0].pending)
+    return select_port(stdscr, controller, probes, baudrate)
+
+def setup_screen(stdscr):
+    """Cursor, input mode and color pairs shared by all views"""
+    curses.curs_set(0)  # Hide cursor
+    stdscr.nodelay(1)   # Non-blocking input
+    stdscr.timeout(100) # 100ms timeout
+    
+    # Initialize colors
+    curses.start_color()
+    curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)
+    curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)
+    curses.init_pair(3, curses.COLOR_YELLOW, curses.COLOR_BLACK)
+    curses.init_pair(4, curses.COLOR_CYAN, curses.COLOR_BLACK)
+    curses.init_pair(5, curses.COLOR_MAGENTA, curses.COLOR_BLACK)
+
+def handle_dashboard_key(dashboard, key):
+    """Apply a key press to a single-device dashboard; returns False on quit"""
+    controller = dashboard.controller
+    menu_options = dashboard.menu_options
+    selected_option = dashboard.selected
+    
+    if key == curses.KEY_RESIZE:
+        dashboard.layout()
+    elif key == ord('i'):
+        dashboard.toggle_instruments()
+    elif key == ord('p'):
+        dashboard.toggle_profiler()
+    elif key == ord('d'):
+        try:
+            controller.status_msg = f"Metrics written to {dashboard.dump_metrics()}"
+        except Exception as e:
+            # A failed dump must not take the dashboard down with it
+            controller.status_msg = f"Metrics dump failed: {e}"
+    elif key == ord('w'):
+        index = GRAPH_WINDOWS.index(dashboard.graph_window)
+        dashboard.graph_window = GRAPH_WINDOWS[(index + 1) % len(GRAPH_WINDOWS)]
+    elif key == curses.KEY_UP:
+        dashboard.selected = max(0, selected_option - 1)
+    elif key == curses.KEY_DOWN:
+        dashboard.selected = min(len(menu_options) - 1, selected_option + 1)
+    elif key == ord('+') or key == ord('='):
+        if selected_option < 2:  # Motor A
+            controller.motor_a_speed = min(255, controller.motor_a_speed + 10)
+        elif selected_option < 4:  # Motor B
+            controller.motor_b_speed = min(255, controller.motor_b_speed + 10)
+        elif selected_option < 7:  # Both motors
+            controller.motor_both_speed = min(255, controller.motor_both_speed + 10)
+    elif key == ord('-') or key == ord('_'):
+        if selected_option < 2:  # Motor A
+            controller.motor_a_speed = max(0, controller.motor_a_speed - 10)
+        elif selected_option < 4:  # Motor B
+            controller.motor_b_speed = max(0, controller.motor_b_speed - 10)
+        elif selected_option < 7:  # Both motors
+            controller.motor_both_speed = max(0, controller.motor_both_speed - 10)
+    elif key == ord('\n'):
+        # Execute selected option
+        if selected_option == 0:  # Motor A Forward
+            controller.send_command(f"motor A {controller.motor_a_speed} F")
+        elif selected_option == 1:  # Motor A Backward
+            controller.send_command(f"motor A {controller.motor_a_speed} B")
+        elif selected_option == 2:  # Motor B Forward
+            controller.send_command(f"motor B {controller.motor_b_speed} F")
+        elif selected_option == 3:  # Motor B Backward
+            controller.send_command(f"motor B {controller.motor_b_speed} B")
+        elif selected_option == 4:  # Both Forward
+            controller.send_command(f"motors {controller.motor_both_speed} F")
+        elif selected_option == 5:  # Both Backward
+            controller.send_command(f"motors {controller.motor_both_speed} B")
+        elif selected_option == 6:  # STOP ALL
+            controller.send_command("stop")
+        elif selected_option == 7:  # Servo 1 -10
+            controller.servo1_angle = max(0, controller.servo1_angle - 10)
+            controller.send_command(f"servo 1 {controller.servo1_angle}")
+        elif selected_option == 8:  # Servo 1 +10
+            controller.servo1_angle = min(180, controller.servo1_angle + 10)
+            controller.send_command(f"servo 1 {controller.servo1_angle}")
+        elif selected_option == 9:  # Servo 2 -10
+            controller.servo2_angle = max(0, controller.servo2_angle - 10)
+            controller.send_command(f"servo 2 {controller.servo2_angle}")
+        elif selected_option == 10:  # Servo 2 +10
+            controller.servo2_angle = min(180, controller.servo2_angle + 10)
+            controller.send_command(f"servo 2 {controller.servo2_angle}")
+        elif selected_option == 11:  # Read Color
+            controller.send_command("color")
+        elif selected_option == 12:  # Read IR
+            controller.send_command("ir")
+        elif selected_option == 13:  # Read Distance
+            controller.send_command("ultra")
+        elif selected_option == 14:  # Toggle Auto-refresh
+            controller.set_auto_refresh(not controller.auto_refresh)
+        elif selected_option == 15:  # Toggle Binary Mode
+            controller.set_binary_mode(not controller.binary_mode)
+        elif selected_option == 16:  # Quit
+            return False
+    elif key == ord('q'):
+        return False
+    return True
+
+def main(stdscr, fps=DEFAULT_FPS, poll_ms=DEFAULT_POLL_MS, record_path=None, port_spec=None,
+         baudrate=None, menu=False, profile=False, metrics_path=None, filters=None,
+         classifier=None, serve=None, serve_metrics=None):
+    setup_screen(stdscr)
+    
+    controller = ArduinoTerminalController()
+    controller.filters = FilterBank(filters)
+    if classifier:
+        controller.set_classifier(classifier)
+    
+    # Connection phase
+    if port_spec:
+        if not controller.connect(port_spec, baudrate or 9600):
+            safe_addstr(stdscr, 0, 0, controller.status_msg, curses.color_pair(2))
+            safe_addstr(stdscr, 1, 0, "Press any key to exit.")
+            stdscr.nodelay(0)
+            stdscr.getch()
             return
+    elif menu:
+        if not select_port(stdscr, controller, baudrate=baudrate or 9600):
+            return
+    elif not auto_connect(stdscr, controller, baudrate):
+        return
     
-    # Main control loop
-    selected_option = 0
-    menu_options = [
-        "Motor A Forward", "Motor A Backward", "Motor B Forward", "Motor B Backward",
-        "Both Forward", "Both Backward", "STOP ALL",
-        "Servo 1 -10°", "Servo 1 +10°", "Servo 2 -10°", "Servo 2 +10°",
-        "Read Color", "Read IR", "Read Distance", "Toggle Auto-refresh",
-        "Quit"
-    ]
+    # Next launch goes straight back to a board where the sketch answered
+    # (the simulator and replays are only used when asked for)
+    if controller.ready and not is_virtual(controller.port_spec):
+        save_last_port(controller.port_spec, controller.baudrate)
+    
+    if record_path:
+        controller.start_recording(record_path)
+    if serve:
+        try:
+            controller.start_server(serve, serve_metrics)
+            server = controller.server
+            controller.status_msg = (f"Serving on {format_address(server.address)}, metrics on "
+                                     f"{format_address(server.metrics_address)}")
+        except (OSError, ValueError) as e:
+            controller.status_msg = f"Server error: {e}"
     
-    last_auto_refresh = time.time()
+    # Main control loop
+    dashboard = Dashboard(stdscr, controller)
+    if profile:
+        dashboard.toggle_profiler()
+    dashboard.layout()
+    stdscr.timeout(poll_ms)
+    frame_interval = 1.0 / fps
+    next_frame = time.monotonic()
     
     while True:
-        stdscr.clear()
-        height, width = stdscr.getmaxyx()
-        
-        # Header
-        safe_addstr(stdscr, 0, 0, "=== Arduino Terminal Controller ===", curses.A_BOLD | curses.color_pair(4))
-        status_color = curses.color_pair(1) if controller.connected else curses.color_pair(2)
-        status_x = max(0, width - len(controller.status_msg) - 1)
-        safe_addstr(stdscr, 0, status_x, controller.status_msg, status_color)
-        
-        # Left column - Controls
-        draw_box(stdscr, 2, 0, height - 3, 40, "Controls")
-        
-        y_pos = 3
-        max_y, max_x = stdscr.getmaxyx()
-        controls_box_height = height - 3
-        
-        # Only draw menu options that fit in the available space
-        for i, option in enumerate(menu_options):
-            if y_pos >= max_y - 1 or y_pos >= 2 + controls_box_height - 1:
-                break
-            if i == selected_option:
-                safe_addstr(stdscr, y_pos, 2, f"> {option}", curses.A_REVERSE)
-            else:
-                safe_addstr(stdscr, y_pos, 2, f"  {option}")
-            y_pos += 1
-        
-        # Motor speeds (only if there's space)
-        if y_pos + 1 < max_y - 1 and y_pos + 1 < 2 + controls_box_height - 1:
-            safe_addstr(stdscr, y_pos + 1, 2, f"Motor A Speed: {controller.motor_a_speed}")
-        if y_pos + 2 < max_y - 1 and y_pos + 2 < 2 + controls_box_height - 1:
-            safe_addstr(stdscr, y_pos + 2, 2, f"Motor B Speed: {controller.motor_b_speed}")
-        if y_pos + 3 < max_y - 1 and y_pos + 3 < 2 + controls_box_height - 1:
-            safe_addstr(stdscr, y_pos + 3, 2, f"Both Motors: {controller.motor_both_speed}")
-        
-        # Servo positions (only if there's space)
-        if y_pos + 5 < max_y - 1 and y_pos + 5 < 2 + controls_box_height - 1:
-            safe_addstr(stdscr, y_pos + 5, 2, f"Servo 1: {controller.servo1_angle}°")
-        if y_pos + 6 < max_y - 1 and y_pos + 6 < 2 + controls_box_height - 1:
-            safe_addstr(stdscr, y_pos + 6, 2, f"Servo 2: {controller.servo2_angle}°")
-        
-        # Auto-refresh status (only if there's space)
-        if y_pos + 8 < max_y - 1 and y_pos + 8 < 2 + controls_box_height - 1:
-            auto_status = "ON" if controller.auto_refresh else "OFF"
-            auto_color = curses.color_pair(1) if controller.auto_refresh else curses.color_pair(2)
-            safe_addstr(stdscr, y_pos + 8, 2, f"Auto-refresh: {auto_status}", auto_color)
-        
-        # Right column - Sensor Data
-        draw_box(stdscr, 2, 42, 15, 38, "Sensor Readings")
-        
-        # Color sensor
-        safe_addstr(stdscr, 3, 44, "Color Sensor (RGB):", curses.A_BOLD)
-        draw_bar_graph(stdscr, 4, 44, 34, controller.color_data['R'], 300, "R:")
-        draw_bar_graph(stdscr, 5, 44, 34, controller.color_data['G'], 300, "G:")
-        draw_bar_graph(stdscr, 6, 44, 34, controller.color_data['B'], 300, "B:")
-        
-        # IR sensors (analog values)
-        safe_addstr(stdscr, 8, 44, "IR Sensors (Analog):", curses.A_BOLD)
-        ir1_detected = controller.ir_data['IR1'] < controller.ir_threshold
-        ir2_detected = controller.ir_data['IR2'] < controller.ir_threshold
-        ir1_status = "DETECTED" if ir1_detected else "CLEAR"
-        ir2_status = "DETECTED" if ir2_detected else "CLEAR"
-        ir1_color = curses.color_pair(2) if ir1_detected else curses.color_pair(1)
-        ir2_color = curses.color_pair(2) if ir2_detected else curses.color_pair(1)
-        
-        ir1_percent = int((controller.ir_data['IR1'] / 4095.0) * 100)
-        ir2_percent = int((controller.ir_data['IR2'] / 4095.0) * 100)
-        safe_addstr(stdscr, 9, 44, f"IR1: {controller.ir_data['IR1']} ({ir1_percent}%) {ir1_status}", ir1_color)
-        safe_addstr(stdscr, 10, 44, f"IR2: {controller.ir_data['IR2']} ({ir2_percent}%) {ir2_status}", ir2_color)
-        
-        # Ultrasonic
-        safe_addstr(stdscr, 12, 44, "Ultrasonic Distance:", curses.A_BOLD)
-        safe_addstr(stdscr, 13, 44, f"{controller.distance:.1f} cm", curses.color_pair(5))
-        
-        # Bottom - Graphs
-        graph_y = 17
-        if height > 30:
-            draw_box(stdscr, graph_y, 0, height - graph_y - 1, width, "Real-time Data")
-            
-            graph_height = 5
-            
-            # Color history graph
-            if len(controller.color_history['R']) > 0:
-                safe_addstr(stdscr, graph_y + 1, 2, "Color (R/G/B):", curses.A_BOLD)
-                draw_line_graph(stdscr, graph_y + 2, 2, 50, graph_height, 
-                               controller.color_history['R'], max_val=400)
-            
-            # Distance history graph
-            if len(controller.distance_history) > 0:
-                safe_addstr(stdscr, graph_y + 1, 55, "Distance:", curses.A_BOLD)
-                draw_line_graph(stdscr, graph_y + 2, 55, 50, graph_height,
-                               controller.distance_history, max_val=100)
-        
-        # Instructions
-        safe_addstr(stdscr, height - 1, 0, "↑/↓: Navigate | Enter: Execute | +/-: Adjust Speed | q: Quit", 
-                     curses.color_pair(3))
-        
-        stdscr.refresh()
-        
-        # Auto-refresh
-        if controller.auto_refresh and (time.time() - last_auto_refresh) > 1.0:
-            controller.send_command("status")
-            last_auto_refresh = time.time()
+        # Render at most `fps` times per second, independent of input polling
+        now = time.monotonic()
+        if now >= next_frame:
+            dashboard.render()
+            next_frame = now + frame_interval
         
         # Handle input
-        key = stdscr.getch()
-        
-        if key == curses.KEY_UP:
-            selected_option = max(0, selected_option - 1)
-        elif key == curses.KEY_DOWN:
-            selected_option = min(len(menu_options) - 1, selected_option + 1)
-        elif key == ord('+') or key == ord('='):
-            if selected_option < 2:  # Motor A
-                controller.motor_a_speed = min(255, controller.motor_a_speed + 10)
-            elif selected_option < 4:  # Motor B
-                controller.motor_b_speed = min(255, controller.motor_b_speed + 10)
-            elif selected_option < 7:  # Both motors
-                controller.motor_both_speed = min(255, controller.motor_both_speed + 10)
-        elif key == ord('-') or key == ord('_'):
-            if selected_option < 2:  # Motor A
-                controller.motor_a_speed = max(0, controller.motor_a_speed - 10)
-            elif selected_option < 4:  # Motor B
-                controller.motor_b_speed = max(0, controller.motor_b_speed - 10)
-            elif selected_option < 7:  # Both motors
-                controller.motor_both_speed = max(0, controller.motor_both_speed - 10)
-        elif key == ord('\n'):
-            # Execute selected option
-            if selected_option == 0:  # Motor A Forward
-                controller.send_command(f"motor A {controller.motor_a_speed} F")
-            elif selected_option == 1:  # Motor A Backward
-                controller.send_command(f"motor A {controller.motor_a_speed} B")
-            elif selected_option == 2:  # Motor B Forward
-                controller.send_command(f"motor B {controller.motor_b_speed} F")
-            elif selected_option == 3:  # Motor B Backward
-                controller.send_command(f"motor B {controller.motor_b_speed} B")
-            elif selected_option == 4:  # Both Forward
-                controller.send_command(f"motors {controller.motor_both_speed} F")
-            elif selected_option == 5:  # Both Backward
-                controller.send_command(f"motors {controller.motor_both_speed} B")
-            elif selected_option == 6:  # STOP ALL
-                controller.send_command("stop")
-            elif selected_option == 7:  # Servo 1 -10
-                controller.servo1_angle = max(0, controller.servo1_angle - 10)
-                controller.send_command(f"servo 1 {controller.servo1_angle}")
-            elif selected_option == 8:  # Servo 1 +10
-                controller.servo1_angle = min(180, controller.servo1_angle + 10)
-                controller.send_command(f"servo 1 {controller.servo1_angle}")
-            elif selected_option == 9:  # Servo 2 -10
-                controller.servo2_angle = max(0, controller.servo2_angle - 10)
-                controller.send_command(f"servo 2 {controller.servo2_angle}")
-            elif selected_option == 10:  # Servo 2 +10
-                controller.servo2_angle = min(180, controller.servo2_angle + 10)
-                controller.send_command(f"servo 2 {controller.servo2_angle}")
-            elif selected_option == 11:  # Read Color
-                controller.send_command("color")
-            elif selected_option == 12:  # Read IR
-                controller.send_command("ir")
-            elif selected_option == 13:  # Read Distance
-                controller.send_command("ultra")
-            elif selected_option == 14:  # Toggle Auto-refresh
-                controller.auto_refresh = not controller.auto_refresh
-            elif selected_option == 15:  # Quit
-                break
-        elif key == ord('q'):
+        if not handle_dashboard_key(dashboard, stdscr.getch()):
             break
-        
-        time.sleep(0.05)
     
     # Cleanup
+    if dashboard.profiler:
+        dashboard.profiler.stop()
+    if metrics_path:
+        dashboard.dump_metrics(metrics_path)
     controller.disconnect()
 
+def headless_connect(controller, port_spec=None, baudrate=None):
+    """auto_connect() without the menu: the given port, the last port, or the only board found"""
+    if port_spec:
+        return controller.connect(port_spec, baudrate or 9600)
+    ports = controller.get_available_ports()
+    last = load_last_port()
+    if last:
+        port, last_baudrate = last
+        if port in ports and controller.connect(port, baudrate or last_baudrate):
+            if controller.ready:
+                return True
+            controller.disconnect()
+    probes = probe_ports(ports, baudrate or 9600, read_timeout=READ_TIMEOUT)
+    ready = [probe for probe in probes if probe.ready]
+    for probe in probes:
+        if probe.port is not None and len(ready) != 1:
+            probe.port.close()
+    if len(ready) != 1:
+        controller.status_msg = ("No board found" if not ready else
+                                 f"{len(ready)} boards found, pick one with --port")
+        return False
+    return controller.connect(ready[0].spec, baudrate or 9600, opened=ready[0].port,
+                              pending=ready[0].pending)
+
+def wait_prompt(controller, timeout=READY_TIMEOUT):
+    """Wait for the sketch to finish its startup text, which ends with the prompt
+
+    connect() returns at the banner; the help text after it takes over a
+    second at 9600 baud and would hold up the first reply.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        decoder = controller.decoder
+        if decoder is not None and decoder.pending.endswith("> "):
+            return True
+        time.sleep(0.01)
+    return False
+
+def run_headless(script_path, port_spec=None, baudrate=None, record_path=None, results_path=None,
+                 filters=None):
+    """Run a command script without the UI; returns the process exit status
+
+    Prints one line per command as it completes and a summary on stderr.
+    Exits non-zero if any command failed or timed out.
+    """
+    try:
+        if script_path == "-":
+            steps = parse_script(sys.stdin.read())
+        else:
+            with open(script_path) as fh:
+                steps = parse_script(fh.read())
+    except (OSError, ScriptError) as e:
+        print(f"Script error: {e}", file=sys.stderr)
+        return 2
+    
+    controller = ArduinoTerminalController()
+    controller.filters = FilterBank(filters)
+    if not headless_connect(controller, port_spec, baudrate):
+        print(controller.status_msg, file=sys.stderr)
+        return 2
+    print(controller.status_msg, file=sys.stderr)
+    wait_prompt(controller)
+    if record_path:
+        controller.start_recording(record_path)
+    
+    start = time.monotonic()
+    try:
+        results = ScriptRunner(controller).run(
+            steps, on_result=lambda result: print(format_result(result), flush=True))
+    finally:
+        controller.disconnect()
+    summary = summarize(results)
+    summary['seconds'] = time.monotonic() - start
+    print(f"{summary['ok']}/{summary['commands']} ok, {summary['errors']} errors, "
+          f"{summary['timeouts']} timeouts in {summary['seconds']:.2f} s", file=sys.stderr)
+    if results_path:
+        with open(results_path, 'w') as fh:
+            json.dump({'summary': summary, 'results': [r.as_dict() for r in results]}, fh, indent=2)
+    return 0 if summary['ok'] == summary['commands'] else 1
+
 if __name__ == "__main__":
-    curses.wrapper(main)
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Arduino Serial Controller & Visualizer - Terminal Edition")
+    parser.add_argument("--fps", type=float, default=DEFAULT_FPS, help="dashboard frame-rate cap")
+    parser.add_argument("--poll-ms", type=int, default=DEFAULT_POLL_MS, help="keyboard poll interval")
+    parser.add_argument("--record", metavar="FILE", help="log readings and commands to FILE")
+    parser.add_argument("--port", metavar="SPEC",
+                        help="connect without the menu: a serial device, sim:// or replay://FILE "
+                             "(see transport.py)")
+    parser.add_argument("--sim", action="store_const", const=SIM_PORT, dest="port",
+                        help="connect to a simulated board")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="replay a recorded log or raw capture instead of connecting to a board")
+    parser.add_argument("--speed", default="1",
+                        help="replay speed factor, or 'max' (default: 1)")
+    parser.add_argument("--baud", type=int, default=None,
+                        help="baud rate (default: the last one that worked, else 9600)")
+    parser.add_argument("--menu", action="store_true",
+                        help="always show the port menu instead of reconnecting to the last port")
+    parser.add_argument("--profile", action="store_true",
+                        help="sample-profile the controller's threads (shown in the 'i' panel)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write link/pipeline metrics as JSON to FILE on exit")
+    parser.add_argument("--fleet", metavar="GLOB", nargs="?", const="*",
+                        help="fleet mode: connect to every serial port matching GLOB "
+                             "(e.g. '/dev/ttyACM*'; default: all ports)")
+    parser.add_argument("--sim-boards", type=int, default=0, metavar="N",
+                        help="fleet mode with N simulated boards (added to any --fleet ports)")
+    parser.add_argument("--filter", action="append", metavar="CHANNEL=SPEC",
+                        help="ingest filter for ir1, ir2 or distance, e.g. "
+                             "distance=reject:2:400:80,median:5,ema:0.4 or ir1=none (see filters.py)")
+    parser.add_argument("--colors", metavar="FILE",
+                        help="color calibration from 'colors.py calibrate' "
+                             "(default: the src/config.h threshold ranges)")
+    parser.add_argument("--serve", metavar="ADDR",
+                        help="publish readings as JSON lines to local subscribers at ADDR "
+                             "(HOST:PORT, PORT or a Unix socket path); subscribers' lines are "
+                             "sent to the board as commands")
+    parser.add_argument("--serve-metrics", metavar="ADDR",
+                        help="Prometheus metrics address (default: --serve port + 1, or PATH.metrics)")
+    parser.add_argument("--script", metavar="FILE",
+                        help="headless: run the commands in FILE ('-' for stdin) and exit "
+                             "(see script.py for the format)")
+    parser.add_argument("--results", metavar="FILE",
+                        help="with --script, write every command's outcome as JSON to FILE")
+    args = parser.parse_args()
+    try:
+        args.filter = parse_filter_args(args.filter)
+        args.colors = ColorClassifier.load(args.colors) if args.colors else None
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+    if args.replay:
+        args.port = f"replay://{args.replay}?speed={args.speed}"
+    if args.script:
+        sys.exit(run_headless(args.script, args.port, args.baud, args.record, args.results,
+                              args.filter))
+    if args.fleet or args.sim_boards:
+        ports = fleet_ports(args.fleet) if args.fleet else []
+        ports += [f"{SIM_PORT}?seed={i + 1}" for i in range(args.sim_boards)]
+        curses.wrapper(fleet_main, ports, args.fps, args.poll_ms)
+    else:
+        curses.wrapper(main, args.fps, args.poll_ms, args.record, args.port, args.baud, args.menu,
+                       args.profile, args.metrics, args.filter, args.colors, args.serve,
+                       args.serve_metrics)
\ No newline at end of file
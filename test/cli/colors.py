@@ -0,0 +1,337 @@
+"""
+Calibrated color classification for the Arduino CLI controller
+Turns TCS3200 pulse widths into the named course colors the robot logic
+uses (src/sensors.h). Classes are built from the output of
+Calibration/color_sensor_calibration.ino; every quantized RGB cell is
+classified up front, so a reading costs one table lookup.
+
+Usage:
+    python colors.py calibrate RED=red.txt GREEN=green.txt ... [-o colors.json]
+    python colors.py classify run.tlm [--calibration colors.json]
+"""
+
+import json
+import math
+import re
+import time
+from array import array
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+from recorder import KIND_COLOR, TelemetryLog
+
+# Threshold ranges from src/config.h; without a calibration file each class
+# is centered on its range, which spans about +-2 standard deviations
+CONFIG_RANGES = {
+    'BLACK': ((0, 50), (0, 50), (0, 50)),
+    'GREEN': ((50, 100), (100, 200), (50, 100)),
+    'RED': ((150, 255), (0, 80), (0, 80)),
+    'BLUE': ((0, 80), (0, 100), (150, 255)),
+    'WHITE': ((200, 255), (200, 255), (200, 255)),
+}
+
+UNKNOWN = 'UNKNOWN'
+
+# Lookup table cell size and covered range, in pulse-width units; larger
+# readings share the last cell
+DEFAULT_STEP = 16
+VALUE_RANGE = 512
+
+# Readings further than this (RMS standard deviations per channel) from
+# every class are UNKNOWN
+UNKNOWN_SIGMA = 4.0
+
+# A class whose recent readings sit this far from its calibration mean has drifted
+DRIFT_SIGMA = 1.5
+DRIFT_ALPHA = 0.05
+
+# Smallest spread assumed for a class, so a calibration from a handful of
+# identical readings doesn't make the class impossibly narrow
+MIN_STD = 3.0
+
+# confidence is the probability of `color` among the classes (0 for UNKNOWN);
+# distance is the RMS number of standard deviations from the nearest class mean
+Classification = namedtuple('Classification', 'color confidence distance')
+
+# Calibration sketch ("R=180  G=45  B=50") and CLI sketch ("R: 180  G: 45  B: 50") lines
+_RGB_LINE = re.compile(r'R[=:]\s*(\d+)\s+G[=:]\s*(\d+)\s+B[=:]\s*(\d+)')
+
+
+class ColorClass:
+    """Mean and standard deviation of one color's pulse widths (R, G, B)"""
+    __slots__ = ('name', 'mean', 'std', 'samples')
+
+    def __init__(self, name, mean, std, samples=0):
+        self.name = name
+        self.mean = tuple(float(v) for v in mean)
+        self.std = tuple(max(MIN_STD, float(v)) for v in std)
+        self.samples = samples
+
+    @classmethod
+    def from_samples(cls, name, samples):
+        samples = list(samples)
+        if not samples:
+            raise ValueError(f"no readings for {name}")
+        n = len(samples)
+        mean = [sum(s[i] for s in samples) / n for i in range(3)]
+        std = [math.sqrt(sum((s[i] - mean[i]) ** 2 for s in samples) / n) for i in range(3)]
+        return cls(name, mean, std, n)
+
+    @classmethod
+    def from_range(cls, name, ranges):
+        return cls(name, [(lo + hi) / 2.0 for lo, hi in ranges],
+                   [(hi - lo) / 4.0 for lo, hi in ranges])
+
+    def distance(self, r, g, b):
+        """RMS standard deviations between a reading and this class's mean"""
+        (mr, mg, mb), (sr, sg, sb) = self.mean, self.std
+        return math.sqrt((((r - mr) / sr) ** 2 + ((g - mg) / sg) ** 2 + ((b - mb) / sb) ** 2) / 3.0)
+
+    def as_dict(self):
+        return {'mean': list(self.mean), 'std': list(self.std), 'samples': self.samples}
+
+
+def parse_calibration_output(text):
+    """RGB triples from captured calibration (or CLI sketch) output"""
+    return [tuple(int(v) for v in m.groups()) for m in _RGB_LINE.finditer(text)]
+
+
+def _confidences(distances):
+    """Class probabilities from distances, for equal priors and Gaussian classes"""
+    # Squared distances are per channel; times 3 gives the full chi-square
+    weights = [math.exp(-1.5 * (d * d - min(distances) ** 2)) for d in distances]
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+class ColorClassifier:
+    """Nearest-class color classifier with a precomputed lookup table
+
+    classify() quantizes a reading to `step`-sized cells and looks up the
+    class, confidence and distance computed for the cell's center when the
+    classifier was built. scores() computes exact per-class confidences.
+    """
+    def __init__(self, classes, step=DEFAULT_STEP, unknown_sigma=UNKNOWN_SIGMA):
+        if not classes:
+            raise ValueError("a classifier needs at least one color class")
+        self.classes = list(classes)
+        self.names = [c.name for c in self.classes] + [UNKNOWN]
+        self.step = int(step)
+        self.unknown_sigma = unknown_sigma
+        self.cells = -(-VALUE_RANGE // self.step)
+        self._build()
+
+    @classmethod
+    def default(cls, **kwargs):
+        """Classifier for the src/config.h threshold ranges"""
+        return cls([ColorClass.from_range(name, ranges) for name, ranges in CONFIG_RANGES.items()],
+                   **kwargs)
+
+    @classmethod
+    def from_captures(cls, captures, **kwargs):
+        """Build from {color name: calibration sketch output text}"""
+        return cls([ColorClass.from_samples(name.upper(), parse_calibration_output(text))
+                    for name, text in captures.items()], **kwargs)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Read a calibration written by save()"""
+        with open(path) as fh:
+            data = json.load(fh)
+        kwargs.setdefault('step', data.get('step', DEFAULT_STEP))
+        return cls([ColorClass(name, c['mean'], c['std'], c.get('samples', 0))
+                    for name, c in data['classes'].items()], **kwargs)
+
+    def save(self, path):
+        with open(path, 'w') as fh:
+            json.dump({'step': self.step,
+                       'classes': {c.name: c.as_dict() for c in self.classes}}, fh, indent=2)
+
+    def _build(self):
+        """Classify the center of every cell
+
+        Per-channel squared terms are computed once per class and cell
+        index, so each cell costs one addition per class.
+        """
+        n = self.cells
+        centers = [(i + 0.5) * self.step for i in range(n)]
+        terms = [[[((x - c.mean[ch]) / c.std[ch]) ** 2 for x in centers] for ch in range(3)]
+                 for c in self.classes]
+        unknown = len(self.classes)
+        limit = 3.0 * self.unknown_sigma ** 2
+        label = array('B', bytes(n ** 3))
+        confidence = array('B', bytes(n ** 3))
+        distance = array('B', bytes(n ** 3))
+        i = 0
+        for ri in range(n):
+            rows = [t[0][ri] for t in terms]
+            for gi in range(n):
+                rowg = [rows[k] + terms[k][1][gi] for k in range(unknown)]
+                for bi in range(n):
+                    sq = [rowg[k] + terms[k][2][bi] for k in range(unknown)]
+                    best = min(sq)
+                    k = sq.index(best)
+                    total = sum(math.exp(-0.5 * (s - best)) for s in sq)
+                    if best <= limit:
+                        label[i] = k
+                        confidence[i] = int(255 / total + 0.5)
+                    else:
+                        label[i] = unknown
+                    # Sixteenths of a standard deviation, saturating at 255
+                    distance[i] = min(255, int(math.sqrt(best / 3.0) * 16))
+                    i += 1
+        self._label = label
+        self._confidence = confidence
+        self._distance = distance
+
+    def _cell(self, r, g, b):
+        step, top = self.step, self.cells - 1
+        ri = min(top, max(0, int(r) // step))
+        gi = min(top, max(0, int(g) // step))
+        bi = min(top, max(0, int(b) // step))
+        return (ri * self.cells + gi) * self.cells + bi
+
+    def classify(self, r, g, b):
+        """Classification of one reading from the lookup table"""
+        i = self._cell(r, g, b)
+        return Classification(self.names[self._label[i]], self._confidence[i] / 255.0,
+                              self._distance[i] / 16.0)
+
+    def classify_many(self, reds, greens, blues):
+        """Class index (into `names`) and confidence per reading, for whole columns"""
+        step, top, n = self.step, self.cells - 1, self.cells
+        label, confidence = self._label, self._confidence
+        labels = array('B')
+        confidences = array('f')
+        for r, g, b in zip(reds, greens, blues):
+            i = ((min(top, max(0, int(r) // step)) * n + min(top, max(0, int(g) // step))) * n
+                 + min(top, max(0, int(b) // step)))
+            labels.append(label[i])
+            confidences.append(confidence[i] / 255.0)
+        return labels, confidences
+
+    def scores(self, r, g, b):
+        """Exact confidence per class for one reading"""
+        distances = [c.distance(r, g, b) for c in self.classes]
+        return dict(zip((c.name for c in self.classes), _confidences(distances)))
+
+
+@lru_cache(maxsize=None)
+def default_classifier():
+    """ColorClassifier.default(), built once and shared by every controller"""
+    return ColorClassifier.default()
+
+
+class DriftMonitor:
+    """Track how far live readings have moved from the calibration
+
+    Keeps a moving average of the readings assigned to each class; a class
+    is drifting when that average sits more than DRIFT_SIGMA of the class's
+    spread from its calibrated mean (lighting changed, sensor height moved),
+    long before readings start falling out as UNKNOWN.
+    """
+    def __init__(self, classifier, alpha=DRIFT_ALPHA, limit=DRIFT_SIGMA):
+        self.classifier = classifier
+        self.alpha = alpha
+        self.limit = limit
+        self.averages = {}
+        self.unknown_rate = 0.0
+
+    def update(self, reading, classification):
+        alpha = self.alpha
+        unknown = classification.color == UNKNOWN
+        self.unknown_rate += alpha * ((1.0 if unknown else 0.0) - self.unknown_rate)
+        if unknown:
+            return
+        average = self.averages.get(classification.color)
+        if average is None:
+            self.averages[classification.color] = list(reading)
+        else:
+            for ch in range(3):
+                average[ch] += alpha * (reading[ch] - average[ch])
+
+    def drift(self):
+        """{color: RMS standard deviations between recent readings and the calibration}"""
+        classes = {c.name: c for c in self.classifier.classes}
+        return {name: classes[name].distance(*average) for name, average in self.averages.items()}
+
+    @property
+    def drifted(self):
+        """Names of the classes that drifted, plus UNKNOWN when many readings fit no class"""
+        names = sorted(name for name, d in self.drift().items() if d > self.limit)
+        if self.unknown_rate > 0.2:
+            names.append(UNKNOWN)
+        return names
+
+
+def classify_log(log, classifier, t0=float('-inf'), t1=float('inf')):
+    """Classify every color reading of a TelemetryLog
+
+    Returns (times, labels, confidences); labels index classifier.names.
+    """
+    times, reds = log.series(KIND_COLOR, 'v0', t0, t1)
+    _, greens = log.series(KIND_COLOR, 'v1', t0, t1)
+    _, blues = log.series(KIND_COLOR, 'v2', t0, t1)
+    labels, confidences = classifier.classify_many(reds, greens, blues)
+    return times, labels, confidences
+
+
+def main():
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Calibrate the color classifier or classify a recorded log")
+    sub = ap.add_subparsers(dest='action', required=True)
+    cal = sub.add_parser('calibrate', help="build a calibration from color_sensor_calibration.ino output")
+    cal.add_argument('captures', nargs='+', metavar="COLOR=FILE",
+                     help="serial output captured while pointing the sensor at COLOR")
+    cal.add_argument('-o', '--output', default='colors.json')
+    cal.add_argument('--step', type=int, default=DEFAULT_STEP, help="lookup table cell size")
+    cls = sub.add_parser('classify', help="classify the color readings of a telemetry log")
+    cls.add_argument('log')
+    cls.add_argument('--calibration', metavar="FILE",
+                     help="calibration from 'calibrate' (default: the src/config.h ranges)")
+    args = ap.parse_args()
+
+    if args.action == 'calibrate':
+        captures = {}
+        for item in args.captures:
+            name, sep, path = item.partition('=')
+            if not sep:
+                ap.error(f"expected COLOR=FILE, got {item!r}")
+            with open(path) as fh:
+                captures[name] = fh.read()
+        try:
+            classifier = ColorClassifier.from_captures(captures, step=args.step)
+        except ValueError as e:
+            ap.error(str(e))
+        classifier.save(args.output)
+        for c in classifier.classes:
+            others = [o for o in classifier.classes if o is not c]
+            nearest = min((o.distance(*c.mean), o.name) for o in others) if others else None
+            line = (f"{c.name:<8} n={c.samples:<4} mean {c.mean[0]:6.1f} {c.mean[1]:6.1f} {c.mean[2]:6.1f}"
+                    f"  std {c.std[0]:5.1f} {c.std[1]:5.1f} {c.std[2]:5.1f}")
+            if nearest:
+                line += f"  nearest {nearest[1]} at {nearest[0]:.1f} sd"
+            print(line)
+        print(f"Calibration written to {args.output}")
+        return
+
+    start = time.perf_counter()
+    classifier = (ColorClassifier.load(args.calibration) if args.calibration
+                  else ColorClassifier.default())
+    built = time.perf_counter() - start
+    with TelemetryLog(args.log) as log:
+        start = time.perf_counter()
+        times, labels, confidences = classify_log(log, classifier)
+        elapsed = time.perf_counter() - start
+    counts = Counter(labels)
+    print(f"{len(labels)} color readings classified in {elapsed * 1000:.1f} ms "
+          f"(table built in {built * 1000:.0f} ms)")
+    for index, name in enumerate(classifier.names):
+        if counts[index]:
+            mean = sum(c for c, l in zip(confidences, labels) if l == index) / counts[index]
+            print(f"{name:<8} {counts[index]:>7}  mean confidence {mean * 100:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Command queue and writers for the Arduino CLI controller
+Keeps serial writes off the UI thread (or out of the event loop's way) and
+drops commands that a newer one supersedes
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Commands that must jump ahead of everything else in the queue
+PRIORITY_COMMANDS = ("stop",)
+
+
+def command_key(command):
+    """Return the coalescing key for a command
+
+    Commands with the same key target the same actuator (or are the same
+    query), so only the most recent one needs to reach the board.
+    """
+    parts = command.strip().lower().split()
+    if not parts:
+        return ""
+    if parts[0] in ("motor", "servo", "sub") and len(parts) > 1:
+        return f"{parts[0]} {parts[1]}"
+    if parts[0] == "motors":
+        return "motors"
+    return " ".join(parts)
+
+
+# Commands the sketch answers with an acknowledgement or error line (the
+# sensor reads answer with readings instead)
+ACKNOWLEDGED_COMMANDS = ("motor", "motors", "stop", "servo", "binary", "sub", "unsub")
+
+
+def expects_reply(command):
+    """True if the sketch answers `command` with a Reply line"""
+    parts = command.split(None, 1)
+    return bool(parts) and parts[0].lower() in ACKNOWLEDGED_COMMANDS
+
+
+def supersedes(key, pending_key):
+    """Check whether a command with `key` makes a pending command redundant"""
+    if key == pending_key:
+        return True
+    # Driving (or stopping) both motors overrides any single-motor command
+    if key in ("motors", "stop"):
+        return pending_key.startswith("motor ") or pending_key == "motors"
+    if key == "unsub":
+        return pending_key.startswith("sub ")
+    return False
+
+
+class PendingCommand:
+    """A command waiting to be written, with its enqueue timestamp"""
+    __slots__ = ("text", "key", "enqueued_at")
+
+    def __init__(self, text, key, enqueued_at):
+        self.text = text
+        self.key = key
+        self.enqueued_at = enqueued_at
+
+
+class CoalescingQueue:
+    """Bounded command queue that keeps only the latest command per actuator
+
+    Not thread-safe; CommandQueue adds locking around it. `on_discard` is
+    called with each PendingCommand removed without being sent.
+    """
+    def __init__(self, maxsize=32, on_discard=None):
+        self.maxsize = maxsize
+        self.on_discard = on_discard
+        self._urgent = deque()
+        self._pending = OrderedDict()
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._urgent) + len(self._pending)
+
+    def put(self, command, now=None):
+        """Add a command, replacing or removing any command it supersedes
+
+        Returns the queued PendingCommand that will carry this command (an
+        identical urgent command already waiting is reused), or None for an
+        empty command.
+        """
+        if now is None:
+            now = time.monotonic()
+        key = command_key(command)
+        if not key:
+            return None
+
+        for pending_key in [k for k in self._pending if supersedes(key, k)]:
+            self._discard(self._pending.pop(pending_key))
+            self.coalesced += 1
+
+        if key in PRIORITY_COMMANDS:
+            for pending in self._urgent:
+                if pending.key == key:
+                    self.coalesced += 1
+                    return pending
+            item = PendingCommand(command, key, now)
+            self._urgent.append(item)
+            return item
+
+        item = PendingCommand(command, key, now)
+        self._pending[key] = item
+        # Full queue: shed the oldest regular command rather than block the caller
+        while len(self._pending) > self.maxsize:
+            self._discard(self._pending.popitem(last=False)[1])
+            self.dropped += 1
+        return item
+
+    def _discard(self, item):
+        if self.on_discard:
+            self.on_discard(item)
+
+    def pop(self):
+        """Remove and return the next command to send, or None if empty"""
+        if self._urgent:
+            return self._urgent.popleft()
+        if self._pending:
+            return self._pending.popitem(last=False)[1]
+        return None
+
+    def clear(self):
+        """Discard all pending commands"""
+        for item in list(self._urgent) + list(self._pending.values()):
+            self._discard(item)
+        self._urgent.clear()
+        self._pending.clear()
+
+
+class CommandQueue:
+    """Thread-safe wrapper around CoalescingQueue"""
+    def __init__(self, maxsize=32):
+        self._queue = CoalescingQueue(maxsize)
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue)
+
+    @property
+    def coalesced(self):
+        return self._queue.coalesced
+
+    @property
+    def dropped(self):
+        return self._queue.dropped
+
+    def put(self, command):
+        """Enqueue a command without blocking"""
+        with self._cond:
+            self._queue.put(command)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Wait up to `timeout` seconds for the next command"""
+        with self._cond:
+            if not len(self._queue):
+                self._cond.wait(timeout)
+            return self._queue.pop()
+
+    def clear(self):
+        with self._cond:
+            self._queue.clear()
+
+    def wake(self):
+        """Release a thread blocked in get()"""
+        with self._cond:
+            self._cond.notify_all()
+
+
+class LatencyTracker:
+    """Keep recent enqueue-to-wire latencies and summarize them"""
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.last = None
+
+    def add(self, latency):
+        self.last = latency
+        self.samples.append(latency)
+
+    def percentile(self, pct):
+        """Return the given percentile (0-100) of recent latencies, in seconds"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CommandWriter:
+    """Dedicated thread that drains a CommandQueue onto the serial port"""
+    def __init__(self, get_port, on_sent=None, on_error=None, maxsize=32):
+        self.get_port = get_port
+        self.on_sent = on_sent
+        self.on_error = on_error
+        self.queue = CommandQueue(maxsize)
+        self.latency = LatencyTracker()
+        self.sent = 0
+        # Commands taken off the queue but not written (no port, write error)
+        self.failed = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="command-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=0.5):
+        self.running = False
+        self.queue.wake()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def submit(self, command):
+        """Queue a command for sending; never blocks"""
+        self.queue.put(command)
+
+    def run(self):
+        while self.running:
+            item = self.queue.get(timeout=0.5)
+            if item is None:
+                continue
+            try:
+                port = self.get_port()
+                if port is None:
+                    # Link is down (e.g. reconnecting); a stale command is not resent later
+                    raise ConnectionError("port not open")
+                port.write(f"{item.text}\n".encode())
+                # Wait for the bytes to leave the UART so latency means "on the wire"
+                port.flush()
+            except Exception as e:
+                self.failed += 1
+                if self.on_error:
+                    self.on_error(item.text, e)
+                continue
+            latency = time.monotonic() - item.enqueued_at
+            self.latency.add(latency)
+            self.sent += 1
+            if self.on_sent:
+                self.on_sent(item.text, latency)
+
+
+class AsyncCommandWriter:
+    """Event-loop counterpart of CommandWriter
+
+    `write` is a coroutine function that puts bytes on the wire. submit()
+    returns a future that resolves to the queue-to-wire latency, or to None
+    when the command was superseded, shed or could not be written (write
+    errors go to `on_error`).
+    """
+    def __init__(self, write, on_sent=None, on_error=None, maxsize=32):
+        self.write = write
+        self.on_sent = on_sent
+        self.on_error = on_error
+        self.queue = CoalescingQueue(maxsize, on_discard=self._resolve)
+        self.latency = LatencyTracker()
+        self.sent = 0
+        # Commands that could not be written
+        self.failed = 0
+        self.task = None
+        self._waiters = {}
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.queue.clear()
+        for item in list(self._waiters):
+            self._resolve(item)
+
+    def submit(self, command):
+        """Queue a command; returns a future for its latency"""
+        future = asyncio.get_running_loop().create_future()
+        item = self.queue.put(command)
+        if item is None:
+            future.set_result(None)
+            return future
+        self._waiters.setdefault(item, []).append(future)
+        self._wakeup.set()
+        return future
+
+    def _resolve(self, item, result=None):
+        for future in self._waiters.pop(item, ()):
+            if not future.done():
+                future.set_result(result)
+
+    async def run(self):
+        while True:
+            item = self.queue.pop()
+            if item is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                await self.write(f"{item.text}\n".encode())
+            except OSError as e:
+                self.failed += 1
+                self._resolve(item)
+                if self.on_error:
+                    self.on_error(item.text, e)
+                continue
+            latency = time.monotonic() - item.enqueued_at
+            self.latency.add(latency)
+            self.sent += 1
+            self._resolve(item, latency)
+            if self.on_sent:
+                self.on_sent(item.text, latency)
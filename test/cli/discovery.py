@@ -0,0 +1,99 @@
+"""
+Finding and reconnecting to boards for the Arduino CLI controller
+Readiness detection (banner or prompt instead of a fixed delay), concurrent
+probing of candidate ports, and the last-good-port cache used to skip the
+port menu on the next launch.
+"""
+
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import ReadyDetector
+from transport import open_transport
+
+# Longest wait for the banner or prompt after opening a port; boards that
+# don't reset on open never print either, so this is also the fallback delay
+READY_TIMEOUT = 2.0
+
+# Read timeout while waiting for the banner
+PROBE_READ_TIMEOUT = 0.05
+
+CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                          'arduino-cli-control', 'last_port.json')
+
+# port: the opened transport (left open when the sketch answered, else None);
+# pending: bytes read after the banner, for the controller's decoder
+ProbeResult = namedtuple('ProbeResult', 'spec baudrate ready seconds port error pending',
+                         defaults=(b'',))
+
+
+def wait_ready(port, timeout=READY_TIMEOUT):
+    """Read from `port` until the sketch shows it is running
+
+    Returns (ready, pending): pending is what was read after the banner or
+    prompt (everything read, if neither showed up), which the caller feeds
+    to its decoder before reading on. Uses the port's own read timeout for
+    each read, so the deadline can be overshot by at most one read.
+    """
+    detector = ReadyDetector()
+    seen = bytearray()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = port.read(port.in_waiting or 1)
+        if data and detector.feed(data):
+            return True, detector.rest
+        seen += data
+    return False, bytes(seen)
+
+
+def probe_port(spec, baudrate=9600, timeout=READY_TIMEOUT, read_timeout=PROBE_READ_TIMEOUT):
+    """Open one port and wait for the sketch; the port stays open if it answered"""
+    start = time.monotonic()
+    try:
+        port = open_transport(spec, baudrate, timeout=read_timeout)
+    except Exception as e:
+        return ProbeResult(spec, baudrate, False, time.monotonic() - start, None, str(e))
+    try:
+        ready, pending = wait_ready(port, timeout)
+    except Exception as e:
+        port.close()
+        return ProbeResult(spec, baudrate, False, time.monotonic() - start, None, str(e))
+    if not ready:
+        port.close()
+        port = None
+        pending = b''
+    return ProbeResult(spec, baudrate, ready, time.monotonic() - start, port, None, pending)
+
+
+def probe_ports(specs, baudrate=9600, timeout=READY_TIMEOUT, read_timeout=PROBE_READ_TIMEOUT):
+    """Probe all ports at once; returns ProbeResults in the order given
+
+    Total time is that of the slowest port, not the sum. Callers close the
+    `port` of every ready result they don't keep.
+    """
+    if not specs:
+        return []
+    with ThreadPoolExecutor(max_workers=len(specs)) as pool:
+        return list(pool.map(lambda spec: probe_port(spec, baudrate, timeout, read_timeout), specs))
+
+
+def load_last_port(path=CACHE_PATH):
+    """(port, baudrate) of the last successful connection, or None"""
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+        return data['port'], int(data['baudrate'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_last_port(port, baudrate, path=CACHE_PATH):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fh:
+            json.dump({'port': port, 'baudrate': baudrate}, fh)
+    except OSError:
+        pass
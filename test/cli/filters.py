@@ -0,0 +1,356 @@
+"""
+Streaming sensor filters for the Arduino CLI controller
+Composable per-channel stages (outlier rejection, running median, EMA) and
+a hysteresis detector, each constant work per sample, applied on the ingest
+path and, a whole column at a time, to recorded logs.
+
+Usage:
+    python filters.py run.tlm [--filter distance=reject:2:400:80,median:5]
+"""
+
+import inspect
+import time
+from bisect import bisect_left, insort
+from collections import deque
+
+from recorder import KIND_IR1, KIND_IR2, KIND_DISTANCE, TelemetryLog
+
+# The sketch sends IR as digitalRead() levels: LOW (0) over the line,
+# HIGH (1) otherwise. Detection switches on at 0 and off again above 0.5.
+IR_ON = 0
+IR_OFF = 0.5
+
+# Filter spec per channel: comma-separated stages, arguments after ':'.
+# readUltrasonic() warns about readings outside 2-400 cm; those and sudden
+# jumps are dropped before smoothing.
+DEFAULT_FILTERS = {
+    'ir1': f"median:3,hysteresis:{IR_ON}:{IR_OFF}",
+    'ir2': f"median:3,hysteresis:{IR_ON}:{IR_OFF}",
+    'distance': "reject:2:400:80,median:5,ema:0.4",
+}
+
+# Log row kind of each channel
+CHANNEL_KINDS = {'ir1': KIND_IR1, 'ir2': KIND_IR2, 'distance': KIND_DISTANCE}
+
+# Channels that report detection even without a hysteresis stage, straight
+# from the (filtered) digital level
+DIGITAL_CHANNELS = ('ir1', 'ir2')
+
+
+class Median:
+    """Median of the last `size` samples
+
+    A sorted copy of the window is kept up to date with one removal and one
+    insertion, so the cost per sample depends on the (small, fixed) window
+    only.
+    """
+    def __init__(self, size=5):
+        self.size = max(1, int(size))
+        self.reset()
+
+    def reset(self):
+        self._window = deque()
+        self._sorted = []
+
+    def update(self, value):
+        window = self._window
+        ordered = self._sorted
+        if len(window) == self.size:
+            del ordered[bisect_left(ordered, window.popleft())]
+        window.append(value)
+        insort(ordered, value)
+        return ordered[len(ordered) // 2]
+
+    def process(self, values):
+        update = self.update
+        return [None if v is None else update(v) for v in values]
+
+
+class EMA:
+    """Exponential moving average; `alpha` is the weight of a new sample"""
+    def __init__(self, alpha=0.3):
+        self.alpha = float(alpha)
+        self.reset()
+
+    def reset(self):
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+    def process(self, values):
+        alpha = self.alpha
+        y = self.value
+        out = []
+        for v in values:
+            if v is not None:
+                y = v if y is None else y + alpha * (v - y)
+                v = y
+            out.append(v)
+        self.value = y
+        return out
+
+
+class Reject:
+    """Drop samples outside [low, high] or more than `jump` from the last kept one
+
+    A real step (an obstacle moving in) looks like a jump too, so after
+    `max_run` rejected jumps in a row the next sample is accepted. Rejected
+    samples come out as None.
+    """
+    def __init__(self, low=None, high=None, jump=None, max_run=3):
+        self.low = low
+        self.high = high
+        self.jump = jump
+        self.max_run = int(max_run)
+        self.reset()
+
+    def reset(self):
+        self.last = None
+        self.run = 0
+        self.rejected = 0
+
+    def update(self, value):
+        if (self.low is not None and value < self.low) or (self.high is not None and value > self.high):
+            self.rejected += 1
+            return None
+        if (self.jump is not None and self.last is not None and abs(value - self.last) > self.jump
+                and self.run < self.max_run):
+            self.run += 1
+            self.rejected += 1
+            return None
+        self.run = 0
+        self.last = value
+        return value
+
+    def process(self, values):
+        update = self.update
+        return [None if v is None else update(v) for v in values]
+
+
+class Hysteresis:
+    """Two-threshold detector: on at or below `on`, off again above `off`
+
+    Matches the IR sensors, which read low over the line. Noise that
+    crosses one threshold doesn't toggle the decision.
+    """
+    def __init__(self, on=IR_ON, off=IR_OFF):
+        if off < on:
+            raise ValueError("hysteresis 'off' threshold must not be below 'on'")
+        self.on = on
+        self.off = off
+        self.reset()
+
+    def reset(self):
+        self.state = False
+        self.changes = 0
+
+    def update(self, value):
+        if self.state:
+            if value > self.off:
+                self.state = False
+                self.changes += 1
+        elif value <= self.on:
+            self.state = True
+            self.changes += 1
+        return self.state
+
+    def process(self, values):
+        update = self.update
+        out = []
+        for v in values:
+            out.append(self.state if v is None else update(v))
+        return out
+
+
+# Spec names of the stages
+STAGES = {'median': Median, 'ema': EMA, 'reject': Reject, 'hysteresis': Hysteresis}
+
+
+def _parse_stage(text):
+    name, _, args = text.strip().partition(':')
+    cls = STAGES.get(name.strip().lower())
+    if cls is None:
+        raise ValueError(f"unknown filter stage {name!r} (expected one of {', '.join(STAGES)})")
+    params = list(inspect.signature(cls).parameters)
+    values = args.split(':') if args else []
+    if len(values) > len(params):
+        raise ValueError(f"too many arguments for {name!r} (takes {', '.join(params)})")
+    # Empty arguments keep their default ("reject::400" has no lower bound)
+    return cls(**{param: float(value) for param, value in zip(params, values) if value.strip()})
+
+
+class ChannelFilter:
+    """Value stages followed by an optional hysteresis detector
+
+    update() returns the filtered value, or None when the sample was
+    rejected; `value` and `detected` hold the latest results. A `digital`
+    channel without a detector is detected whenever its value is LOW.
+    """
+    def __init__(self, spec="", digital=False):
+        self.spec = spec
+        self.digital = digital
+        self.stages = []
+        self.detector = None
+        for part in spec.split(','):
+            if not part.strip() or part.strip().lower() == 'none':
+                continue
+            stage = _parse_stage(part)
+            if isinstance(stage, Hysteresis):
+                self.detector = stage
+            else:
+                self.stages.append(stage)
+        self.value = None
+        self.samples = 0
+        self.dropped = 0
+
+    @property
+    def detected(self):
+        if self.detector:
+            return self.detector.state
+        if self.digital and self.value is not None:
+            return self.value <= IR_ON
+        return None
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+        if self.detector:
+            self.detector.reset()
+        self.value = None
+
+    def update(self, value):
+        self.samples += 1
+        for stage in self.stages:
+            value = stage.update(value)
+            if value is None:
+                self.dropped += 1
+                return None
+        if self.detector:
+            self.detector.update(value)
+        self.value = value
+        return value
+
+    def process(self, values):
+        """Filter a whole column; returns (filtered, detected) lists aligned with `values`
+
+        Rejected samples are None in `filtered`; `detected` is None without
+        a detector (on a non-digital channel). The filter state carries
+        over, as if the samples had arrived one by one.
+        """
+        values = list(values)
+        for stage in self.stages:
+            values = stage.process(values)
+        if self.detector:
+            detected = self.detector.process(values)
+        elif self.digital:
+            state = self.detected
+            detected = []
+            for v in values:
+                if v is not None:
+                    state = v <= IR_ON
+                detected.append(state)
+        else:
+            detected = None
+        self.samples += len(values)
+        self.dropped += values.count(None)
+        for v in reversed(values):
+            if v is not None:
+                self.value = v
+                break
+        return values, detected
+
+
+class FilterBank:
+    """A ChannelFilter per channel ('ir1', 'ir2', 'distance')
+
+    Channels without a spec pass samples through unchanged.
+    """
+    def __init__(self, specs=None):
+        self.specs = dict(DEFAULT_FILTERS)
+        if specs:
+            self.specs.update(specs)
+        self.channels = {name: ChannelFilter(spec, name in DIGITAL_CHANNELS)
+                         for name, spec in self.specs.items()}
+
+    def update(self, channel, value):
+        """Filter one sample; returns the filtered value or None if rejected"""
+        filt = self.channels.get(channel)
+        return value if filt is None else filt.update(value)
+
+    def detected(self, channel):
+        filt = self.channels.get(channel)
+        return filt.detected if filt else None
+
+    def reset(self):
+        for filt in self.channels.values():
+            filt.reset()
+
+
+def parse_filter_args(items):
+    """Turn CHANNEL=SPEC strings (from --filter) into a specs dict"""
+    specs = {}
+    for item in items or ():
+        channel, sep, spec = item.partition('=')
+        channel = channel.strip().lower()
+        if not sep or channel not in CHANNEL_KINDS:
+            raise ValueError(f"expected CHANNEL=SPEC with CHANNEL one of "
+                             f"{', '.join(CHANNEL_KINDS)}, got {item!r}")
+        ChannelFilter(spec)  # validate now rather than on the first sample
+        specs[channel] = spec
+    return specs
+
+
+def filter_log(log, specs=None, t0=float('-inf'), t1=float('inf')):
+    """Run a FilterBank over a TelemetryLog one column at a time
+
+    Returns {channel: (times, raw, filtered, detected)}.
+    """
+    bank = FilterBank(specs)
+    out = {}
+    for channel, kind in CHANNEL_KINDS.items():
+        times, raw = log.series(kind, t0=t0, t1=t1)
+        filtered, detected = bank.channels[channel].process(raw)
+        out[channel] = (times, raw, filtered, detected)
+    return out
+
+
+def main():
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Apply the ingest filters to a recorded telemetry log")
+    ap.add_argument('log')
+    ap.add_argument('--filter', action='append', metavar="CHANNEL=SPEC",
+                    help="override a channel's filter, e.g. distance=median:5,ema:0.3 "
+                         "(stages: " + ", ".join(STAGES) + ")")
+    args = ap.parse_args()
+    try:
+        specs = parse_filter_args(args.filter)
+    except ValueError as e:
+        ap.error(str(e))
+
+    with TelemetryLog(args.log) as log:
+        start = time.perf_counter()
+        results = filter_log(log, specs)
+        elapsed = time.perf_counter() - start
+    total = 0
+    for channel, (times, raw, filtered, detected) in results.items():
+        total += len(raw)
+        kept = [v for v in filtered if v is not None]
+        line = f"{channel:<9} {len(raw):>8} samples, {len(raw) - len(kept):>6} rejected"
+        if kept:
+            line += f", raw {min(raw):.1f}-{max(raw):.1f}, filtered {min(kept):.1f}-{max(kept):.1f}"
+        if detected:
+            changes = sum(1 for a, b in zip(detected, detected[1:]) if a != b)
+            line += f", {changes} detection changes"
+        print(line)
+    rate = total / elapsed if elapsed else 0.0
+    print(f"{total} samples in {elapsed * 1000:.1f} ms ({rate:.0f} samples/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+asyncio controller core for the Arduino CLI controller
+One event loop drives many boards: each port is served non-blocking from the
+loop (transport.SerialStream) and each board keeps its own decoder, parser,
+history and command queue, so no state is shared between threads.
+
+    fleet = Fleet(["/dev/ttyACM0", "/dev/ttyACM1"])
+    await fleet.connect()
+    await fleet.controllers[0].send("servo 1 90")
+    async for board, reading in fleet.stream():
+        ...
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from commands import AsyncCommandWriter, LatencyTracker, expects_reply
+from discovery import READY_TIMEOUT
+from metrics import PipelineMetrics
+from sensors import SensorState
+from streaming import SubscriptionManager, DEFAULT_RATES
+from telemetry import StreamDecoder, TextParser, ReadyDetector
+from transport import SerialStream, open_transport
+
+# Samples kept per channel and board: about 13 minutes at 20 Hz
+FLEET_HISTORY = 1 << 14
+
+# Readings a stream() consumer may fall behind by before the oldest are dropped
+STREAM_BUFFER = 1024
+
+# Delay between attempts to reopen a board's port after its link dropped
+RECONNECT_INTERVAL = 0.5
+
+
+class ReadingQueue:
+    """Bounded queue of (controller, reading) pairs that drops the oldest
+
+    Closes once every controller it was attached to has closed.
+    """
+    def __init__(self, maxsize=STREAM_BUFFER, sources=1):
+        self._items = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+        self.sources = sources
+        self.dropped = 0
+
+    def put(self, item):
+        if len(self._items) == self._items.maxlen:
+            self.dropped += 1
+        self._items.append(item)
+        self._ready.set()
+
+    def source_closed(self):
+        self.sources -= 1
+        self._ready.set()
+
+    async def get(self):
+        """Next item, or None once closed and drained"""
+        while not self._items:
+            if self.sources <= 0:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+
+class AsyncController(SensorState):
+    """One board served from the event loop
+
+    Sensor state, history and ingest are shared with ArduinoTerminalController
+    (sensors.py), so dashboard widgets can draw either.
+    """
+    def __init__(self, port, baudrate=9600, history=FLEET_HISTORY, name=None):
+        self.port = port
+        self.name = name or port
+        self.baudrate = baudrate
+        self.stream_port = None
+        self.decoder = StreamDecoder()
+        self.parser = TextParser()
+        self.writer = AsyncCommandWriter(self._write, on_sent=self._on_command_sent,
+                                         on_error=self._on_command_error)
+        self.connected = False
+        self.ready = False  # the sketch answered with its banner or prompt
+        self.reconnects = 0
+        self.subscriptions = SubscriptionManager(baudrate)
+        self._queues = set()
+        self._detector = None
+        self._ready_event = None
+        self._reconnect_task = None
+        self._closing = False
+
+        self.init_sensors(history)
+        self.metrics = PipelineMetrics()
+
+        self.motor_a_speed = 150
+        self.motor_b_speed = 150
+        self.motor_both_speed = 150
+        self.servo1_angle = 90
+        self.servo2_angle = 90
+        self.auto_refresh = False
+        self.binary_mode = False
+
+        self.status_msg = "Disconnected"
+        self.last_command = ""
+        self.last_latency = None
+
+    async def connect(self, timeout=READY_TIMEOUT):
+        """Open the port and start serving it; returns True on success
+
+        Waits for the sketch's banner or prompt (opening the port resets the
+        board), for at most `timeout` seconds.
+        """
+        start = time.monotonic()
+        self._closing = False
+        try:
+            await self._open()
+        except Exception as e:
+            self.status_msg = f"Connection error: {str(e)}"
+            return False
+        self.writer.start()
+        await self._wait_ready(timeout)
+        self.connected = True
+        self.status_msg = f"Connected to {self.port} ({time.monotonic() - start:.1f} s)"
+        return True
+
+    async def _open(self):
+        loop = asyncio.get_running_loop()
+        self._detector = ReadyDetector()
+        self._ready_event = asyncio.Event()
+        self.ready = False
+        # Opening a real port can block briefly (termios setup); keep it off the loop
+        port = await loop.run_in_executor(None, open_transport, self.port, self.baudrate, 0)
+        self.decoder = StreamDecoder()
+        self.stream_port = SerialStream(port, self._on_data, self._on_close, self.baudrate)
+
+    async def _wait_ready(self, timeout):
+        try:
+            await asyncio.wait_for(self._ready_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def close(self):
+        """Disconnect and end this controller's reading streams"""
+        self._closing = True
+        self.connected = False
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        await self.writer.stop()
+        if self.stream_port:
+            self.stream_port.close()
+            self.stream_port = None
+        for queue in self._queues:
+            queue.source_closed()
+        self._queues.clear()
+        self.status_msg = "Disconnected"
+
+    async def _reconnect(self):
+        """Reopen the port until the board is back, then restore its streams"""
+        while not self._closing:
+            await asyncio.sleep(RECONNECT_INTERVAL)
+            try:
+                await self._open()
+            except Exception:
+                continue
+            await self._wait_ready(READY_TIMEOUT)
+            self._reconnected(self.port)
+            self._reconnect_task = None
+            return
+
+    async def _write(self, data):
+        if self.stream_port is None:
+            raise OSError("not connected")
+        await self.stream_port.write(data)
+
+    def send_nowait(self, command):
+        """Queue a command; returns a future for its queue-to-wire latency"""
+        future = self.writer.submit(command)
+        self.metrics.queue_depth(len(self.writer.queue))
+        return future
+
+    async def send(self, command):
+        """Send a command; returns its queue-to-wire latency in seconds
+
+        Returns None when a newer command superseded it before it was written.
+        """
+        return await self.writer.submit(command)
+
+    def send_command(self, command):
+        """Queue a command without waiting (same call as ArduinoTerminalController)"""
+        if self.connected:
+            self.send_nowait(command)
+        else:
+            self.status_msg = "Not connected!"
+
+    def _on_command_sent(self, command, latency):
+        self.last_command = command
+        self.last_latency = latency
+        if expects_reply(command):
+            self.metrics.command_sent(time.monotonic() - latency)
+
+    def _on_command_error(self, command, error):
+        self.status_msg = f"Send error: {str(error)}"
+
+    def _send_all(self, commands):
+        for command in commands:
+            self.send_nowait(command)
+
+    def subscribe(self, rates):
+        """Stream sensors at the given rates, fitted to the link (see streaming.py)"""
+        self._send_all(self.subscriptions.request(rates, self.binary_mode))
+
+    def unsubscribe(self):
+        self._send_all(self.subscriptions.stop())
+
+    def set_auto_refresh(self, enabled):
+        self.auto_refresh = enabled
+        if enabled:
+            self.subscribe(DEFAULT_RATES)
+        else:
+            self.unsubscribe()
+
+    def set_binary_mode(self, enabled):
+        self.binary_mode = enabled
+        self.send_nowait("binary on" if enabled else "binary off")
+        self._send_all(self.subscriptions.set_binary(enabled))
+
+    def attach(self, queue):
+        """Deliver this board's readings to `queue` as (controller, reading)"""
+        self._queues.add(queue)
+
+    def detach(self, queue):
+        self._queues.discard(queue)
+
+    async def stream(self, maxsize=STREAM_BUFFER):
+        """Yield readings as they arrive until the controller is closed"""
+        queue = ReadingQueue(maxsize)
+        self.attach(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                yield item[1]
+        finally:
+            self.detach(queue)
+
+    def _on_data(self, data):
+        if not self.ready and self._detector.feed(data):
+            self.ready = True
+            self._ready_event.set()
+        self._send_all(self.subscriptions.observe(len(data)))
+        now = time.monotonic()
+        metrics = self.metrics
+        metrics.read(len(data), now)
+        start = time.perf_counter()
+        packets = self.decoder.packets
+        for event in self.decoder.feed(data):
+            if isinstance(event, str):
+                line = event.strip()
+                if not line:
+                    continue
+                try:
+                    records = self.parser.parse(line)
+                except Exception:
+                    metrics.reader_errors += 1
+                    continue
+                metrics.line(self.parser.last_type or 'other', len(event) + 1)
+                for record in records:
+                    self.apply_reading(record, now)
+            else:
+                self.apply_reading(event, now)
+        if self.decoder.packets != packets:
+            metrics.packets(self.decoder.packets - packets)
+        metrics.ingest_time.add(time.perf_counter() - start)
+
+    def _on_close(self, error):
+        self.connected = False
+        self.status_msg = f"Link lost ({error}), reconnecting..." if error else "Link lost, reconnecting..."
+        if self.stream_port:
+            self.stream_port.close()
+            self.stream_port = None
+        if not self._closing and self._reconnect_task is None:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    def apply_reading(self, reading, now=None):
+        """Store a decoded reading record and pass it to stream consumers"""
+        if now is None:
+            now = time.monotonic()
+        self.ingest(reading, now)
+        item = (self, reading)
+        for queue in self._queues:
+            queue.put(item)
+
+
+class LoopMonitor:
+    """Measure event-loop latency: how late a periodic timer wakes up"""
+    def __init__(self, interval=0.01, size=2000):
+        self.interval = interval
+        self.lag = LatencyTracker(size)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def reset(self):
+        self.lag.samples.clear()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag.add(max(0.0, loop.time() - expected))
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+
+class Fleet:
+    """A set of AsyncControllers sharing one event loop"""
+    def __init__(self, ports, baudrate=9600, history=FLEET_HISTORY):
+        self.controllers = [AsyncController(port, baudrate, history) for port in ports]
+        self.monitor = LoopMonitor()
+
+    def __len__(self):
+        return len(self.controllers)
+
+    def __iter__(self):
+        return iter(self.controllers)
+
+    @property
+    def connected(self):
+        return [c for c in self.controllers if c.connected]
+
+    async def connect(self, timeout=READY_TIMEOUT):
+        """Connect every board concurrently; returns the ones that connected"""
+        self.monitor.start()
+        await asyncio.gather(*(c.connect(timeout) for c in self.controllers))
+        return self.connected
+
+    async def close(self):
+        self.monitor.stop()
+        await asyncio.gather(*(c.close() for c in self.controllers))
+
+    async def broadcast(self, command):
+        """Send a command to every connected board; returns their latencies"""
+        return await asyncio.gather(*(c.send(command) for c in self.connected))
+
+    def subscribe(self, rates):
+        for controller in self.connected:
+            controller.subscribe(rates)
+
+    def unsubscribe(self):
+        for controller in self.connected:
+            controller.unsubscribe()
+
+    async def stream(self, maxsize=STREAM_BUFFER):
+        """Yield (controller, reading) from every board until all are closed"""
+        queue = ReadingQueue(maxsize, sources=len(self.controllers))
+        for controller in self.controllers:
+            controller.attach(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                yield item
+        finally:
+            for controller in self.controllers:
+                controller.detach(queue)
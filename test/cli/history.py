@@ -0,0 +1,189 @@
+"""
+Fixed-capacity sensor history for the Arduino CLI controller
+Samples and timestamps live in flat arrays, so hours of data per channel
+take a few MB, windows are zero-copy views and graphs are decimated with
+per-block min/max summaries instead of scanning every sample.
+"""
+
+import time
+from array import array
+
+# Samples kept per channel: about 1.8 hours at 20 Hz, 36 hours at 1 Hz
+DEFAULT_CAPACITY = 1 << 17
+
+# Samples summarized by one min/max block entry
+BLOCK_SIZE = 64
+
+
+class RingBuffer:
+    """Timestamped ring buffer of numbers backed by `array`"""
+    def __init__(self, capacity=DEFAULT_CAPACITY, typecode='f'):
+        # Round up to whole blocks so block summaries never straddle the wrap point
+        capacity = max(BLOCK_SIZE, -(-capacity // BLOCK_SIZE) * BLOCK_SIZE)
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array(typecode, [0]) * capacity
+        self.block_min = array(typecode, [0]) * (capacity // BLOCK_SIZE)
+        self.block_max = array(typecode, [0]) * (capacity // BLOCK_SIZE)
+        self._head = 0   # next physical write index
+        self._len = 0
+        self.total = 0   # samples appended since creation
+
+    def __len__(self):
+        return self._len
+
+    def append(self, value, t=None):
+        """Add a sample, overwriting the oldest once full"""
+        i = self._head
+        self.times[i] = time.monotonic() if t is None else t
+        values = self.values
+        values[i] = value
+        value = values[i]  # as stored (float32 rounding)
+        block = i // BLOCK_SIZE
+        if i % BLOCK_SIZE == 0:
+            self.block_min[block] = value
+            self.block_max[block] = value
+        else:
+            if value < self.block_min[block]:
+                self.block_min[block] = value
+            if value > self.block_max[block]:
+                self.block_max[block] = value
+        self._head = (i + 1) % self.capacity
+        if self._len < self.capacity:
+            self._len += 1
+        self.total += 1
+
+    def _physical(self, index):
+        return (self._head - self._len + index) % self.capacity
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("history index out of range")
+        return self.values[self._physical(index)]
+
+    def last(self, default=None):
+        """Most recent value, or `default` when empty"""
+        return self[-1] if self._len else default
+
+    def time_at(self, index):
+        if index < 0:
+            index += self._len
+        return self.times[self._physical(index)]
+
+    def index_at_time(self, t):
+        """Logical index of the first sample with timestamp >= t"""
+        lo, hi = 0, self._len
+        times = self.times
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[self._physical(mid)] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def view(self, start=0, stop=None):
+        """Zero-copy view over logical indices [start, stop)"""
+        if stop is None or stop > self._len:
+            stop = self._len
+        start = max(0, min(start, stop))
+        return HistoryView(self, start, stop)
+
+    def last_n(self, count):
+        """View of the most recent `count` samples"""
+        return self.view(self._len - count)
+
+    def since(self, seconds, now=None):
+        """View of the samples from the last `seconds` seconds"""
+        if now is None:
+            now = time.monotonic()
+        return self.view(self.index_at_time(now - seconds))
+
+    def _ranges(self, start, stop):
+        """Physical [a, b) ranges covering logical [start, stop)"""
+        if start >= stop:
+            return ()
+        a = self._physical(start)
+        b = a + (stop - start)
+        if b <= self.capacity:
+            return ((a, b),)
+        return ((a, self.capacity), (0, b - self.capacity))
+
+    def _range_extremes(self, a, b):
+        """(min, max) of physical range [a, b) using block summaries where possible"""
+        values = memoryview(self.values)
+        first_block = -(-a // BLOCK_SIZE)
+        end_block = b // BLOCK_SIZE
+        raw = []
+        blocks = []
+        if first_block >= end_block:
+            raw.append((a, b))
+        else:
+            raw.append((a, first_block * BLOCK_SIZE))
+            raw.append((end_block * BLOCK_SIZE, b))
+            blocks.append((first_block, end_block))
+            # The block being overwritten mixes new and old samples, so its
+            # summary only covers part of it; scan it directly instead
+            if self._len == self.capacity and self._head % BLOCK_SIZE:
+                partial = self._head // BLOCK_SIZE
+                if first_block <= partial < end_block:
+                    blocks = [(first_block, partial), (partial + 1, end_block)]
+                    raw.append((partial * BLOCK_SIZE, (partial + 1) * BLOCK_SIZE))
+        lows = []
+        highs = []
+        for lo, hi in raw:
+            if lo < hi:
+                chunk = values[lo:hi]
+                lows.append(min(chunk))
+                highs.append(max(chunk))
+        block_min = memoryview(self.block_min)
+        block_max = memoryview(self.block_max)
+        for lo, hi in blocks:
+            if lo < hi:
+                lows.append(min(block_min[lo:hi]))
+                highs.append(max(block_max[lo:hi]))
+        return min(lows), max(highs)
+
+
+class HistoryView:
+    """Read-only window over a RingBuffer; valid until the buffer wraps past it"""
+    def __init__(self, ring, start, stop):
+        self.ring = ring
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def segments(self):
+        """Memoryviews of the values in order (at most two, around the wrap point)"""
+        values = memoryview(self.ring.values)
+        return [values[a:b] for a, b in self.ring._ranges(self.start, self.stop)]
+
+    def __iter__(self):
+        for segment in self.segments():
+            yield from segment
+
+    def extremes(self, start=0, stop=None):
+        """(min, max) over view-relative indices [start, stop)"""
+        if stop is None:
+            stop = len(self)
+        ring = self.ring
+        results = [ring._range_extremes(a, b)
+                   for a, b in ring._ranges(self.start + start, self.start + stop)]
+        return min(r[0] for r in results), max(r[1] for r in results)
+
+    def max(self):
+        return self.extremes()[1] if len(self) else None
+
+    def minmax(self, width):
+        """Reduce the view to at most `width` (min, max) column pairs"""
+        count = len(self)
+        if count == 0 or width <= 0:
+            return []
+        if count <= width:
+            return [(v, v) for v in self]
+        return [self.extremes(col * count // width, (col + 1) * count // width)
+                for col in range(width)]
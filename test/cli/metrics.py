@@ -0,0 +1,365 @@
+"""
+Pipeline instrumentation for the Arduino CLI controller
+Always-on counters and log-bucketed histograms for the link, parser, command
+queue and dashboard, cheap enough to update per read and per frame, plus an
+opt-in sampling profiler. snapshot() gives everything as one JSON-able dict.
+"""
+
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from telemetry import PACKET_SIZE
+
+# Commands sent while waiting for their reply; older ones are forgotten
+MAX_OUTSTANDING = 32
+
+
+class Histogram:
+    """Log-bucketed histogram of positive values (seconds, bytes, ...)
+
+    Buckets are `per_octave` per doubling from `low` to `high`, so add() is
+    O(1) and percentiles are accurate to a bucket width (about 19% at 4).
+    """
+    def __init__(self, low=1e-6, high=100.0, per_octave=4):
+        self.low = low
+        self.per_octave = per_octave
+        self.counts = [0] * (int(math.ceil(math.log2(high / low) * per_octave)) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        if value <= self.low:
+            index = 0
+        else:
+            index = min(len(self.counts) - 1, int(math.log2(value / self.low) * self.per_octave) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the given percentile, or None"""
+        if not self.count:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.max, self.low * 2 ** (index / self.per_octave))
+        return self.max
+
+    def summary(self, scale=1.0):
+        """count, mean, p50/p90/p99 and max, multiplied by `scale`"""
+        if not self.count:
+            return {'count': 0}
+        result = {'count': self.count, 'mean': self.total / self.count * scale}
+        for pct in (50, 90, 99):
+            result[f'p{pct}'] = self.percentile(pct) * scale
+        result['max'] = self.max * scale
+        return result
+
+
+class PipelineMetrics:
+    """Counters and histograms for one controller
+
+    The reader thread (or event loop) calls read() for every chunk and
+    line() for every line; rates are recomputed over one-second windows as
+    reads arrive, so nothing runs on a timer.
+    """
+    def __init__(self, window=1.0):
+        self.started = time.monotonic()
+        self.window = window
+        self.bytes_in = 0
+        self.reads = 0
+        self.reader_errors = 0
+        self.lines = Counter()        # message type -> lines (or packets)
+        self.line_bytes = Counter()   # message type -> bytes
+        self.rates = {}               # message type -> (lines/s, bytes/s), last window
+        self.bytes_per_sec = 0.0
+        self.reads_per_sec = 0.0
+        self.queue_depth_max = 0
+        self.read_size = Histogram(low=1, high=1 << 16, per_octave=2)
+        self.ingest_time = Histogram()     # decode + parse + store, per read
+        self.round_trip = Histogram()      # command queued -> reply line
+        self.reading_age = Histogram()     # reading received -> drawn
+        self.frame_time = Histogram()      # dashboard frames that redrew something
+        self._outstanding = deque(maxlen=MAX_OUTSTANDING)
+        self._window_start = self.started
+        self._window_bytes = 0
+        self._window_reads = 0
+        self._window_lines = Counter()
+        self._window_line_bytes = Counter()
+
+    def read(self, nbytes, now):
+        """Account one read from the port"""
+        self.reads += 1
+        self._window_reads += 1
+        if nbytes:
+            self.bytes_in += nbytes
+            self._window_bytes += nbytes
+            self.read_size.add(nbytes)
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self.bytes_per_sec = self._window_bytes / elapsed
+            self.reads_per_sec = self._window_reads / elapsed
+            self.rates = {kind: (count / elapsed, self._window_line_bytes[kind] / elapsed)
+                          for kind, count in self._window_lines.items()}
+            self._window_start = now
+            self._window_bytes = self._window_reads = 0
+            self._window_lines = Counter()
+            self._window_line_bytes = Counter()
+
+    def line(self, kind, nbytes, count=1):
+        """Account a received line (or `count` binary packets) of a message type"""
+        self.lines[kind] += count
+        self.line_bytes[kind] += nbytes
+        self._window_lines[kind] += count
+        self._window_line_bytes[kind] += nbytes
+
+    def packets(self, count):
+        self.line('packet', count * PACKET_SIZE, count)
+
+    def queue_depth(self, depth):
+        if depth > self.queue_depth_max:
+            self.queue_depth_max = depth
+
+    def command_sent(self, enqueued_at):
+        """A command that the sketch acknowledges went out"""
+        self._outstanding.append(enqueued_at)
+
+    def reply(self, now):
+        """A reply line arrived; replies come back in command order"""
+        if self._outstanding:
+            self.round_trip.add(now - self._outstanding.popleft())
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            'uptime_s': now - self.started,
+            'link': {
+                'bytes_in': self.bytes_in,
+                'bytes_per_sec': self.bytes_per_sec,
+                'reads': self.reads,
+                'reads_per_sec': self.reads_per_sec,
+                'read_size_bytes': self.read_size.summary(),
+            },
+            'messages': {kind: {'lines': self.lines[kind], 'bytes': self.line_bytes[kind],
+                                'lines_per_sec': self.rates.get(kind, (0.0, 0.0))[0],
+                                'bytes_per_sec': self.rates.get(kind, (0.0, 0.0))[1]}
+                         for kind in sorted(self.lines)},
+            'reader_errors': self.reader_errors,
+            'ingest_ms': self.ingest_time.summary(1000),
+            'round_trip_ms': self.round_trip.summary(1000),
+            'reading_age_ms': self.reading_age.summary(1000),
+            'frame_ms': self.frame_time.summary(1000),
+            'outstanding_commands': len(self._outstanding),
+        }
+
+
+def controller_snapshot(controller, profiler=None):
+    """Metrics plus the parser, decoder, queue and link state of a controller"""
+    snapshot = controller.metrics.snapshot()
+    writer = controller.writer
+    decoder = controller.decoder
+    recorder = getattr(controller, 'recorder', None)
+    subs = controller.subscriptions
+    snapshot['errors'] = {
+        'parse_failures': dict(controller.parser.failures),
+        'bad_packets': decoder.bad_packets if decoder else 0,
+        'lost_packets': decoder.lost_packets if decoder else 0,
+        'reader_errors': snapshot.pop('reader_errors'),
+    }
+    snapshot['queues'] = {
+        'writer': len(writer.queue),
+        'writer_max': controller.metrics.queue_depth_max,
+        'coalesced': writer.queue.coalesced,
+        'dropped': writer.queue.dropped,
+        'sent': writer.sent,
+        'failed': writer.failed,
+        'recorder_blocks': recorder.pending_blocks if recorder else 0,
+    }
+    p50 = writer.latency.percentile(50)
+    snapshot['queue_to_wire_ms'] = p50 * 1000 if p50 is not None else None
+    snapshot['streams'] = {'rates_hz': dict(subs.rates), 'utilization': subs.utilization}
+    server = getattr(controller, 'server', None)
+    if server is not None:
+        snapshot['server'] = server.stats()
+    if profiler is not None:
+        snapshot['profile'] = profiler.snapshot()
+    return snapshot
+
+
+# Snapshot sections whose keys become a label value instead of part of the name
+PROMETHEUS_LABELS = {'messages': 'kind', 'parse_failures': 'type', 'rates_hz': 'sensor',
+                     'clients': 'client'}
+
+# Snapshot paths that only ever go up; exported as counters named ..._total
+PROMETHEUS_COUNTERS = {
+    'link.bytes_in', 'link.reads', 'messages.lines', 'messages.bytes',
+    'errors.parse_failures', 'errors.bad_packets', 'errors.lost_packets', 'errors.reader_errors',
+    'queues.coalesced', 'queues.dropped', 'queues.sent', 'queues.failed',
+    'server.clients_total', 'server.published', 'server.commands', 'server.dropped',
+    'server.clients.sent', 'server.clients.dropped', 'server.clients.commands',
+}
+
+# Histogram.summary() percentiles as summary quantiles
+PROMETHEUS_QUANTILES = {'p50': '0.5', 'p90': '0.9', 'p99': '0.99'}
+
+
+def _is_summary(value):
+    return 'count' in value and set(value) <= {'count', 'mean', 'max', *PROMETHEUS_QUANTILES}
+
+
+def prometheus_text(snapshot, prefix='arduino'):
+    """Render a snapshot in the Prometheus text format
+
+    Numbers become gauges named after their path in the snapshot
+    (arduino_link_bytes_per_sec, ...), or counters with a _total suffix for
+    the paths in PROMETHEUS_COUNTERS. Histogram summaries become summaries
+    (quantiles, _sum and _count) plus a _max gauge. Strings and missing
+    values are left out.
+    """
+    metrics = {}
+
+    def add(name, kind, labels, value):
+        name = re.sub(r'[^a-zA-Z0-9_]', '_', name)
+        metrics.setdefault(name, (kind, []))[1].append((labels, value))
+
+    def walk(value, parts, labels, keyed=False):
+        if isinstance(value, bool):
+            value = int(value)
+        name = '_'.join(parts)
+        if isinstance(value, (int, float)):
+            if '.'.join(parts[1:]) in PROMETHEUS_COUNTERS:
+                add(name if name.endswith('_total') else name + '_total', 'counter', labels, value)
+            else:
+                add(name, 'gauge', labels, value)
+        elif isinstance(value, dict) and _is_summary(value):
+            count = value['count']
+            # Declared even without quantiles (nothing recorded yet)
+            metrics.setdefault(re.sub(r'[^a-zA-Z0-9_]', '_', name), ('summary', []))
+            for key, quantile in PROMETHEUS_QUANTILES.items():
+                if key in value:
+                    add(name, 'summary', labels + (('quantile', quantile),), value[key])
+            add(name + '_sum', 'summary', labels, value.get('mean', 0.0) * count)
+            add(name + '_count', 'summary', labels, count)
+            if 'max' in value:
+                add(name + '_max', 'gauge', labels, value['max'])
+        elif isinstance(value, dict):
+            # `keyed`: this dict is one labeled entry, so its keys are names again
+            label = None if keyed else PROMETHEUS_LABELS.get(parts[-1])
+            for key, item in value.items():
+                if label:
+                    walk(item, parts, labels + ((label, str(key)),), True)
+                else:
+                    walk(item, parts + [str(key)], labels)
+
+    walk(snapshot, [prefix], ())
+    lines = []
+    for name, (kind, rows) in metrics.items():
+        # A summary's _sum and _count belong to the family declared by its quantiles
+        if kind != 'summary' or not name.endswith(('_sum', '_count')):
+            lines.append(f"# TYPE {name} {kind}")
+        for labels, value in rows:
+            if labels:
+                text = ",".join('{}="{}"'.format(key, val.replace('\\', '\\\\').replace('"', '\\"')
+                                                  .replace('\n', '\\n'))
+                                for key, val in labels)
+                lines.append(f"{name}{{{text}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def dump_json(snapshot, path=None):
+    """Write a snapshot to `path` (default: metrics-<time>.json here); returns the path"""
+    if path is None:
+        path = time.strftime('metrics-%Y%m%d-%H%M%S.json')
+    with open(path, 'w') as fh:
+        json.dump(snapshot, fh, indent=2)
+    return path
+
+
+class SamplingProfiler:
+    """Statistical profiler for the controller's threads
+
+    A background thread samples every other thread's stack each `interval`
+    seconds. Samples are wall-clock: a thread blocked in a read shows up
+    where it waits, which is what tells link-bound from CPU-bound.
+    """
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()     # thread name -> samples
+        self.leaf = Counter()        # (thread, function) -> samples with it on top
+        self.inclusive = Counter()   # (thread, function) -> samples with it anywhere
+        self.running = False
+        self.thread = None
+
+    @property
+    def active(self):
+        return self.running
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                thread = names.get(ident, str(ident))
+                self.samples[thread] += 1
+                self.leaf[thread, _function(frame)] += 1
+                seen = set()
+                depth = 0
+                while frame is not None and depth < self.max_depth:
+                    seen.add(_function(frame))
+                    frame = frame.f_back
+                    depth += 1
+                for function in seen:
+                    self.inclusive[thread, function] += 1
+            time.sleep(self.interval)
+
+    def top(self, count=10):
+        """Hottest (thread, function, self %, total %) by samples on top of the stack"""
+        rows = []
+        for (thread, function), hits in self.leaf.most_common(count):
+            total = self.samples[thread] or 1
+            rows.append((thread, function, hits / total * 100,
+                         self.inclusive[thread, function] / total * 100))
+        return rows
+
+    def snapshot(self, count=25):
+        return {
+            'interval_s': self.interval,
+            'samples': dict(self.samples),
+            'top': [{'thread': thread, 'function': function, 'self_pct': own, 'total_pct': total}
+                    for thread, function, own, total in self.top(count)],
+        }
+
+
+def _function(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
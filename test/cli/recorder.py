@@ -0,0 +1,336 @@
+"""
+Append-only telemetry recorder and memory-mapped log reader
+Every parsed reading and every sent command is stored with its monotonic
+timestamp in a compact columnar file, so runs can be analysed afterwards.
+
+File layout (little endian):
+    header: magic "UTRATLM1", version, reserved, wall-clock and monotonic time at start
+    blocks: block header (magic "BLK1", rows, text bytes, reserved, first and last timestamp)
+            then one column after another:
+              t (float64) | kind (uint8) | v0, v1, v2 (float32) | text length (uint16)
+            then the concatenated UTF-8 text of command/reply rows,
+            zero-padded to a multiple of 8 bytes
+
+Usage:
+    python recorder.py run.tlm [--from SECONDS] [--to SECONDS]
+"""
+
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from telemetry import ColorReading, IRReading, DistanceReading, Reply
+
+FILE_MAGIC = b'UTRATLM1'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<8sIIdd')
+BLOCK_MAGIC = b'BLK1'
+BLOCK_HEADER = struct.Struct('<4sIIIdd')
+# Column bytes per row: t, kind, v0, v1, v2, text length
+ROW_BYTES = 8 + 1 + 4 + 4 + 4 + 2
+
+# Row kinds
+KIND_COLOR = 1      # v0, v1, v2 = R, G, B
+KIND_IR1 = 2        # v0 = value
+KIND_IR2 = 3        # v0 = value
+KIND_DISTANCE = 4   # v0 = cm, v1 = 1 if out of range
+KIND_COMMAND = 5    # text = command as sent
+KIND_REPLY = 6      # v0 = 1 for an acknowledgement, 0 for an error; text = reply line
+
+DEFAULT_BLOCK_ROWS = 4096
+
+Command = namedtuple('Command', 'text')
+
+
+def encode_record(record):
+    """Map a record to (kind, v0, v1, v2, text)"""
+    if isinstance(record, ColorReading):
+        return KIND_COLOR, record.r, record.g, record.b, None
+    if isinstance(record, IRReading):
+        kind = KIND_IR1 if record.channel == 'IR1' else KIND_IR2
+        return kind, record.value, 0, 0, None
+    if isinstance(record, DistanceReading):
+        return KIND_DISTANCE, record.cm, float(record.out_of_range), 0, None
+    if isinstance(record, Reply):
+        return KIND_REPLY, float(record.ok), 0, 0, record.text
+    if isinstance(record, Command):
+        return KIND_COMMAND, 0, 0, 0, record.text
+    raise TypeError(f"cannot record {type(record).__name__}")
+
+
+def decode_record(kind, v0, v1, v2, text):
+    """Inverse of encode_record"""
+    if kind == KIND_COLOR:
+        return ColorReading(int(v0), int(v1), int(v2))
+    if kind == KIND_IR1:
+        return IRReading('IR1', int(v0))
+    if kind == KIND_IR2:
+        return IRReading('IR2', int(v0))
+    if kind == KIND_DISTANCE:
+        return DistanceReading(v0, bool(v1))
+    if kind == KIND_REPLY:
+        return Reply(bool(v0), text)
+    if kind == KIND_COMMAND:
+        return Command(text)
+    return None
+
+
+class _Columns:
+    """In-memory column buffers for the block being filled"""
+    def __init__(self):
+        self.t = array('d')
+        self.kind = array('B')
+        self.v0 = array('f')
+        self.v1 = array('f')
+        self.v2 = array('f')
+        self.text_len = array('H')
+        self.text = bytearray()
+
+    def __len__(self):
+        return len(self.t)
+
+    def encode(self):
+        count = len(self.t)
+        header = BLOCK_HEADER.pack(BLOCK_MAGIC, count, len(self.text), 0, self.t[0], self.t[-1])
+        parts = [header, self.t.tobytes(), self.kind.tobytes(), self.v0.tobytes(),
+                 self.v1.tobytes(), self.v2.tobytes(), self.text_len.tobytes(), bytes(self.text)]
+        size = sum(len(p) for p in parts)
+        parts.append(bytes(-size % 8))
+        return b''.join(parts)
+
+
+class TelemetryRecorder:
+    """Buffer rows in columns and append them to disk in whole blocks
+
+    record() only appends to in-memory arrays; encoded blocks are written by
+    a background thread so disk latency never reaches the serial reader.
+    """
+    def __init__(self, path, block_rows=DEFAULT_BLOCK_ROWS, flush_interval=1.0):
+        self.path = path
+        self.block_rows = block_rows
+        self.flush_interval = flush_interval
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, 0, time.time(), time.monotonic()))
+        self._columns = _Columns()
+        self._block_started = None
+        self._lock = threading.Lock()
+        self._blocks = queue.Queue()
+        self._thread = threading.Thread(target=self._write_blocks, name="telemetry-recorder",
+                                        daemon=True)
+        self._thread.start()
+
+    def record(self, record, t=None):
+        """Append a reading, reply or Command row"""
+        kind, v0, v1, v2, text = encode_record(record)
+        encoded = text.encode('utf-8')[:0xFFFF] if text else b''
+        with self._lock:
+            # Timestamp under the lock so rows from different threads stay ordered
+            if t is None:
+                t = time.monotonic()
+            columns = self._columns
+            if not len(columns):
+                self._block_started = t
+            columns.t.append(t)
+            columns.kind.append(kind)
+            columns.v0.append(v0)
+            columns.v1.append(v1)
+            columns.v2.append(v2)
+            columns.text_len.append(len(encoded))
+            columns.text += encoded
+            self.rows += 1
+            if len(columns) >= self.block_rows or t - self._block_started >= self.flush_interval:
+                self._seal()
+
+    @property
+    def pending_blocks(self):
+        """Sealed blocks not yet written to disk"""
+        return self._blocks.qsize()
+
+    def record_command(self, command, t=None):
+        self.record(Command(command), t)
+
+    def _seal(self):
+        """Hand the current block to the writer thread (caller holds the lock)"""
+        if len(self._columns):
+            self._blocks.put(self._columns.encode())
+            self._columns = _Columns()
+
+    def flush(self):
+        """Seal the current block and wait until everything is on disk"""
+        with self._lock:
+            self._seal()
+        self._blocks.join()
+
+    def close(self):
+        self.flush()
+        self._blocks.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _write_blocks(self):
+        while True:
+            try:
+                block = self._blocks.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # Quiet period: push out a partially filled block that has aged
+                with self._lock:
+                    if len(self._columns) and time.monotonic() - self._block_started >= self.flush_interval:
+                        self._seal()
+                continue
+            try:
+                if block is None:
+                    return
+                self._file.write(block)
+                self._file.flush()
+            finally:
+                self._blocks.task_done()
+
+
+BlockInfo = namedtuple('BlockInfo', 'offset rows text_bytes t_first t_last')
+
+
+class TelemetryLog:
+    """Memory-mapped, read-only view of a recorder file"""
+    def __init__(self, path):
+        self._fh = open(path, 'rb')
+        size = os.fstat(self._fh.fileno()).st_size
+        if size < FILE_HEADER.size:
+            raise ValueError(f"{path}: not a telemetry log")
+        self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, version, _, self.start_wall, self.start_monotonic = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError(f"{path}: not a telemetry log (version {version})")
+        self.blocks = self._index(size)
+        self._block_last = [b.t_last for b in self.blocks]
+
+    def _index(self, size):
+        """Walk block headers; a truncated final block (from a crash) is ignored"""
+        blocks = []
+        offset = FILE_HEADER.size
+        while offset + BLOCK_HEADER.size <= size:
+            magic, rows, text_bytes, _, t_first, t_last = BLOCK_HEADER.unpack_from(self._map, offset)
+            if magic != BLOCK_MAGIC:
+                break
+            length = BLOCK_HEADER.size + rows * ROW_BYTES + text_bytes
+            length += -length % 8
+            if offset + length > size:
+                break
+            blocks.append(BlockInfo(offset, rows, text_bytes, t_first, t_last))
+            offset += length
+        return blocks
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(b.rows for b in self.blocks)
+
+    @property
+    def time_span(self):
+        """(first, last) timestamp in the log, or None if empty"""
+        if not self.blocks:
+            return None
+        return self.blocks[0].t_first, self.blocks[-1].t_last
+
+    def columns(self, block):
+        """Zero-copy column views of one block: t, kind, v0, v1, v2, text_len, text"""
+        rows = block.rows
+        pos = block.offset + BLOCK_HEADER.size
+        view = self._view
+        t = view[pos:pos + 8 * rows].cast('d')
+        pos += 8 * rows
+        kind = view[pos:pos + rows]
+        pos += rows
+        v0 = view[pos:pos + 4 * rows].cast('f')
+        pos += 4 * rows
+        v1 = view[pos:pos + 4 * rows].cast('f')
+        pos += 4 * rows
+        v2 = view[pos:pos + 4 * rows].cast('f')
+        pos += 4 * rows
+        text_len = view[pos:pos + 2 * rows].cast('H')
+        pos += 2 * rows
+        text = view[pos:pos + block.text_bytes]
+        return t, kind, v0, v1, v2, text_len, text
+
+    def _block_slices(self, t0, t1):
+        """Yield (block, first row, end row) covering timestamps in [t0, t1]"""
+        first = bisect_left(self._block_last, t0)
+        for block in self.blocks[first:]:
+            if block.t_first > t1:
+                break
+            t = self.columns(block)[0]
+            yield block, bisect_left(t, t0), bisect_right(t, t1)
+
+    def read(self, t0=float('-inf'), t1=float('inf'), kinds=None):
+        """Yield (t, record) for rows with t0 <= t <= t1, optionally filtered by kind"""
+        for block, start, stop in self._block_slices(t0, t1):
+            t, kind, v0, v1, v2, text_len, text = self.columns(block)
+            # Text offsets are cumulative over the block
+            text_pos = sum(text_len[:start]) if block.text_bytes else 0
+            for i in range(start, stop):
+                length = text_len[i]
+                row_kind = kind[i]
+                if kinds is None or row_kind in kinds:
+                    row_text = bytes(text[text_pos:text_pos + length]).decode('utf-8', 'replace') if length else None
+                    yield t[i], decode_record(row_kind, v0[i], v1[i], v2[i], row_text)
+                text_pos += length
+
+    def series(self, kind, column='v0', t0=float('-inf'), t1=float('inf')):
+        """Return (timestamps, values) arrays for one kind and value column"""
+        index = ('v0', 'v1', 'v2').index(column) + 2
+        times = array('d')
+        values = array('f')
+        for block, start, stop in self._block_slices(t0, t1):
+            cols = self.columns(block)
+            kinds = cols[1]
+            t = cols[0]
+            v = cols[index]
+            for i in range(start, stop):
+                if kinds[i] == kind:
+                    times.append(t[i])
+                    values.append(v[i])
+        return times, values
+
+
+def main():
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Dump a telemetry log written by the CLI controller")
+    ap.add_argument('log')
+    ap.add_argument('--from', dest='start', type=float, default=None,
+                    help="seconds from the start of the log")
+    ap.add_argument('--to', dest='end', type=float, default=None,
+                    help="seconds from the start of the log")
+    args = ap.parse_args()
+
+    with TelemetryLog(args.log) as log:
+        span = log.time_span
+        print(f"{args.log}: {len(log)} rows in {len(log.blocks)} blocks, "
+              f"started {time.ctime(log.start_wall)}")
+        if span is None:
+            return
+        origin = log.start_monotonic
+        t0 = origin + args.start if args.start is not None else span[0]
+        t1 = origin + args.end if args.end is not None else span[1]
+        for t, record in log.read(t0, t1):
+            print(f"{t - origin:10.3f}  {record}")
+
+
+if __name__ == "__main__":
+    main()
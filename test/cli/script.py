@@ -0,0 +1,515 @@
+"""
+Scripted command execution for the Arduino CLI controller
+Matches every command with the reply or readings the sketch sends back
+(with per-command timeouts) and pipelines independent commands, so a
+calibration sweep runs at link speed instead of one round trip per step.
+"""
+
+import re
+import threading
+import time
+
+from commands import command_key, supersedes
+from telemetry import ColorReading, IRReading, DistanceReading, Reply
+
+# The sketch's serial RX buffer; commands written beyond it while the board
+# is busy (a color read blocks it for ~100 ms) would be lost
+RX_BUFFER_SIZE = 64
+
+# Reply timeout for actuator and setting commands
+DEFAULT_TIMEOUT = 1.0
+
+# Sensor reads block the sketch in pulseIn(), which gives up after 1 s
+READ_TIMEOUTS = {'color': 4.0, 'ultra': 1.5, 'status': 6.0}
+
+# A command that timed out keeps absorbing its late reply for this long, so
+# the reply isn't taken for the answer to a newer command
+STALE_GRACE = 5.0
+
+# What each command waits for: 'reply' is an acknowledgement or error line,
+# the others are readings. Commands not listed wait for a reply (the sketch
+# answers unknown commands with an error).
+EXPECTED = {
+    'help': (),
+    'color': ('color',),
+    'ir': ('IR1', 'IR2'),
+    'ultra': ('distance',),
+    'status': ('color', 'IR1', 'IR2', 'distance'),
+}
+
+# Starts of the acknowledgement and error lines each command can cause
+# (arduino_cli_control.ino); "Unknown command" answers any of them
+REPLIES = {
+    'motor': ('Motor ', "Error: Format is 'motor ", 'Error: Speed', 'Error: Motor must',
+              'Error: Direction'),
+    'motors': ('Both motors', "Error: Format is 'motors ", 'Error: Speed', 'Error: Direction'),
+    'stop': ('All motors stopped',),
+    'servo': ('Servo ', "Error: Format is 'servo ", 'Error: Angle', 'Error: Servo must'),
+    'binary': ('Binary mode', "Error: Format is 'binary "),
+    'sub': ('Subscribed ', 'Unsubscribed ', "Error: Format is 'sub ", 'Error: Rate',
+            'Error: Sensor must'),
+    'unsub': ('All subscriptions stopped',),
+}
+UNKNOWN_REPLY = 'Unknown command'
+
+# Streamed readings look exactly like the answers to 'ultra', 'ir' and
+# 'color', so scripts can't start streams (run() pauses the controller's own)
+DISALLOWED = {'sub': "streamed readings can't be told apart from command answers"}
+
+
+def record_slot(record):
+    """The expectation a received record can satisfy, or None"""
+    if isinstance(record, Reply):
+        return 'reply'
+    if isinstance(record, ColorReading):
+        return 'color'
+    if isinstance(record, IRReading):
+        return record.channel
+    if isinstance(record, DistanceReading):
+        return 'distance'
+    return None
+
+
+def default_timeout(command):
+    verb = command.split(None, 1)[0].lower() if command.strip() else ""
+    return READ_TIMEOUTS.get(verb, DEFAULT_TIMEOUT)
+
+
+class CommandResult:
+    """Outcome of one command
+
+    records are the replies and readings matched to it. error is None on
+    success, the error line the sketch printed, or 'timeout'. submitted_at,
+    sent_at (on the wire) and done_at are time.monotonic() values, None
+    until they happen.
+    """
+    __slots__ = ('command', 'timeout', 'verb', 'expect', 'records', 'error',
+                 'submitted_at', 'sent_at', 'done_at', 'size')
+
+    def __init__(self, command, timeout=None):
+        self.command = command.strip()
+        self.timeout = default_timeout(self.command) if timeout is None else timeout
+        self.verb = self.command.split(None, 1)[0].lower() if self.command else ""
+        self.expect = list(EXPECTED.get(self.verb, ('reply',)))
+        self.records = []
+        self.error = None
+        self.submitted_at = None
+        self.sent_at = None
+        self.done_at = None
+        # Bytes the command occupies in the board's RX buffer
+        self.size = len(self.command) + 1
+
+    def __repr__(self):
+        return f"CommandResult({self.command!r}, ok={self.ok}, error={self.error!r})"
+
+    @property
+    def done(self):
+        return self.done_at is not None
+
+    @property
+    def ok(self):
+        return self.done and self.error is None
+
+    @property
+    def reply(self):
+        """Text of the acknowledgement or error line, if any"""
+        for record in self.records:
+            if isinstance(record, Reply):
+                return record.text
+        return None
+
+    @property
+    def readings(self):
+        return [record for record in self.records if not isinstance(record, Reply)]
+
+    @property
+    def round_trip(self):
+        """Seconds from queueing the command to its last response"""
+        if self.submitted_at is None or self.done_at is None:
+            return None
+        return self.done_at - self.submitted_at
+
+    def accepts(self, record, slot):
+        if slot not in self.expect:
+            return False
+        if slot != 'reply':
+            return True
+        text = record.text
+        if text.startswith(UNKNOWN_REPLY):
+            return True
+        return text.startswith(REPLIES.get(self.verb, ()))
+
+    def as_dict(self):
+        return {
+            'command': self.command,
+            'ok': self.ok,
+            'error': self.error,
+            'reply': self.reply,
+            'readings': [list(reading) for reading in self.readings],
+            'round_trip_ms': None if self.round_trip is None else self.round_trip * 1000,
+        }
+
+
+class ResponseMatcher:
+    """Pairs received records with the commands in flight
+
+    The sketch answers commands in the order it reads them, so a record goes
+    to the oldest command still waiting for that kind of record (and, for
+    replies, whose verb can produce that line). Not thread-safe; Correlator
+    adds locking around it.
+    """
+    def __init__(self):
+        self.in_flight = []
+        self.unmatched = 0
+
+    def add(self, result, now):
+        result.submitted_at = now
+        self.in_flight.append(result)
+
+    def sent(self, command, now):
+        """Mark the oldest unsent command with this text as on the wire"""
+        for result in self.in_flight:
+            if result.sent_at is None and result.command == command:
+                result.sent_at = now
+                if result.done:
+                    # The reader matched the answer before the writer reported the send
+                    self.in_flight.remove(result)
+                elif not result.expect:
+                    self._finish(result, now)
+                return result
+        return None
+
+    def feed(self, record, now):
+        """Match a received record; returns the command it completed, or None"""
+        slot = record_slot(record)
+        if slot is None:
+            return None
+        for result in self.in_flight:
+            if result.accepts(record, slot):
+                result.expect.remove(slot)
+                result.records.append(record)
+                if slot == 'reply' and not record.ok:
+                    result.error = result.error or record.text
+                    result.expect.clear()
+                if result.expect:
+                    return None
+                if result.done:
+                    # A late reply to a command that timed out
+                    self.in_flight.remove(result)
+                    return None
+                self._finish(result, now)
+                return result
+        self.unmatched += 1
+        return None
+
+    def expire(self, now):
+        """Time out overdue commands; returns the ones that just timed out"""
+        expired = []
+        for result in list(self.in_flight):
+            start = result.sent_at if result.sent_at is not None else result.submitted_at
+            if result.done:
+                if now > start + result.timeout + STALE_GRACE:
+                    self.in_flight.remove(result)
+            elif now > start + result.timeout:
+                result.error = 'timeout'
+                result.done_at = now
+                expired.append(result)
+        return expired
+
+    def next_deadline(self):
+        deadlines = [(r.sent_at if r.sent_at is not None else r.submitted_at) + r.timeout
+                     for r in self.in_flight if not r.done]
+        return min(deadlines) if deadlines else None
+
+    @property
+    def pending(self):
+        """Commands still waiting for an answer"""
+        return [result for result in self.in_flight if not result.done]
+
+    def _finish(self, result, now):
+        result.done_at = now
+        # Kept until the writer reports the send, so sent() can't mark a
+        # newer command with the same text instead
+        if result.sent_at is not None:
+            self.in_flight.remove(result)
+
+
+class Correlator:
+    """Thread-safe wrapper around ResponseMatcher
+
+    The controller calls sent() from the writer thread and received() from
+    the reader thread; a runner waits on the condition for either.
+    """
+    def __init__(self):
+        self.matcher = ResponseMatcher()
+        self.cond = threading.Condition()
+
+    def add(self, result):
+        with self.cond:
+            self.matcher.add(result, time.monotonic())
+
+    def sent(self, command):
+        with self.cond:
+            if self.matcher.sent(command, time.monotonic()):
+                self.cond.notify_all()
+
+    def received(self, record, now=None):
+        with self.cond:
+            if self.matcher.feed(record, time.monotonic() if now is None else now):
+                self.cond.notify_all()
+
+    def wait_until(self, predicate, timeout=None):
+        """Wait until predicate() holds, timing out overdue commands meanwhile
+
+        The predicate is evaluated with the lock held. Returns its last value.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                self.matcher.expire(now)
+                if predicate():
+                    return True
+                wake = self.matcher.next_deadline()
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wake = deadline if wake is None else min(wake, deadline)
+                self.cond.wait(None if wake is None else max(0.0, wake - now) + 0.001)
+
+
+class Wait:
+    """Script step: let every command in flight finish, then pause"""
+    __slots__ = ('seconds',)
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"Wait({self.seconds})"
+
+
+class SetTimeout:
+    """Script step: reply timeout for the following commands (None: defaults)"""
+    __slots__ = ('seconds',)
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"SetTimeout({self.seconds})"
+
+
+class ScriptError(ValueError):
+    pass
+
+
+_RANGE = re.compile(r'\{(-?\d+)\.\.(-?\d+)(?:\.\.(\d+))?\}')
+
+
+def _expand(line):
+    """Repeat a line once per value of its first {start..stop[..step]} range"""
+    match = _RANGE.search(line)
+    if match is None:
+        return [line]
+    start, stop = int(match.group(1)), int(match.group(2))
+    step = int(match.group(3) or 1)
+    if step <= 0:
+        raise ScriptError(f"bad range step in {line!r}")
+    values = range(start, stop + 1, step) if stop >= start else range(start, stop - 1, -step)
+    lines = []
+    for value in values:
+        lines.extend(_expand(line[:match.start()] + str(value) + line[match.end():]))
+    return lines
+
+
+def parse_script(text):
+    """Turn script text into steps for ScriptRunner.run()
+
+    One command per line, or several separated by ';'. '#' starts a comment.
+    Besides sketch commands:
+        wait <seconds>      finish everything in flight, then pause
+        sync                finish everything in flight
+        timeout <seconds>   reply timeout for the following commands
+        timeout default     back to the per-command defaults
+    A {start..stop[..step]} range repeats the whole line for each value:
+        servo 1 {0..180..10}; wait 0.2; ultra
+    'sub' is rejected (see DISALLOWED).
+    """
+    steps = []
+    for lineno, raw in enumerate(text.splitlines(), 1):
+        line = raw.split('#', 1)[0].strip()
+        if not line:
+            continue
+        try:
+            expanded = _expand(line)
+        except ScriptError as e:
+            raise ScriptError(f"line {lineno}: {e}") from None
+        for part in (p.strip() for l in expanded for p in l.split(';')):
+            if not part:
+                continue
+            words = part.split()
+            verb = words[0].lower()
+            if verb in DISALLOWED:
+                raise ScriptError(f"line {lineno}: {verb!r} is not allowed in scripts "
+                                  f"({DISALLOWED[verb]})")
+            try:
+                if verb in ('wait', 'sleep'):
+                    steps.append(Wait(float(words[1]) if len(words) > 1 else 0.0))
+                elif verb == 'sync':
+                    steps.append(Wait())
+                elif verb == 'timeout':
+                    value = words[1] if len(words) > 1 else 'default'
+                    steps.append(SetTimeout(None if value == 'default' else float(value)))
+                else:
+                    steps.append(part)
+            except ValueError:
+                raise ScriptError(f"line {lineno}: bad number in {part!r}") from None
+    return steps
+
+
+class ScriptRunner:
+    """Run commands on a connected ArduinoTerminalController
+
+    Commands are pipelined: each is queued as soon as the bytes of the
+    commands still awaiting an answer leave room in the board's RX buffer
+    (`window`). A command is held back only while an unsent one it would
+    coalesce with is still in the writer queue, so every step reaches the
+    board. Wait steps are barriers, which keeps timed sequences timed.
+    """
+    def __init__(self, controller, window=RX_BUFFER_SIZE):
+        self.controller = controller
+        self.window = window
+        self.correlator = Correlator()
+        self.timeout = None
+
+    def __enter__(self):
+        self.controller.correlator = self.correlator
+        return self
+
+    def __exit__(self, *exc):
+        if self.controller.correlator is self.correlator:
+            self.controller.correlator = None
+
+    def _has_room(self, result, key):
+        pending = self.correlator.matcher.pending
+        if any(r.sent_at is None and supersedes(key, command_key(r.command)) for r in pending):
+            return False
+        return not pending or sum(r.size for r in pending) + result.size <= self.window
+
+    def submit(self, command, timeout=None):
+        """Queue one command once there is room; returns its CommandResult"""
+        result = CommandResult(command, self.timeout if timeout is None else timeout)
+        if not result.command:
+            raise ScriptError("empty command")
+        verb = result.command.split()[0].lower()
+        if verb in DISALLOWED:
+            raise ScriptError(f"{verb!r} is not allowed in scripts ({DISALLOWED[verb]})")
+        if not self.controller.connected:
+            result.error = "not connected"
+            result.done_at = time.monotonic()
+            return result
+        key = command_key(result.command)
+        self.correlator.wait_until(lambda: self._has_room(result, key))
+        self.correlator.add(result)
+        self.controller.send_command(result.command)
+        return result
+
+    def drain(self):
+        """Wait until every command sent so far has been answered or timed out"""
+        matcher = self.correlator.matcher
+        self.correlator.wait_until(lambda: not matcher.pending)
+
+    def execute(self, command, timeout=None):
+        """Send one command and wait for its answer"""
+        with self:
+            result = self.submit(command, timeout)
+            self.correlator.wait_until(lambda: result.done)
+        return result
+
+    def run(self, steps, on_result=None):
+        """Run script steps (command strings, Wait, SetTimeout); returns CommandResults
+
+        `on_result` is called with each result in script order as soon as it
+        and everything before it are done. Sensor streams are paused for the
+        duration of the run.
+        """
+        if isinstance(steps, str):
+            steps = parse_script(steps)
+        results = []
+        reported = 0
+
+        def report():
+            nonlocal reported
+            while on_result and reported < len(results) and results[reported].done:
+                on_result(results[reported])
+                reported += 1
+
+        with self:
+            self._pause_streams()
+            try:
+                self._run_steps(steps, results, report)
+                self.drain()
+                report()
+            finally:
+                self._resume_streams()
+        return results
+
+    def _run_steps(self, steps, results, report):
+        for step in steps:
+            if isinstance(step, Wait):
+                self.drain()
+                report()
+                if step.seconds > 0:
+                    time.sleep(step.seconds)
+            elif isinstance(step, SetTimeout):
+                self.timeout = step.seconds
+            else:
+                results.append(self.submit(step))
+                report()
+
+    def _pause_streams(self):
+        """Stop streaming before the first command and wait for the board to confirm
+
+        Sent even when the controller has no streams: the board may still be
+        running ones from an earlier session. Readings already on the way
+        arrive before the acknowledgement, so none is taken for an answer.
+        """
+        for command in self.controller.subscriptions.pause():
+            result = self.submit(command)
+            self.correlator.wait_until(lambda: result.done)
+
+    def _resume_streams(self):
+        for command in self.controller.subscriptions.unpause():
+            self.controller.send_command(command)
+
+
+def summarize(results):
+    """Counts and round-trip figures for a finished run"""
+    trips = sorted(r.round_trip for r in results if r.ok and r.round_trip is not None)
+    return {
+        'commands': len(results),
+        'ok': sum(1 for r in results if r.ok),
+        'errors': sum(1 for r in results if r.error not in (None, 'timeout')),
+        'timeouts': sum(1 for r in results if r.error == 'timeout'),
+        'round_trip_p50_ms': trips[len(trips) // 2] * 1000 if trips else None,
+        'round_trip_max_ms': trips[-1] * 1000 if trips else None,
+    }
+
+
+def format_result(result):
+    """One line per command for the headless runner's output"""
+    status = "ok" if result.ok else ("TIMEOUT" if result.error == 'timeout' else "ERROR")
+    trip = f"{result.round_trip * 1000:7.1f} ms" if result.round_trip is not None else "      - ms"
+    detail = result.error if result.error and result.error != 'timeout' else result.reply
+    if result.readings:
+        detail = " ".join(_format_reading(r) for r in result.readings)
+    return f"{status:<7} {trip}  {result.command}" + (f"  -> {detail}" if detail else "")
+
+
+def _format_reading(reading):
+    if isinstance(reading, ColorReading):
+        return f"R={reading.r} G={reading.g} B={reading.b}"
+    if isinstance(reading, IRReading):
+        return f"{reading.channel}={reading.value}"
+    return f"{reading.cm:.2f}cm" + ("(out of range)" if reading.out_of_range else "")
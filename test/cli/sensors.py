@@ -0,0 +1,94 @@
+"""
+Sensor state shared by the Arduino CLI controllers
+Histories, filters, color classification and the published snapshot for
+each decoded reading, and restoring a board after its port reopened. Both
+ArduinoTerminalController (reader thread) and AsyncController (event loop)
+use this, so the two ingest paths stay the same.
+"""
+
+from colors import DriftMonitor, default_classifier
+from filters import FilterBank
+from history import RingBuffer, DEFAULT_CAPACITY
+from snapshot import SensorSnapshot
+from telemetry import ColorReading, IRReading, DistanceReading, Reply
+
+
+class SensorState:
+    """Mixin with one board's sensor state
+
+    The controller calls init_sensors() from __init__ and ingest() for every
+    decoded record. It provides `metrics`, `subscriptions`, `binary_mode`,
+    `reconnects` and send_command().
+    """
+    def init_sensors(self, history=DEFAULT_CAPACITY):
+        # Latest sensor readings, replaced as a whole on every reading
+        self.snapshot = SensorSnapshot()
+        # Outlier rejection, smoothing and IR detection on the ingest path
+        self.filters = FilterBank()
+        # Named colors from calibrated RGB pulse widths (see set_classifier)
+        self.classifier = default_classifier()
+        self.color_drift = DriftMonitor(self.classifier)
+
+        # Timestamped history for graphs (hours of readings per channel by default)
+        self.color_history = {'R': RingBuffer(history), 'G': RingBuffer(history),
+                              'B': RingBuffer(history)}
+        self.distance_history = RingBuffer(history)
+        self.ir1_history = RingBuffer(history)
+        self.ir2_history = RingBuffer(history)
+        # The same channels after filtering (rejected samples are left out)
+        self.distance_filtered_history = RingBuffer(history)
+        self.ir1_filtered_history = RingBuffer(history)
+        self.ir2_filtered_history = RingBuffer(history)
+
+        self.last_reply = ""
+
+    def set_classifier(self, classifier):
+        """Classify color readings with `classifier` (e.g. ColorClassifier.load(path))"""
+        self.classifier = classifier
+        self.color_drift = DriftMonitor(classifier)
+
+    def ingest(self, reading, now):
+        """Store a decoded record received at `now`; returns the new snapshot
+
+        The snapshot is published after the histories, so a new seq means
+        they hold the reading too; readers see either the old or the new
+        snapshot, never a mix. Replies leave the snapshot as it is.
+        """
+        filtered = detected = color_class = None
+        if isinstance(reading, ColorReading):
+            self.color_history['R'].append(reading.r, now)
+            self.color_history['G'].append(reading.g, now)
+            self.color_history['B'].append(reading.b, now)
+            color_class = self.classifier.classify(reading.r, reading.g, reading.b)
+            self.color_drift.update(reading, color_class)
+        elif isinstance(reading, IRReading):
+            if reading.channel == 'IR1':
+                channel, history, filtered_history = 'ir1', self.ir1_history, self.ir1_filtered_history
+            else:
+                channel, history, filtered_history = 'ir2', self.ir2_history, self.ir2_filtered_history
+            history.append(reading.value, now)
+            filtered = self.filters.update(channel, reading.value)
+            if filtered is not None:
+                filtered_history.append(filtered, now)
+            detected = self.filters.detected(channel)
+        elif isinstance(reading, DistanceReading):
+            self.distance_history.append(reading.cm, now)
+            filtered = self.filters.update('distance', reading.cm)
+            if filtered is not None:
+                self.distance_filtered_history.append(filtered, now)
+        elif isinstance(reading, Reply):
+            self.last_reply = reading.text
+            self.metrics.reply(now)
+            return self.snapshot
+        snapshot = self.snapshot = self.snapshot.updated(reading, now, filtered, detected, color_class)
+        return snapshot
+
+    def _reconnected(self, port):
+        """Mark the link up after the port reopened and restore what the board's reset lost"""
+        self.connected = True
+        self.reconnects += 1
+        self.status_msg = f"Reconnected to {port}"
+        if self.binary_mode:
+            self.send_command("binary on")
+        for command in self.subscriptions.resume():
+            self.send_command(command)
@@ -0,0 +1,374 @@
+"""
+Local telemetry fan-out for the Arduino CLI controller
+Publishes every parsed reading, reply and sent command as JSON lines to any
+number of local subscribers (Unix socket or localhost TCP), and serves the
+controller's metrics in Prometheus text format next to it. Each subscriber
+has a bounded buffer that drops its oldest lines when the subscriber falls
+behind, so a slow consumer never holds up serial ingest or the dashboard.
+Lines a subscriber sends are queued as commands on the controller's single
+command writer; binary mode and stream commands go through the controller,
+so its link budget and packet format stay in step with the board.
+
+Try it with:
+    python cli.py --sim --serve 127.0.0.1:8765
+    nc 127.0.0.1 8765                      # stream; type "stop" to send it
+    curl http://127.0.0.1:8766/metrics
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import controller_snapshot, prometheus_text
+from streaming import STREAM_SENSORS, MAX_RATE_HZ
+from telemetry import ColorReading, IRReading, DistanceReading, Reply
+
+# Lines buffered per subscriber before the oldest are dropped
+SUBSCRIBER_BUFFER = 1024
+
+# Longest command line accepted from a subscriber
+MAX_COMMAND_BYTES = 128
+
+DEFAULT_HOST = '127.0.0.1'
+
+
+def parse_address(spec):
+    """('unix', path) or ('tcp', (host, port)) from "unix:PATH", a path, "HOST:PORT" or "PORT\""""
+    if spec.startswith('unix:'):
+        return 'unix', spec[5:]
+    if '/' in spec:
+        return 'unix', spec
+    host, _, port = spec.rpartition(':')
+    try:
+        return 'tcp', (host or DEFAULT_HOST, int(port))
+    except ValueError:
+        raise ValueError(f"bad server address {spec!r} (expected HOST:PORT, PORT or a socket path)") from None
+
+
+def metrics_address_for(address):
+    """Default metrics address next to a stream address: port + 1, or PATH.metrics"""
+    kind, where = address
+    if kind == 'unix':
+        return 'unix', where + '.metrics'
+    return 'tcp', (where[0], where[1] + 1)
+
+
+def format_address(address):
+    kind, where = address
+    return where if kind == 'unix' else f"{where[0]}:{where[1]}"
+
+
+def encode_record(record, t, snapshot=None):
+    """One JSON line for a reading or reply, with the derived values in `snapshot`"""
+    if isinstance(record, ColorReading):
+        msg = {'type': 'color', 't': t, 'r': record.r, 'g': record.g, 'b': record.b}
+        color_class = snapshot.color_class if snapshot is not None else None
+        if color_class is not None:
+            msg['color'] = color_class.color
+            msg['confidence'] = round(color_class.confidence, 3)
+    elif isinstance(record, IRReading):
+        msg = {'type': 'ir', 't': t, 'channel': record.channel, 'value': record.value}
+        if snapshot is not None:
+            msg['detected'] = snapshot.ir1_detected if record.channel == 'IR1' else snapshot.ir2_detected
+    elif isinstance(record, DistanceReading):
+        msg = {'type': 'distance', 't': t, 'cm': record.cm, 'out_of_range': record.out_of_range}
+        if snapshot is not None and snapshot.distance_filtered is not None:
+            msg['filtered'] = round(snapshot.distance_filtered, 2)
+    elif isinstance(record, Reply):
+        msg = {'type': 'reply', 't': t, 'ok': record.ok, 'text': record.text}
+    else:
+        return None
+    return (json.dumps(msg, separators=(',', ':')) + '\n').encode()
+
+
+class Subscriber:
+    """One connected client: a bounded line buffer and its counters"""
+    def __init__(self, name, writer, maxlen=SUBSCRIBER_BUFFER):
+        self.name = name
+        self.writer = writer
+        self.buffer = deque(maxlen=maxlen)
+        self.wakeup = asyncio.Event()
+        self.connected_at = time.monotonic()
+        self.sent = 0
+        self.dropped = 0
+        self.commands = 0
+        self._reported_drops = 0
+
+    def offer(self, line):
+        """Add a line, dropping the oldest when full; called from any thread"""
+        buffer = self.buffer
+        if len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        buffer.append(line)
+
+
+class TelemetryServer:
+    """Fan-out server running its own event loop on a background thread
+
+    publish() and publish_command() are called from the controller's reader
+    and writer threads; they only append to the subscriber buffers and
+    schedule one wakeup per batch, never touching a socket.
+    """
+    def __init__(self, controller, address, metrics_address=None, buffer=SUBSCRIBER_BUFFER):
+        self.controller = controller
+        self.address = parse_address(address) if isinstance(address, str) else address
+        if metrics_address is None:
+            metrics_address = metrics_address_for(self.address)
+        elif isinstance(metrics_address, str):
+            metrics_address = parse_address(metrics_address)
+        self.metrics_address = metrics_address
+        self.buffer = buffer
+        self.subscribers = []
+        self.published = 0
+        self.clients = 0
+        self.commands = 0
+        # Lines dropped for subscribers that have since disconnected
+        self._dropped_closed = 0
+        self.loop = None
+        self.thread = None
+        self._servers = []
+        self._wake_pending = False
+        self._started = threading.Event()
+        self._error = None
+        # Readings carry wall-clock time for consumers in other processes
+        self._wall_offset = time.time() - time.monotonic()
+
+    def start(self):
+        """Bind both endpoints; raises OSError if either cannot be bound"""
+        self.thread = threading.Thread(target=self._run, name="telemetry-server", daemon=True)
+        self.thread.start()
+        self._started.wait()
+        if self._error:
+            self.thread.join()
+            raise self._error
+
+    def stop(self, timeout=1.0):
+        loop = self.loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(loop.stop)
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout)
+        for kind, where in (self.address, self.metrics_address):
+            if kind == 'unix':
+                try:
+                    os.unlink(where)
+                except OSError:
+                    pass
+
+    def _run(self):
+        loop = self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            try:
+                loop.run_until_complete(self._listen())
+            except OSError as e:
+                self._error = e
+                return
+            finally:
+                self._started.set()
+            loop.run_forever()
+        finally:
+            for server in self._servers:
+                server.close()
+            for sub in self.subscribers:
+                sub.writer.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    async def _listen(self):
+        self._servers.append(await self._bind(self.address, self._serve_subscriber))
+        self._servers.append(await self._bind(self.metrics_address, self._serve_metrics))
+
+    async def _bind(self, address, handler):
+        kind, where = address
+        if kind == 'tcp':
+            return await asyncio.start_server(handler, *where)
+        if os.path.exists(where):
+            # Stale socket left by a previous run
+            os.unlink(where)
+        server = await asyncio.start_unix_server(handler, where)
+        # Anyone who can connect can drive the motors
+        os.chmod(where, 0o600)
+        return server
+
+    # Called from the controller's threads
+
+    def publish(self, record, now, snapshot=None):
+        """Queue a reading or reply (received at monotonic time `now`) for every subscriber"""
+        subscribers = self.subscribers
+        if not subscribers:
+            return
+        line = encode_record(record, round(now + self._wall_offset, 4), snapshot)
+        if line is not None:
+            self._fan_out(subscribers, line)
+
+    def publish_command(self, command):
+        """Queue a sent command for every subscriber"""
+        subscribers = self.subscribers
+        if not subscribers:
+            return
+        msg = {'type': 'command', 't': round(time.time(), 4), 'text': command}
+        self._fan_out(subscribers, (json.dumps(msg, separators=(',', ':')) + '\n').encode())
+
+    def _fan_out(self, subscribers, line):
+        self.published += 1
+        for sub in subscribers:
+            sub.offer(line)
+        if not self._wake_pending:
+            self._wake_pending = True
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # Loop already closed (server stopping)
+                pass
+
+    # Event loop side
+
+    def _wake(self):
+        self._wake_pending = False
+        for sub in self.subscribers:
+            if sub.buffer:
+                sub.wakeup.set()
+
+    async def _serve_subscriber(self, reader, writer):
+        self.clients += 1
+        peer = writer.get_extra_info('peername')
+        name = f"{peer[0]}:{peer[1]}" if isinstance(peer, tuple) else f"unix-{self.clients}"
+        sub = Subscriber(name, writer, self.buffer)
+        # Replace the list so the reader thread iterates a stable one
+        self.subscribers = self.subscribers + [sub]
+        commands = asyncio.get_running_loop().create_task(self._read_commands(reader, sub))
+        try:
+            # A client that only listens may half-close its side; stream until the connection is gone
+            while not writer.is_closing():
+                await sub.wakeup.wait()
+                sub.wakeup.clear()
+                buffer = sub.buffer
+                lines = []
+                if sub.dropped != sub._reported_drops:
+                    lines.append(json.dumps({'type': 'dropped',
+                                             'count': sub.dropped - sub._reported_drops}).encode() + b'\n')
+                    sub._reported_drops = sub.dropped
+                while buffer:
+                    lines.append(buffer.popleft())
+                if not lines:
+                    continue
+                writer.write(b''.join(lines))
+                sub.sent += len(lines)
+                # While this waits the buffer keeps filling and sheds old lines
+                await writer.drain()
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            # Cancelled: the server is stopping
+            pass
+        finally:
+            commands.cancel()
+            self.subscribers = [s for s in self.subscribers if s is not sub]
+            self._dropped_closed += sub.dropped
+            writer.close()
+
+    async def _read_commands(self, reader, sub):
+        """Each line a subscriber sends is a sketch command"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line[:MAX_COMMAND_BYTES].decode('utf-8', errors='ignore').strip()
+                if command:
+                    sub.commands += 1
+                    self.commands += 1
+                    error = self._apply_command(command)
+                    if error:
+                        msg = {'type': 'error', 'command': command, 'text': error}
+                        sub.offer((json.dumps(msg, separators=(',', ':')) + '\n').encode())
+                        sub.wakeup.set()
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            # Let the sender loop notice a closed connection
+            sub.wakeup.set()
+
+    def _apply_command(self, command):
+        """Send a subscriber's command; returns why it was refused, or None
+
+        Binary mode and streams change what the controller expects from the
+        link, so those commands go through the controller instead of
+        straight to the writer. The sketch lowercases commands too.
+        """
+        controller = self.controller
+        words = command.lower().split()
+        verb = words[0]
+        if verb == 'binary':
+            if len(words) != 2 or words[1] not in ('on', 'off'):
+                return "expected 'binary on' or 'binary off'"
+            controller.set_binary_mode(words[1] == 'on')
+        elif verb == 'sub':
+            if len(words) != 3 or words[1] not in STREAM_SENSORS:
+                return f"expected 'sub <{'/'.join(STREAM_SENSORS)}> <hz>'"
+            try:
+                hz = int(words[2])
+            except ValueError:
+                hz = -1
+            if not 0 <= hz <= MAX_RATE_HZ:
+                return f"rate must be 0-{MAX_RATE_HZ} Hz"
+            # Other streams keep their requested rates; the controller fits them all to the link
+            rates = dict(controller.subscriptions.requested)
+            rates[words[1]] = hz
+            controller.subscribe(rates)
+        elif verb == 'unsub':
+            controller.unsubscribe()
+        else:
+            controller.send_command(command)
+        return None
+
+    async def _serve_metrics(self, reader, writer):
+        """Minimal HTTP: any GET gets the metrics page"""
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            if request.split(b' ', 1)[0] not in (b'GET', b'HEAD'):
+                body, status = b'method not allowed\n', b'405 Method Not Allowed'
+            else:
+                body, status = self.metrics_text().encode(), b'200 OK'
+            writer.write(b'HTTP/1.0 ' + status + b'\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n')
+            if not request.startswith(b'HEAD'):
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    @property
+    def dropped(self):
+        """Lines dropped for all subscribers since the server started"""
+        return self._dropped_closed + sum(sub.dropped for sub in self.subscribers)
+
+    def stats(self):
+        """Server counters for controller_snapshot()"""
+        now = time.monotonic()
+        return {
+            'address': format_address(self.address),
+            'subscribers': len(self.subscribers),
+            'clients_total': self.clients,
+            'published': self.published,
+            'commands': self.commands,
+            'dropped': self.dropped,
+            'clients': {sub.name: {'sent': sub.sent, 'dropped': sub.dropped,
+                                   'buffered': len(sub.buffer), 'commands': sub.commands,
+                                   'connected_s': now - sub.connected_at}
+                        for sub in self.subscribers},
+        }
+
+    def metrics_text(self):
+        return prometheus_text(controller_snapshot(self.controller))
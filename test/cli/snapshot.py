@@ -0,0 +1,103 @@
+"""
+Versioned sensor snapshots for the Arduino CLI controller
+The reader publishes the latest readings as one immutable SensorSnapshot
+by rebinding a single attribute, so the UI always sees a consistent set of
+values (never half an RGB triple) and can tell from `seq` whether anything
+changed since its last frame.
+"""
+
+from telemetry import ColorReading, IRReading, DistanceReading
+
+
+class SensorSnapshot:
+    """Latest reading of every sensor, with receive times; never modified
+
+    seq counts readings since the controller started; `t` is the receive
+    time of the newest one and `<sensor>_t` of each sensor's (time.monotonic(),
+    None before the first reading). counts are readings per sensor as
+    (color, ir, ultrasonic). ir1, ir2 and distance are raw; `<ir>_detected`
+    and distance_filtered come from the ingest filters (filters.py), and
+    color_class is the colors.Classification of `color`.
+    """
+    __slots__ = ('seq', 't', 'color', 'color_t', 'color_class', 'ir1', 'ir1_t', 'ir1_detected',
+                 'ir2', 'ir2_t', 'ir2_detected', 'distance', 'distance_t',
+                 'distance_filtered', 'counts')
+
+    def __init__(self, seq=0, t=None, color=ColorReading(0, 0, 0), color_t=None, color_class=None,
+                 ir1=0, ir1_t=None, ir1_detected=False, ir2=0, ir2_t=None, ir2_detected=False,
+                 distance=DistanceReading(0.0, False), distance_t=None, distance_filtered=None,
+                 counts=(0, 0, 0)):
+        init = object.__setattr__
+        init(self, 'seq', seq)
+        init(self, 't', t)
+        init(self, 'color', color)
+        init(self, 'color_t', color_t)
+        init(self, 'color_class', color_class)
+        init(self, 'ir1', ir1)
+        init(self, 'ir1_t', ir1_t)
+        init(self, 'ir1_detected', ir1_detected)
+        init(self, 'ir2', ir2)
+        init(self, 'ir2_t', ir2_t)
+        init(self, 'ir2_detected', ir2_detected)
+        init(self, 'distance', distance)
+        init(self, 'distance_t', distance_t)
+        init(self, 'distance_filtered', distance_filtered)
+        init(self, 'counts', counts)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SensorSnapshot is immutable")
+
+    def __repr__(self):
+        return (f"SensorSnapshot(seq={self.seq}, color={tuple(self.color)}, ir=({self.ir1}, {self.ir2}), "
+                f"distance={self.distance.cm:.2f})")
+
+    def _fields(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def updated(self, reading, now, filtered=None, detected=None, color_class=None):
+        """Return the snapshot that follows this one after `reading`, or self if it isn't a sensor reading
+
+        `filtered` is the distance after filtering (None keeps the previous
+        one, e.g. for a rejected sample); `detected` is an IR channel's
+        detection decision (None keeps the previous one); `color_class`
+        classifies a color reading.
+        """
+        fields = self._fields()
+        color, ir, ultrasonic = self.counts
+        if isinstance(reading, ColorReading):
+            fields['color'] = reading
+            fields['color_t'] = now
+            fields['color_class'] = color_class
+            color += 1
+        elif isinstance(reading, IRReading):
+            key = 'ir1' if reading.channel == 'IR1' else 'ir2'
+            fields[key] = reading.value
+            fields[key + '_t'] = now
+            if detected is not None:
+                fields[key + '_detected'] = detected
+            ir += 1
+        elif isinstance(reading, DistanceReading):
+            fields['distance'] = reading
+            fields['distance_t'] = now
+            if filtered is not None:
+                fields['distance_filtered'] = filtered
+            ultrasonic += 1
+        else:
+            return self
+        fields['seq'] = self.seq + 1
+        fields['t'] = now
+        fields['counts'] = (color, ir, ultrasonic)
+        return SensorSnapshot(**fields)
+
+    @property
+    def readings(self):
+        """Sensor readings received in total"""
+        return sum(self.counts)
+
+
+def format_age(t, now):
+    """Age of a reading for display: '-' before the first one"""
+    if t is None:
+        return "-"
+    age = max(0.0, now - t)
+    return f"{age:.1f} s" if age < 10 else f"{age:.0f} s"
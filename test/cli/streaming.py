@@ -0,0 +1,156 @@
+"""
+Sensor streaming subscriptions for the Arduino CLI controller
+Plans per-sensor rates for the sketch's "sub" command so the stream fits the
+serial link, then watches actual link utilization and backs rates off (or
+restores them) while streaming.
+"""
+
+import time
+
+STREAM_SENSORS = ('color', 'ir', 'ultra')
+MAX_RATE_HZ = 100
+MIN_RATE_HZ = 1
+
+# Bytes one sample puts on the wire: the text lines serviceStreams() prints
+# ("  R: 123  G: 45  B: 67", two IR lines, "Distance: ..."), or one packet
+SAMPLE_BYTES = {
+    False: {'color': 26, 'ir': 40, 'ultra': 38},
+    True: {'color': 10, 'ir': 10, 'ultra': 10},
+}
+
+# Rates used by the dashboard's auto-refresh
+DEFAULT_RATES = {'color': 10, 'ir': 20, 'ultra': 10}
+
+
+def link_budget(baudrate):
+    """Bytes per second a UART link carries (8N1: 10 bits per byte)"""
+    return baudrate / 10.0
+
+
+class SubscriptionManager:
+    """Requested vs. effective stream rates, adjusted to the link budget
+
+    request() and observe() return the "sub" commands needed to move the
+    board to the new effective rates; the caller sends them.
+    """
+    def __init__(self, baudrate=9600, target=0.8, window=1.0):
+        self.budget = link_budget(baudrate)
+        self.target = target          # fraction of the budget to plan for
+        self.window = window          # seconds per utilization measurement
+        self.binary = False
+        self.paused = False
+        self.requested = {}
+        self.rates = {}
+        self.bytes_per_sec = 0.0
+        self.utilization = 0.0
+        self.adjustments = 0
+        self._window_start = None
+        self._window_bytes = 0
+
+    @property
+    def active(self):
+        return any(self.rates.values())
+
+    def estimated_load(self, rates=None, binary=None):
+        """Bytes per second the given rates should produce"""
+        sizes = SAMPLE_BYTES[self.binary if binary is None else binary]
+        rates = self.rates if rates is None else rates
+        return sum(hz * sizes[sensor] for sensor, hz in rates.items())
+
+    def request(self, rates, binary=None):
+        """Ask for new rates (Hz per sensor); returns commands to send"""
+        if binary is not None:
+            self.binary = binary
+        self.requested = {s: max(0, min(MAX_RATE_HZ, int(hz))) for s, hz in rates.items()
+                          if s in STREAM_SENSORS}
+        return self._apply(self._fit(self.requested))
+
+    def set_binary(self, binary):
+        """Re-plan for a different sample size; returns commands to send"""
+        self.binary = binary
+        if not self.requested:
+            return []
+        return self._apply(self._fit(self.requested))
+
+    def pause(self):
+        """Stop the board's streams but keep the planned rates; returns the command to send
+
+        While paused, rate changes are planned but not sent; unpause()
+        restores them.
+        """
+        self.paused = True
+        return ["unsub"]
+
+    def unpause(self):
+        """Commands that restart the streams stopped by pause()"""
+        self.paused = False
+        return self.resume()
+
+    def resume(self):
+        """Commands that restore the current rates on a board that was reset"""
+        if self.paused:
+            return []
+        self._window_start = None
+        self._window_bytes = 0
+        return [f"sub {sensor} {hz}" for sensor, hz in self.rates.items() if hz]
+
+    def stop(self):
+        """Drop all subscriptions; returns the command to send"""
+        self.requested = {}
+        self.rates = {}
+        return ["unsub"]
+
+    def _fit(self, rates):
+        """Scale rates down proportionally until the estimate fits the budget"""
+        allowed = self.budget * self.target
+        load = self.estimated_load(rates)
+        if load <= allowed or load == 0:
+            return dict(rates)
+        scale = allowed / load
+        return {s: (max(MIN_RATE_HZ, int(hz * scale)) if hz else 0) for s, hz in rates.items()}
+
+    def _apply(self, rates):
+        # Start a fresh measurement so traffic from before the change (banner,
+        # replies, old rates) doesn't trigger an immediate adjustment
+        self._window_start = None
+        self._window_bytes = 0
+        commands = [f"sub {sensor} {hz}" for sensor, hz in rates.items()
+                    if self.rates.get(sensor, 0) != hz]
+        self.rates = rates
+        return [] if self.paused else commands
+
+    def observe(self, nbytes, now=None):
+        """Account received bytes; returns commands when rates need adjusting"""
+        if now is None:
+            now = time.monotonic()
+        if self._window_start is None:
+            self._window_start = now
+        self._window_bytes += nbytes
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return []
+
+        self.bytes_per_sec = self._window_bytes / elapsed
+        self.utilization = self.bytes_per_sec / self.budget
+        self._window_start = now
+        self._window_bytes = 0
+        if not self.active or self.paused:
+            return []
+
+        if self.utilization > 0.95:
+            # Saturated: readings queue up in the board's TX buffer and arrive
+            # late, so shrink every stream in proportion to the overshoot
+            scale = self.target / self.utilization
+            rates = {s: (max(MIN_RATE_HZ, int(hz * scale)) if hz else 0)
+                     for s, hz in self.rates.items()}
+        elif self.utilization < self.target / 2 and self.rates != self.requested:
+            # Plenty of headroom again: step back toward what was asked for
+            rates = {s: min(self.requested.get(s, 0), max(hz + 1, int(hz * 1.5)))
+                     for s, hz in self.rates.items()}
+            rates = self._fit(rates)
+        else:
+            return []
+        commands = self._apply(rates)
+        if commands:
+            self.adjustments += 1
+        return commands
@@ -0,0 +1,252 @@
+"""
+Telemetry records and stream decoding for the Arduino CLI controller
+Splits the serial byte stream into text lines and binary sensor packets
+"""
+
+import re
+import struct
+from collections import Counter, namedtuple
+
+# Binary packet layout (little endian, 10 bytes):
+#   sync (0xA5) | sensor id | sequence | value a | value b | value c | checksum
+# The checksum is the XOR of every byte between sync and checksum. The sync
+# byte is outside 7-bit ASCII, so it never appears in the firmware's text output.
+SYNC = 0xA5
+SYNC_BYTE = bytes([SYNC])
+PACKET = struct.Struct('<BBBHHHB')
+PACKET_SIZE = PACKET.size
+
+SENSOR_COLOR = 0x01       # a, b, c = red, green, blue pulse widths
+SENSOR_IR = 0x02          # a, b = IR1, IR2
+SENSOR_ULTRASONIC = 0x03  # a = distance in 1/100 cm, b = 1 if out of range
+
+ColorReading = namedtuple('ColorReading', 'r g b')
+IRReading = namedtuple('IRReading', 'channel value')
+DistanceReading = namedtuple('DistanceReading', 'cm out_of_range')
+# Acknowledgement ("Motor A set to ...") or error ("Error: ...") printed after a command
+Reply = namedtuple('Reply', 'ok text')
+
+# Range readUltrasonic() considers valid
+ULTRASONIC_MIN_CM = 2.0
+ULTRASONIC_MAX_CM = 400.0
+
+# Printed by setup() once the sketch is running, and before every command
+BANNER_TEXT = b'Arduino Multi-Sensor Control System'
+PROMPT = b'> '
+
+
+def packet_checksum(sensor_id, seq, a, b, c):
+    """XOR of the eight bytes covered by the checksum"""
+    x = sensor_id ^ seq ^ a ^ b ^ c
+    return (x ^ (x >> 8)) & 0xFF
+
+
+def encode_packet(sensor_id, seq, a=0, b=0, c=0):
+    """Build a packet the way the firmware's sendPacket() does"""
+    seq &= 0xFF
+    return PACKET.pack(SYNC, sensor_id, seq, a, b, c,
+                       packet_checksum(sensor_id, seq, a, b, c))
+
+
+def decode_packet(sensor_id, a, b, c):
+    """Turn packet fields into reading records"""
+    if sensor_id == SENSOR_COLOR:
+        return (ColorReading(a, b, c),)
+    if sensor_id == SENSOR_IR:
+        return (IRReading('IR1', a), IRReading('IR2', b))
+    if sensor_id == SENSOR_ULTRASONIC:
+        return (DistanceReading(a / 100.0, bool(b)),)
+    return ()
+
+
+class StreamDecoder:
+    """Incrementally split serial bytes into text lines and binary readings
+
+    feed() returns events in arrival order: text lines as str, decoded
+    packets as reading records. Partial lines and partial packets are kept
+    until the rest of their bytes arrive.
+    """
+    def __init__(self):
+        self._buf = bytearray()
+        self._text = bytearray()
+        self._last_seq = None
+        self.packets = 0
+        self.bad_packets = 0
+        self.lost_packets = 0
+
+    @property
+    def pending(self):
+        """Text received after the last newline"""
+        return self._text.decode('utf-8', errors='ignore')
+
+    def feed(self, data):
+        """Decode a chunk of bytes and return the events it completes"""
+        events = []
+        buf = self._buf
+        buf += data
+        if SYNC not in buf:
+            # Text-only fast path
+            self._add_text(buf, events)
+            buf.clear()
+            return events
+
+        view = memoryview(buf)
+        size = len(buf)
+        pos = 0
+        try:
+            while pos < size:
+                start = buf.find(SYNC_BYTE, pos)
+                if start < 0:
+                    self._add_text(view[pos:], events)
+                    pos = size
+                    break
+                if start > pos:
+                    self._add_text(view[pos:start], events)
+                # Consume back-to-back packets without going through the text path
+                while start + PACKET_SIZE <= size and buf[start] == SYNC:
+                    _, sensor_id, seq, a, b, c, checksum = PACKET.unpack_from(view, start)
+                    if checksum != packet_checksum(sensor_id, seq, a, b, c):
+                        break
+                    self._count_seq(seq)
+                    events.extend(decode_packet(sensor_id, a, b, c))
+                    start += PACKET_SIZE
+                pos = start
+                if pos >= size or buf[pos] != SYNC:
+                    continue
+                if pos + PACKET_SIZE > size:
+                    # Partial packet; wait for more bytes
+                    break
+                # Sync byte with a bad checksum: skip it and resynchronize
+                self.bad_packets += 1
+                pos += 1
+        finally:
+            view.release()
+        del buf[:pos]
+        return events
+
+    def _add_text(self, chunk, events):
+        text = self._text
+        scanned = len(text)
+        text += chunk
+        if text.find(b'\n', scanned) < 0:
+            return
+        lines = bytes(text).split(b'\n')
+        text[:] = lines.pop()
+        events.extend(line.decode('utf-8', errors='ignore') for line in lines)
+
+    def _count_seq(self, seq):
+        if self._last_seq is not None:
+            self.lost_packets += (seq - self._last_seq - 1) & 0xFF
+        self._last_seq = seq
+        self.packets += 1
+
+
+class ReadyDetector:
+    """Spot the startup banner or a command prompt in raw serial bytes
+
+    Either means the sketch is running and reading commands. The prompt only
+    counts at the start of a line; the help text contains "> " mid-line.
+    """
+    def __init__(self):
+        self._tail = b'\n'
+        self.ready = False
+        # Bytes of the chunk that made the board ready, after the banner or prompt
+        self.rest = b''
+
+    def feed(self, data):
+        """Scan another chunk; returns True once the board is ready"""
+        if not self.ready:
+            text = self._tail + bytes(data)
+            ends = [text.find(marker) + len(marker) for marker in (BANNER_TEXT, b'\n' + PROMPT)
+                    if marker in text]
+            if ends:
+                self.ready = True
+                self.rest = text[min(ends):]
+            self._tail = text[-len(BANNER_TEXT):]
+        return self.ready
+
+
+def _color(match):
+    r, g, b = match.groups()
+    return (ColorReading(int(r), int(g), int(b)),)
+
+
+def _ir(match):
+    ir1, ir2 = match.groups()
+    if ir2 is None:
+        return (IRReading('IR1', int(ir1)),)
+    return (IRReading('IR1', int(ir1)), IRReading('IR2', int(ir2)))
+
+
+def _ir2(match):
+    return (IRReading('IR2', int(match.group(1))),)
+
+
+def _distance(match):
+    cm = float(match.group(1))
+    return (DistanceReading(cm, not ULTRASONIC_MIN_CM <= cm <= ULTRASONIC_MAX_CM),)
+
+
+def _ack(match):
+    return (Reply(True, match.string),)
+
+
+def _error(match):
+    return (Reply(False, match.string),)
+
+
+# Message type, line pattern and record builder, keyed on the first word of
+# the line (after any "> " prompts and with the trailing ':' removed).
+# Patterns cover readColorSensor(), readIRSensors() (digital, one channel per
+# line, or the analog "IR1: ... | IR2: ..." single-line format) and
+# readUltrasonic(), plus the command replies of arduino_cli_control.ino.
+PARSERS = {
+    'R': ('color', re.compile(r'R:\s*(\d+)\s+G:\s*(\d+)\s+B:\s*(\d+)'), _color),
+    'IR1': ('ir', re.compile(r'IR1:\s*(\d+)(?:.*?IR2:\s*(\d+))?'), _ir),
+    'IR2': ('ir', re.compile(r'IR2:\s*(\d+)'), _ir2),
+    'Distance': ('ultrasonic', re.compile(r'Distance:\s*(-?\d+(?:\.\d+)?)\s*cm'), _distance),
+    'Motor': ('ack', re.compile(r'Motor [AB] set to \d+ (?:Forward|Backward)'), _ack),
+    'Both': ('ack', re.compile(r'Both motors set to \d+ (?:Forward|Backward)'), _ack),
+    'All': ('ack', re.compile(r'All (?:motors|subscriptions) stopped'), _ack),
+    'Servo': ('ack', re.compile(r'Servo [12] set to \d+ degrees'), _ack),
+    'Binary': ('ack', re.compile(r'Binary mode (?:ON|OFF)'), _ack),
+    'Subscribed': ('ack', re.compile(r'Subscribed (?:color|ir|ultra) at \d+ Hz'), _ack),
+    'Unsubscribed': ('ack', re.compile(r'Unsubscribed (?:color|ir|ultra)'), _ack),
+    'Error': ('error', re.compile(r'Error: .+'), _error),
+    'Unknown': ('error', re.compile(r'Unknown command'), _error),
+}
+
+
+class TextParser:
+    """Table-driven parser for the CLI sketch's text output
+
+    parse() returns a tuple of reading/reply records. Lines whose first word
+    is not in PARSERS (banners, help text) are ignored; lines that are but
+    do not match are counted in `failures` by message type.
+    """
+    def __init__(self, parsers=PARSERS):
+        self.parsers = parsers
+        self.counts = Counter()
+        self.failures = Counter()
+        self.last_type = None  # message type of the last line parsed, None if ignored
+
+    def parse(self, line):
+        line = line.strip().lstrip('> ')
+        key = line.partition(' ')[0].rstrip(':')
+        entry = self.parsers.get(key)
+        if entry is None:
+            self.last_type = None
+            return ()
+        msg_type, pattern, build = entry
+        self.last_type = msg_type
+        match = pattern.match(line)
+        if match is None:
+            self.failures[msg_type] += 1
+            return ()
+        try:
+            records = build(match)
+        except ValueError:
+            self.failures[msg_type] += 1
+            return ()
+        self.counts[msg_type] += 1
+        return records
@@ -0,0 +1,655 @@
+"""
+Transport backends for the Arduino CLI controller
+
+open_transport() turns a port spec into an open, pyserial-compatible port:
+    /dev/ttyACM0, COM3          real serial port
+    sim://?baud=9600&color_ms=100&boot_ms=0
+                                simulated board running arduino_cli_control.ino,
+                                served on a pty (boot_ms: bootloader delay
+                                before the banner, like a reset on open)
+    replay://run.tlm?speed=1    replay of a recorder log (or a raw serial capture)
+                                on a pty; speed=max streams as fast as possible
+
+Simulated and replayed devices sit behind a real pty, so the controller's
+serial code path (pyserial, termios, blocking reads) is exercised unchanged.
+SerialStream puts the same ports on an asyncio event loop (POSIX only).
+"""
+
+import asyncio
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+from urllib.parse import urlsplit, parse_qsl
+
+import serial
+
+from telemetry import (encode_packet, SENSOR_COLOR, SENSOR_IR, SENSOR_ULTRASONIC,
+                       ColorReading, IRReading, DistanceReading)
+
+SIM_SCHEME = "sim"
+REPLAY_SCHEME = "replay"
+
+BANNER = ("========================================\r\n"
+          "  Arduino Multi-Sensor Control System  \r\n"
+          "========================================\r\n")
+
+HELP_TEXT = (
+    "Available Commands:\r\n"
+    "------------------\r\n"
+    "  help                      - Show this help message\r\n"
+    "  color                     - Read TCS3200 color sensor\r\n"
+    "  motor <A/B> <speed> <dir> - Control motor (speed: 0-255, dir: F/B)\r\n"
+    "                              Example: motor A 200 F\r\n"
+    "  motors <speed> <dir>      - Control both motors\r\n"
+    "                              Example: motors 150 B\r\n"
+    "  stop                      - Stop all motors\r\n"
+    "  servo <1/2> <angle>       - Set servo position (angle: 0-180)\r\n"
+    "                              Example: servo 1 90\r\n"
+    "  ir                        - Read IR sensors\r\n"
+    "  ultra                     - Read ultrasonic distance\r\n"
+    "  status                    - Show all sensor readings\r\n"
+    "  binary <on/off>           - Binary sensor packets instead of text\r\n"
+    "  sub <color/ir/ultra> <hz> - Stream a sensor (hz: 0-100, 0 = off)\r\n"
+    "  unsub                     - Stop all streams\r\n"
+)
+
+STREAMS = ('color', 'ir', 'ultra')
+# Time a streamed color read blocks: three pulseIn calls, no settle delays
+STREAM_COLOR_MS = 3
+
+
+def is_virtual(spec):
+    """True for sim:// and replay:// port specs"""
+    return spec.startswith((SIM_SCHEME + "://", REPLAY_SCHEME + "://"))
+
+
+def open_transport(spec, baudrate=9600, timeout=None):
+    """Open a real, simulated or replayed port from a port spec"""
+    if not is_virtual(spec):
+        return serial.Serial(spec, baudrate, timeout=timeout)
+
+    url = urlsplit(spec)
+    options = dict(parse_qsl(url.query))
+    if url.scheme == SIM_SCHEME:
+        device = FakeArduino(
+            baudrate=_number(options.get("baud", baudrate)),
+            color_ms=_number(options.get("color_ms", 100)),
+            ultra_ms=_number(options.get("ultra_ms", 15)),
+            boot_ms=_number(options.get("boot_ms", 0)),
+            seed=int(options.get("seed", 1)),
+        )
+    else:
+        path = url.netloc + url.path
+        speed = options.get("speed", "1")
+        device = ReplayDevice(path, speed=0 if speed == "max" else float(speed),
+                              baudrate=_number(options.get("baud", 0)))
+    return PtyTransport(device, baudrate, timeout)
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class PtyTransport:
+    """pyserial port on the slave side of a pty whose master is driven by `device`"""
+    def __init__(self, device, baudrate=9600, timeout=None):
+        master, slave = os.openpty()
+        # Raw mode before the device writes anything, so CR/LF arrive untouched
+        tty.setraw(slave)
+        self.device = device
+        self.port = serial.Serial(os.ttyname(slave), baudrate, timeout=timeout)
+        os.close(slave)
+        device.start(master)
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    def close(self):
+        self.port.close()
+        self.device.stop()
+
+
+class SerialStream:
+    """Non-blocking wrapper that serves an open port from the event loop
+
+    The port's file descriptor is watched with loop.add_reader(); every read
+    is handed to `on_data(bytes)`, and `on_close(error)` is called once when
+    the port goes away. write() returns when the bytes would have left the
+    UART at `baudrate`, like CommandWriter's flush(), without blocking the loop.
+    """
+    READ_SIZE = 4096
+
+    def __init__(self, port, on_data, on_close=None, baudrate=9600):
+        self.port = port
+        self.on_data = on_data
+        self.on_close = on_close
+        self.baudrate = baudrate
+        self.fd = port.fileno()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.closed = False
+        self._wire_free_at = 0.0
+        self._loop = asyncio.get_running_loop()
+        os.set_blocking(self.fd, False)
+        self._loop.add_reader(self.fd, self._readable)
+
+    def _readable(self):
+        try:
+            data = os.read(self.fd, self.READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._lost(e)
+            return
+        if not data:
+            self._lost(None)
+            return
+        self.bytes_in += len(data)
+        self.on_data(data)
+
+    def _lost(self, error):
+        if self.closed:
+            return
+        self._loop.remove_reader(self.fd)
+        self.closed = True
+        if self.on_close:
+            self.on_close(error)
+
+    async def write(self, data):
+        if self.closed:
+            raise OSError("port closed")
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(self.fd, view)
+            except BlockingIOError:
+                await self._writable()
+                continue
+            view = view[written:]
+            self.bytes_out += written
+        if self.baudrate:
+            now = self._loop.time()
+            self._wire_free_at = max(now, self._wire_free_at) + len(data) * 10.0 / self.baudrate
+            await asyncio.sleep(self._wire_free_at - now)
+
+    async def _writable(self):
+        future = self._loop.create_future()
+        self._loop.add_writer(self.fd, future.set_result, None)
+        try:
+            await future
+        finally:
+            self._loop.remove_writer(self.fd)
+
+    def close(self):
+        """Stop watching the port and close it"""
+        if not self.closed:
+            self.closed = True
+            self._loop.remove_reader(self.fd)
+        self.port.close()
+
+
+class PtyDevice:
+    """Base class for devices served on a pty master
+
+    Handles the thread, command line assembly and output pacing at the
+    emulated baud rate (10 bits per byte; 0 means unlimited).
+    """
+    def __init__(self, baudrate=9600):
+        self.baudrate = baudrate
+        self.fd = None
+        self.running = False
+        self.thread = None
+        self._line = bytearray()
+        self.bytes_out = 0
+
+    def start(self, fd):
+        self.fd = fd
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def write(self, data):
+        """Send bytes to the host, taking as long as the emulated link would"""
+        if isinstance(data, str):
+            data = data.encode()
+        view = memoryview(data)
+        while view and self.running:
+            try:
+                written = os.write(self.fd, view)
+            except BlockingIOError:
+                time.sleep(0.001)
+                continue
+            except OSError:
+                self.running = False
+                return
+            view = view[written:]
+            self.bytes_out += written
+            if self.baudrate:
+                time.sleep(written * 10.0 / self.baudrate)
+
+    def println(self, text=""):
+        self.write(text + "\r\n")
+
+    def poll_timeout(self):
+        """Seconds to wait for input before calling tick()"""
+        return 0.05
+
+    def tick(self):
+        """Called between input polls"""
+
+    def on_start(self):
+        """Called once on the device thread before the loop"""
+
+    def handle_line(self, line):
+        """Called for each complete command line received"""
+
+    def _run(self):
+        self.on_start()
+        while self.running:
+            try:
+                ready, _, _ = select.select([self.fd], [], [], self.poll_timeout())
+                if ready:
+                    data = os.read(self.fd, 1024)
+                    if not data:
+                        break
+                    self._feed(data)
+            except (OSError, ValueError):
+                # Slave side closed
+                break
+            self.tick()
+        self.running = False
+
+    def _feed(self, data):
+        # Same line handling as serialEvent(): CR or LF ends a command,
+        # empty lines are skipped
+        for byte in data:
+            if byte in (0x0A, 0x0D):
+                if self._line:
+                    line = self._line.decode('ascii', errors='ignore')
+                    self._line.clear()
+                    self.handle_line(line)
+            else:
+                self._line.append(byte)
+
+
+def _to_int(text):
+    """Arduino String.toInt(): leading integer, 0 if there is none"""
+    text = text.strip()
+    digits = ""
+    for i, ch in enumerate(text):
+        if ch.isdigit() or (i == 0 and ch in "+-"):
+            digits += ch
+        else:
+            break
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+
+def format_float(value):
+    """Serial.print(float): two decimal places"""
+    return f"{value:.2f}"
+
+
+class SensorModel:
+    """Deterministic, time-varying sensor signals for the simulator"""
+    # Pulse widths roughly like the calibration sketch sees over course colors
+    COLORS = [(180, 45, 50), (70, 150, 75), (40, 60, 190), (30, 30, 30), (230, 230, 230)]
+
+    def __init__(self, seed=1):
+        self.rng = random.Random(seed)
+        self.start = time.monotonic()
+
+    def color(self):
+        t = time.monotonic() - self.start
+        base = self.COLORS[int(t / 3) % len(self.COLORS)]
+        return tuple(max(0, int(v + self.rng.gauss(0, 6))) for v in base)
+
+    def ir(self):
+        t = time.monotonic() - self.start
+        return int(math.sin(t * 1.3) > 0), int(math.sin(t * 1.3 + 1.0) > 0)
+
+    def distance(self):
+        t = time.monotonic() - self.start
+        # Occasional echo dropouts and multipath spikes, as readUltrasonic warns about
+        roll = self.rng.random()
+        if roll < 0.03:
+            return 0.0
+        if roll < 0.05:
+            return self.rng.uniform(400.0, 1200.0)
+        return max(2.0, 40.0 + 25.0 * math.sin(t / 2.0) + self.rng.gauss(0, 0.8))
+
+
+class FakeArduino(PtyDevice):
+    """Simulation of arduino_cli_control.ino (command set, output text and timing)
+
+    color_ms and ultra_ms are the time a color or ultrasonic read blocks the
+    sketch (two 50 ms settle delays plus pulseIn; echo time). boot_ms is the
+    silence between opening the port and setup() printing the banner.
+    """
+    def __init__(self, baudrate=9600, color_ms=100, ultra_ms=15, boot_ms=0, seed=1):
+        super().__init__(baudrate)
+        self.color_ms = color_ms
+        self.ultra_ms = ultra_ms
+        self.boot_ms = boot_ms
+        self.sensors = SensorModel(seed)
+        self.binary_mode = False
+        self.packet_seq = 0
+        self.motors = {'a': (0, 'f'), 'b': (0, 'f')}
+        self.servos = {1: 90, 2: 90}
+        self.commands = 0
+        # Stream name -> [period in seconds, next due time]
+        self.streams = {}
+
+    def on_start(self):
+        # Bootloader runs before setup()
+        time.sleep(self.boot_ms / 1000.0)
+        self.write(BANNER)
+        self.println()
+        self.write(HELP_TEXT)
+        self.println()
+        self.write("> ")
+
+    def handle_line(self, line):
+        self.commands += 1
+        self.process_command(line.strip().lower())
+        self.write("> ")
+
+    def process_command(self, cmd):
+        if cmd == "help":
+            self.write(HELP_TEXT)
+        elif cmd == "color":
+            self.read_color()
+        elif cmd.startswith("motor "):
+            self.control_motor(cmd)
+        elif cmd.startswith("motors "):
+            self.control_both_motors(cmd)
+        elif cmd == "stop":
+            self.motors = {'a': (0, 'f'), 'b': (0, 'f')}
+            self.println("All motors stopped")
+        elif cmd.startswith("servo "):
+            self.control_servo(cmd)
+        elif cmd == "ir":
+            self.read_ir()
+        elif cmd == "ultra":
+            self.read_ultrasonic()
+        elif cmd == "status":
+            self.show_all_status()
+        elif cmd.startswith("binary"):
+            self.set_binary_mode(cmd)
+        elif cmd.startswith("sub "):
+            self.subscribe(cmd)
+        elif cmd == "unsub":
+            self.streams = {}
+            self.println("All subscriptions stopped")
+        else:
+            self.println("Unknown command. Type 'help' for available commands.")
+
+    def subscribe(self, cmd):
+        first = cmd.find(' ')
+        second = cmd.find(' ', first + 1)
+        if second == -1:
+            self.println("Error: Format is 'sub <color/ir/ultra> <hz>'")
+            return
+        sensor = cmd[first + 1:second]
+        hz = _to_int(cmd[second + 1:])
+        if hz < 0 or hz > 100:
+            self.println("Error: Rate must be 0-100 Hz")
+            return
+        if sensor not in STREAMS:
+            self.println("Error: Sensor must be color, ir or ultra")
+            return
+        if hz > 0:
+            # The sketch uses an integer millisecond period
+            period = (1000 // hz) / 1000.0
+            self.streams[sensor] = [period, time.monotonic() + period]
+            self.println(f"Subscribed {sensor} at {hz} Hz")
+        else:
+            self.streams.pop(sensor, None)
+            self.println(f"Unsubscribed {sensor}")
+
+    def poll_timeout(self):
+        if not self.streams:
+            return 0.05
+        due = min(next_due for _, next_due in self.streams.values())
+        return max(0.0, min(0.05, due - time.monotonic()))
+
+    def tick(self):
+        # serviceStreams(): each due stream is read and sent without banners
+        now = time.monotonic()
+        for sensor, stream in list(self.streams.items()):
+            period, due = stream
+            if now < due:
+                continue
+            stream[1] = now + period
+            if sensor == 'color':
+                self.send_color(stream=True)
+            elif sensor == 'ir':
+                self.send_ir()
+            else:
+                self.send_distance()
+
+    def send_packet(self, sensor_id, a=0, b=0, c=0):
+        self.write(encode_packet(sensor_id, self.packet_seq, a, b, c))
+        self.packet_seq = (self.packet_seq + 1) & 0xFF
+
+    def set_binary_mode(self, cmd):
+        if cmd == "binary on":
+            self.binary_mode = True
+            self.println("Binary mode ON")
+        elif cmd == "binary off":
+            self.binary_mode = False
+            self.println("Binary mode OFF")
+        else:
+            self.println("Error: Format is 'binary <on/off>'")
+
+    def read_color(self):
+        if not self.binary_mode:
+            self.println("Reading Color Sensor...")
+        self.send_color()
+
+    def send_color(self, stream=False):
+        # Streams skip the settle delays; the three pulseIn calls remain
+        time.sleep(STREAM_COLOR_MS / 1000.0 if stream else self.color_ms / 1000.0)
+        r, g, b = self.sensors.color()
+        if self.binary_mode:
+            self.send_packet(SENSOR_COLOR, r, g, b)
+            return
+        self.println(f"  R: {r}  G: {g}  B: {b}")
+
+    def read_ir(self):
+        if not self.binary_mode:
+            self.println("IR Sensor Readings:")
+        self.send_ir()
+
+    def send_ir(self):
+        ir1, ir2 = self.sensors.ir()
+        if self.binary_mode:
+            self.send_packet(SENSOR_IR, ir1, ir2)
+            return
+        self.println(f"  IR1: {ir1}{' [DETECTED]' if ir1 == 0 else ' [CLEAR]'}")
+        self.println(f"  IR2: {ir2}{' [DETECTED]' if ir2 == 0 else ' [CLEAR]'}")
+
+    def read_ultrasonic(self):
+        self.send_distance()
+
+    def send_distance(self):
+        time.sleep(self.ultra_ms / 1000.0)
+        cm = self.sensors.distance()
+        out_of_range = cm > 400 or cm < 2
+        if self.binary_mode:
+            self.send_packet(SENSOR_ULTRASONIC, min(int(cm * 100), 65535), int(out_of_range))
+            return
+        self.println(f"Distance: {format_float(cm)} cm  ({format_float(cm / 2.54)} inches)")
+        if out_of_range:
+            self.println("  Warning: Out of range (2-400 cm)")
+
+    def show_all_status(self):
+        if self.binary_mode:
+            self.read_color()
+            self.read_ir()
+            self.read_ultrasonic()
+            return
+        self.println("========== SYSTEM STATUS ==========")
+        self.println()
+        self.println("COLOR SENSOR:")
+        self.read_color()
+        self.println()
+        self.println("IR SENSORS:")
+        self.read_ir()
+        self.println()
+        self.println("ULTRASONIC SENSOR:")
+        self.read_ultrasonic()
+        self.println()
+        self.println("===================================")
+
+    def control_motor(self, cmd):
+        first = cmd.find(' ')
+        second = cmd.find(' ', first + 1)
+        third = cmd.find(' ', second + 1) if second != -1 else -1
+        if second == -1 or third == -1:
+            self.println("Error: Format is 'motor <A/B> <speed> <dir>'")
+            return
+        motor = cmd[first + 1:first + 2]
+        speed = _to_int(cmd[second + 1:third])
+        direction = cmd[third + 1:third + 2]
+        if speed < 0 or speed > 255:
+            self.println("Error: Speed must be 0-255")
+            return
+        if motor not in ('a', 'b'):
+            self.println("Error: Motor must be A or B")
+            return
+        if direction not in ('f', 'b'):
+            self.println("Error: Direction must be F or B")
+            return
+        self.motors[motor] = (speed, direction)
+        self.println(f"Motor {motor.upper()} set to {speed} {'Forward' if direction == 'f' else 'Backward'}")
+
+    def control_both_motors(self, cmd):
+        first = cmd.find(' ')
+        second = cmd.find(' ', first + 1)
+        if second == -1:
+            self.println("Error: Format is 'motors <speed> <dir>'")
+            return
+        speed = _to_int(cmd[first + 1:second])
+        direction = cmd[second + 1:second + 2]
+        if speed < 0 or speed > 255:
+            self.println("Error: Speed must be 0-255")
+            return
+        if direction not in ('f', 'b'):
+            self.println("Error: Direction must be F or B")
+            return
+        self.motors = {'a': (speed, direction), 'b': (speed, direction)}
+        self.println(f"Both motors set to {speed} {'Forward' if direction == 'f' else 'Backward'}")
+
+    def control_servo(self, cmd):
+        first = cmd.find(' ')
+        second = cmd.find(' ', first + 1)
+        if second == -1:
+            self.println("Error: Format is 'servo <1/2> <angle>'")
+            return
+        servo = ord(cmd[first + 1]) - ord('0') if first + 1 < len(cmd) else -1
+        angle = _to_int(cmd[second + 1:])
+        if angle < 0 or angle > 180:
+            self.println("Error: Angle must be 0-180")
+            return
+        if servo not in (1, 2):
+            self.println("Error: Servo must be 1 or 2")
+            return
+        self.servos[servo] = angle
+        self.println(f"Servo {servo} set to {angle} degrees")
+
+
+def format_record(record):
+    """Render a reading the way the sketch prints it"""
+    if isinstance(record, ColorReading):
+        return f"  R: {record.r}  G: {record.g}  B: {record.b}\r\n"
+    if isinstance(record, IRReading):
+        return f"  {record.channel}: {record.value}{' [DETECTED]' if record.value == 0 else ' [CLEAR]'}\r\n"
+    if isinstance(record, DistanceReading):
+        text = f"Distance: {format_float(record.cm)} cm  ({format_float(record.cm / 2.54)} inches)\r\n"
+        if record.out_of_range:
+            text += "  Warning: Out of range (2-400 cm)\r\n"
+        return text
+    return ""
+
+
+class ReplayDevice(PtyDevice):
+    """Stream a recorded session back as if it came from the board
+
+    Recorder logs (recorder.py) are re-rendered as sketch output with their
+    original spacing scaled by 1/speed; any other file is treated as a raw
+    serial capture. speed=0 streams as fast as the pty accepts. Commands
+    written to the device are ignored.
+    """
+    CHUNK = 4096
+
+    def __init__(self, path, speed=1.0, baudrate=0):
+        super().__init__(baudrate)
+        self.path = path
+        self.speed = speed
+        self.finished = False
+        self._stream = None
+
+    def poll_timeout(self):
+        return 0.0 if not self.finished else 0.05
+
+    def on_start(self):
+        self.write(BANNER)
+        self._stream = self._chunks()
+
+    def tick(self):
+        if self.finished:
+            return
+        try:
+            delay, data = next(self._stream)
+        except StopIteration:
+            self.finished = True
+            return
+        if delay > 0 and self.speed:
+            time.sleep(delay / self.speed)
+        self.write(data)
+
+    def _chunks(self):
+        """Yield (seconds to wait before, bytes) pairs"""
+        from recorder import FILE_MAGIC, TelemetryLog
+
+        with open(self.path, 'rb') as fh:
+            is_log = fh.read(len(FILE_MAGIC)) == FILE_MAGIC
+
+        if not is_log:
+            with open(self.path, 'rb') as fh:
+                while True:
+                    data = fh.read(self.CHUNK)
+                    if not data:
+                        return
+                    # Raw captures carry no timing; pace them at 9600 baud for 1x
+                    yield len(data) * 10.0 / 9600, data
+            return
+
+        with TelemetryLog(self.path) as log:
+            previous = None
+            for t, record in log.read():
+                text = format_record(record)
+                if not text:
+                    continue
+                delay = 0.0 if previous is None else t - previous
+                previous = t
+                yield delay, text.encode()